@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import math
+import unittest
+
+from tracklib.core.Obs import Obs
+from tracklib.core.Coords import ENUCoords
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Track import Track
+import tracklib.algo.Analytics as Analytics
+
+
+class TestAnalyticsMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.track = Track()
+        for i in range(50):
+            x = 3*math.cos(i/5) + i
+            y = 2*math.sin(i/7)
+            self.track.addObs(Obs(ENUCoords(x, y, 0), GPSTime().addSec(2*i)))
+
+    def assertSameAF(self, L1, L2):
+        self.assertEqual(len(L1), len(L2))
+        for (v1, v2) in zip(L1, L2):
+            if math.isnan(v1):
+                self.assertTrue(math.isnan(v2))
+            else:
+                self.assertAlmostEqual(v1, v2, 9)
+
+    def test_batch_vs_per_point(self):
+        algos = [Analytics.ds, Analytics.abs_curv, Analytics.heading, 
+                 Analytics.speed, Analytics.acceleration, Analytics.anglegeom, 
+                 Analytics.orientation, Analytics.calculAngleOriente]
+        for algo in algos:
+            batch = algo.batch
+            L1 = self.track.addAnalyticalFeature(algo)
+            del algo.batch
+            L2 = self.track.addAnalyticalFeature(algo, algo.__name__ + "_ref")
+            algo.batch = batch
+            self.assertSameAF(L1, L2)
+
+    def test_stop_time_window(self):
+        track = Track()
+        for i in range(60):
+            x = 5*min(i, 20) + 5*max(i-40, 0) + 0.1*(i % 2)
+            track.addObs(Obs(ENUCoords(x, 0, 0), GPSTime().addSec(5*i)))
+        algo = Analytics.stop_point_with_time_window_criteria
+        OUTPUTS = []
+        for batch in [True, False]:
+            t = track.copy()
+            t.addAnalyticalFeature(Analytics.abs_curv)
+            t.createAnalyticalFeature(algo.__name__, -1)
+            if batch:
+                OUTPUTS.append(t.addAnalyticalFeature(algo))
+            else:
+                f = algo.batch
+                del algo.batch
+                OUTPUTS.append(t.addAnalyticalFeature(algo))
+                algo.batch = f
+        self.assertSameAF(OUTPUTS[0], OUTPUTS[1])
+        self.assertIn(Analytics.VAL_AF_TIME_WINDOW_STOP, OUTPUTS[0][20:40])
+        self.assertEqual(Analytics.VAL_AF_TIME_WINDOW_MOVE, OUTPUTS[0][5])
+
+    def test_columnar(self):
+        L1 = self.track.addAnalyticalFeature(Analytics.speed)
+        self.track.toColumnar()
+        L2 = self.track.addAnalyticalFeature(Analytics.speed, "speed2")
+        self.assertSameAF(L1, L2)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestAnalyticsMethods("test_batch_vs_per_point"))
+    suite.addTest(TestAnalyticsMethods("test_stop_time_window"))
+    suite.addTest(TestAnalyticsMethods("test_columnar"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import sys
+import math
+import random
+import unittest
+import numpy as np
+
+from tracklib.core.Obs import Obs
+from tracklib.core.Coords import ENUCoords
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Track import Track
+import tracklib.algo.Comparison as Comparison
+
+
+class TestComparisonMethods(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(123)
+        self.track1 = Track()
+        self.track2 = Track()
+        for i in range(300):
+            x = round(20*math.cos(i/15) + i/3, 1)
+            y = round(20*math.sin(i/10), 1)
+            self.track1.addObs(Obs(ENUCoords(x, y, 0), GPSTime().addSec(i)))
+            x = round(x + random.gauss(0, 1), 1)
+            y = round(y + random.gauss(0, 1), 1)
+            self.track2.addObs(Obs(ENUCoords(x, y, 0), GPSTime().addSec(i)))
+        self.track2.getObs(10).position.setX(float("nan"))
+        self.track2.getObs(250).position.translate(500, 0)
+
+    def test_difference_profile_nn(self):
+        profile = Comparison.differenceProfile(self.track1, self.track2, verbose=False)
+        for i in range(self.track1.size()):
+            val_min = sys.float_info.max
+            id_min = 0
+            for j in range(self.track2.size()):
+                d = self.track1[i].distance2DTo(self.track2[j])
+                if d < val_min:
+                    val_min = d
+                    id_min = j
+            self.assertEqual(val_min, profile["diff", i])
+            self.assertEqual(id_min, profile["pair", i])
+            ex = self.track1[i].position.getX() - self.track2[id_min].position.getX()
+            self.assertEqual(ex, profile["ex", i])
+        self.assertIsInstance(profile["pair", 0], int)
+
+    def test_difference_profile_dtw(self):
+        track1 = self.track1.extract(0, 29)
+        track2 = self.track2.extract(20, 59)
+        n = track1.size()
+        m = track2.size()
+        for ends in [False, True]:
+            # Reference: exhaustive search on horizontal runs
+            D = np.array([[track1[i].distance2DTo(track2[j])**2 for j in range(m)] for i in range(n)])
+            T = np.cumsum(D[0]) if ends else D[0].copy()
+            M = np.zeros((n, m), dtype=int)
+            for i in range(1, n):
+                T_prev = T.copy()
+                for j in range(m):
+                    V = [T_prev[k] + np.sum(D[i,k:j+1]) for k in range(j+1)]
+                    M[i,j] = np.argmin(V)
+                    T[j] = V[M[i,j]]
+            S = [m-1 if ends else int(np.argmin(T))]
+            for i in range(n-1, 0, -1):
+                S.insert(0, int(M[i,S[0]]))
+            profile = Comparison.differenceProfile(track1, track2, "DTW", ends, p=2, verbose=False)
+            self.assertEqual(S, profile["pair"])
+            profile = Comparison.differenceProfile(track1, track2, "DTW", ends, p=2, verbose=False, window=m)
+            self.assertEqual(S, profile["pair"])
+        profile = Comparison.differenceProfile(track1, track2, "DTW", True, verbose=False, window=3, slope=2)
+        for i in range(n):
+            self.assertLessEqual(abs(profile["pair", i] - i*(m-1)/(n-1)), 3)
+        self.assertEqual(m-1, profile["pair", n-1])
+        profile = Comparison.differenceProfile(track1, track2, "DTW", True, verbose=False, cutoff=1)
+        self.assertIsNone(profile)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestComparisonMethods("test_difference_profile_nn"))
+    suite.addTest(TestComparisonMethods("test_difference_profile_dtw"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
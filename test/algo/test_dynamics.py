@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import math
+import random
+import itertools
+import functools
+import unittest
+import numpy as np
+
+from tracklib.core.Obs import Obs
+from tracklib.core.Coords import ENUCoords
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Track import Track
+from tracklib.core.TrackCollection import TrackCollection
+import tracklib.algo.Dynamics as Dynamics
+import tracklib.algo.Filtering as Filtering
+
+
+class Scaling:
+    def __init__(self, a):
+        self.a = a
+    def apply(self, x):
+        return self.a*x
+
+
+class TestDynamicsMethods(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(7)
+        self.track = Track()
+        for i in range(8):
+            x = 2*i + random.gauss(0, 2)
+            y = random.gauss(0, 2)
+            self.track.addObs(Obs(ENUCoords(x, y, 0), GPSTime().addSec(i)))
+
+    def test_hmm_viterbi(self):
+        S = lambda t, k: list(range(k % 3 + 2))
+        Q = lambda a, b, k, t: [0.5, 0.25, 0.125][(a+2*b+k) % 3]
+        P = lambda s, y, k, t: math.exp(-abs(s-y/4))
+        Dynamics.HMM(S, Q, P).estimate(self.track, "x", verbose=0)
+
+        # Reference: exhaustive search of optimal sequence
+        best = None
+        n = self.track.size()
+        for seq in itertools.product(*[S(self.track, k) for k in range(n)]):
+            cost = -math.log(P(seq[0], self.track["x", 0], 0, self.track) + 1e-300)
+            for k in range(1, n):
+                cost -= math.log(Q(seq[k-1], seq[k], k-1, self.track) + 1e-300)
+                cost -= math.log(P(seq[k], self.track["x", k], k, self.track) + 1e-300)
+            if (best is None) or (cost < best[0] - 1e-9):
+                best = (cost, list(seq))
+        self.assertEqual(best[1], self.track["hmm_inference"])
+        self.assertAlmostEqual(best[0], self.track["hmm_cost", n-1], 9)
+
+        # Vectorized models
+        model = Dynamics.HMM(S, Q, P)
+        model.setTransitionMatrix(lambda S1, S2, k, t: np.array([[Q(a, b, k, t) for b in S2] for a in S1]))
+        model.setObservationVector(lambda S, y, k, t: np.exp(-np.abs(np.array(S)-y/4)))
+        track = self.track.copy()
+        model.estimate(track, "x", verbose=0)
+        self.assertEqual(best[1], track["hmm_inference"])
+
+    def test_markov_regularization(self):
+        speed = lambda v, k, t: math.exp(-(v-2)**2/2)
+        track = self.track.copy()
+        Filtering.MarkovRegularization(track, 2, speed, 1)
+        for k in range(track.size()):
+            self.assertLessEqual(track[k].position.distance2DTo(self.track[k].position), 4*math.sqrt(2)+1e-9)
+            self.assertEqual(track[k].position, track["hmm_inference", k])
+        V = [track[k].position.distance2DTo(track[k+1].position) for k in range(track.size()-1)]
+        V0 = [self.track[k].position.distance2DTo(self.track[k+1].position) for k in range(track.size()-1)]
+        self.assertLess(np.std(V), np.std(V0))
+
+    def test_kalman_smoother(self):
+        q = 4.0; r = 9.0; p0 = 25.0
+        n = self.track.size()
+        kf = Dynamics.Kalman(spreading=1)
+        kf.setTransition(lambda x: x, np.array([[q]]))
+        kf.setObservation(lambda x: x, np.array([[r]]))
+        kf.setInitState(np.array([[self.track["x", 0]]]), np.array([[p0]]))
+
+        # Reference: least squares on all epochs (and initial state)
+        N = np.zeros((n+1, n+1)); B = np.zeros(n+1)
+        N[0,0] = 1/p0; B[0] = self.track["x", 0]/p0
+        for k in range(n):
+            N[k:k+2,k:k+2] += np.array([[1, -1], [-1, 1]])/q
+            N[k+1,k+1] += 1/r; B[k+1] += self.track["x", k]/r
+        X = np.linalg.solve(N, B)[1:]
+        STD = np.sqrt(np.diag(np.linalg.inv(N)))[1:]
+
+        track = self.track.copy()
+        (XS, PS) = kf.estimate(track, ["x"], verbose=False, smooth=True, store=["kf_0", "kf_0_std"])
+        self.assertEqual((n, 1), XS.shape)
+        self.assertEqual((n, 1, 1), PS.shape)
+        for k in range(n):
+            self.assertAlmostEqual(X[k], track["kf_0", k], 9)
+            self.assertAlmostEqual(STD[k], track["kf_0_std", k], 9)
+        self.assertFalse(track.hasAnalyticalFeature("kf_P"))
+
+        # Filter only: last state is the same
+        (XF, PF) = kf.estimate(self.track.copy(), ["x"], verbose=False, store=[])
+        self.assertAlmostEqual(XF[-1,0], XS[-1,0], 9)
+
+        collection = TrackCollection([self.track.copy(), self.track.copy()])
+        OUTPUTS = kf.estimateOnCollection(collection, ["x"], verbose=False, smooth=True, store=["kf_0"], workers=2)
+        for (track, (XC, PC)) in zip(collection, OUTPUTS):
+            self.assertTrue(np.allclose(XS, XC))
+            self.assertEqual(list(XS[:,0]), track["kf_0"])
+
+        # Any callable (bound method, partial) is a model function
+        kf.setTransition(Scaling(2.0).apply, np.array([[q]]))
+        kf.setObservation(functools.partial(lambda a, x: a*x, 0.5), np.array([[r]]))
+        (XM, PM) = kf.estimate(self.track.copy(), ["x"], verbose=False, smooth=True, store=[])
+        kf.setTransition(lambda x: 2*x, np.array([[q]]))
+        kf.setObservation(lambda x: x/2, np.array([[r]]))
+        (XR, PR) = kf.estimate(self.track.copy(), ["x"], verbose=False, smooth=True, store=[])
+        self.assertTrue(np.allclose(XR, XM, rtol=1e-12, atol=1e-12))
+        self.assertTrue(np.allclose(PR, PM, rtol=1e-12, atol=1e-12))
+
+        # Linear (matrix) models
+        kf.setTransition(np.eye(1))
+        kf.setObservation(np.eye(1))
+        (XL, PL) = kf.estimate(self.track.copy(), ["x"], verbose=False, smooth=True, store=[])
+        for k in range(n):
+            self.assertAlmostEqual(X[k], XL[k,0], 9)
+            self.assertAlmostEqual(STD[k]**2, PL[k,0,0], 9)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestDynamicsMethods("test_hmm_viterbi"))
+    suite.addTest(TestDynamicsMethods("test_markov_regularization"))
+    suite.addTest(TestDynamicsMethods("test_kalman_smoother"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import random
 import unittest
 
 import matplotlib.pyplot as plt
@@ -101,11 +102,49 @@ class TestAlgoGeometricsMethods(unittest.TestCase):
         
         segment1 = [4, 1, 4, 2]
         self.assertFalse(geom.isSegmentIntersects(segment1, segment2))
+
+    def testSegmentsIntersections(self):
+        random.seed(42)
+        S1 = [[random.randint(0, 20) for k in range(4)] for i in range(40)]
+        S2 = [[random.randint(0, 20) for k in range(4)] for j in range(30)]
+        S1[0] = [0, 0, 500, 400]
+        I, J = geom.segmentsIntersections(S1, S2)
+        PAIRS = []
+        for i in range(len(S1)):
+            for j in range(len(S2)):
+                if max(S1[i][0], S1[i][2]) < min(S2[j][0], S2[j][2]):
+                    continue
+                if max(S2[j][0], S2[j][2]) < min(S1[i][0], S1[i][2]):
+                    continue
+                if max(S1[i][1], S1[i][3]) < min(S2[j][1], S2[j][3]):
+                    continue
+                if max(S2[j][1], S2[j][3]) < min(S1[i][1], S1[i][3]):
+                    continue
+                if geom.isSegmentIntersects(S1[i], S2[j]):
+                    PAIRS.append((i, j))
+        self.assertEqual(PAIRS, list(zip(I.tolist(), J.tolist())))
+
+    def testTrackIntersection(self):
+        track = Track.Track()
+        for i in range(5):
+            track.addObs(Obs.Obs(Coords.ENUCoords(75*i-50, 300, 0), GPSTime.GPSTime().addSec(i)))
+        self.assertFalse(geom.intersects(self.trace1, track))
+        for i in range(5):
+            track.getObs(i).position.setY(50)
+        self.assertTrue(geom.intersects(self.trace1, track))
+        I = geom.intersection(self.trace1, track)
+        self.assertEqual(2, I.size())
+        self.assertAlmostEqual(150, I[0].position.getX(), 9)
+        self.assertAlmostEqual(50, I[1].position.getX(), 9)
+        self.assertEqual([0, 1], I["id1"])
+        self.assertEqual([2, 1], I["id2"])
         
         
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     suite.addTest(TestAlgoGeometricsMethods("testMinCircle"))
     suite.addTest(TestAlgoGeometricsMethods("testIntersectionCelluleSegment"))
+    suite.addTest(TestAlgoGeometricsMethods("testSegmentsIntersections"))
+    suite.addTest(TestAlgoGeometricsMethods("testTrackIntersection"))
     runner = unittest.TextTestRunner()
     runner.run(suite)
\ No newline at end of file
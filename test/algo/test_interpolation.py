@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import math
+import random
+import unittest
+import numpy as np
+
+from tracklib.core.Obs import Obs
+from tracklib.core.Coords import ENUCoords
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Track import Track
+from tracklib.core.Kernel import GaussianKernel
+import tracklib.core.Utils as Utils
+import tracklib.algo.Interpolation as Interpolation
+
+
+class TestInterpolationMethods(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(3)
+        self.track = Track()
+        for i in range(200):
+            x = 10*math.sin(i/20) + random.gauss(0, 1)
+            y = i/5 + random.gauss(0, 1)
+            self.track.addObs(Obs(ENUCoords(x, y, random.gauss(0, 1)), GPSTime().addSec(2*i)))
+
+    def test_gaussian_process(self):
+        kernel = GaussianKernel(15)
+        gp = Interpolation.gaussian_process(self.track, 3.0, kernel, 3, 1.0, cp_var=True)
+
+        # Reference: explicit posterior distribution
+        TO = self.track.getT()
+        TU = gp.getT()
+        K = Utils.makeCovarianceMatrixFromKernel(kernel, TO, TO, 3) + np.identity(len(TO))
+        KS = Utils.makeCovarianceMatrixFromKernel(kernel, TO, TU, 3)
+        KSS = Utils.makeCovarianceMatrixFromKernel(kernel, TU, TU, 3)
+        X = np.array(self.track.getX())
+        MUX = KS.T @ np.linalg.inv(K) @ (X - np.mean(X)) + np.mean(X)
+        SIGMA = np.sqrt(np.diag(KSS - KS.T @ np.linalg.inv(K) @ KS))*3
+        self.assertTrue(np.allclose(MUX, gp.getX()))
+        self.assertTrue(np.allclose(SIGMA, gp["@sigma_gp"]))
+
+        # Local GP on blocks of 60 observations
+        local = Interpolation.gaussian_process(self.track, 3.0, kernel, 3, 1.0, cp_var=True, window=60, overlap=40)
+        self.assertEqual(gp.getT(), local.getT())
+        self.assertLess(np.max(np.abs(np.array(gp.getX()) - local.getX())), 1e-3)
+        self.assertLess(np.max(np.abs(np.array(gp.getY()) - local.getY())), 1e-3)
+        self.assertLess(np.max(np.abs(np.array(gp["@sigma_gp"]) - local["@sigma_gp"])), 1e-6)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestInterpolationMethods("test_gaussian_process"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import unittest
+import numpy as np
+
+from tracklib.core.Obs import Obs
+from tracklib.core.Coords import ENUCoords
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Track import Track
+from tracklib.core.Kernel import DiracKernel, GaussianKernel
+import tracklib.algo.Stochastics as Stochastics
+
+
+class TestStochasticsMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.track = Track()
+        for i in range(100):
+            self.track.addObs(Obs(ENUCoords(2*i, 0, 0), GPSTime().addSec(i)))
+
+    def test_noise_circulant(self):
+        kernel = GaussianKernel(10)
+        S = self.track.cumulativeLength()
+        REF = kernel.evaluate(np.abs(S[:,None]-S[None,:]), False)
+        REF *= 4/REF[0,0]
+        for method in [Stochastics.NOISE_CHOLESKY, Stochastics.NOISE_CIRCULANT]:
+            Y = Stochastics.noiseSamples(S, 2, kernel, 3000, method=method, seed=1)
+            self.assertEqual((3000, 100, 3), Y.shape)
+            C = np.einsum('rni,rmi->nm', Y, Y)/(3*3000)
+            self.assertLess(np.max(np.abs(C-REF)), 0.25)
+
+        # Irregular abscissa: simulation on a grid and interpolation
+        T = np.sort(np.random.default_rng(0).uniform(0, 200, 100))
+        REF = kernel.evaluate(np.abs(T[:,None]-T[None,:]), False)
+        REF *= 4/REF[0,0]
+        Y = Stochastics.noiseSamples(T, 2, kernel, 3000, method=Stochastics.NOISE_CIRCULANT, seed=1, step=0.5)
+        C = np.einsum('rni,rmi->nm', Y, Y)/(3*3000)
+        self.assertLess(np.max(np.abs(C-REF)), 0.25)
+
+    def test_noise_seed(self):
+        kernels = [GaussianKernel(10), DiracKernel()]
+        S = self.track.cumulativeLength()
+        Y1 = Stochastics.noiseSamples(S, [2, 1], kernels, 4, method=Stochastics.NOISE_CIRCULANT, seed=7)
+        Y2 = Stochastics.noiseSamples(S, [2, 1], kernels, 6, method=Stochastics.NOISE_CIRCULANT, seed=7)
+        self.assertTrue(np.array_equal(Y1, Y2[0:4]))
+
+        collection = Stochastics.NoiseProcess([2], [GaussianKernel(10)]).noise(self.track, 3, seed=[5, 6, 7])
+        self.assertEqual(3, collection.size())
+        noised = Stochastics.noise(self.track, 2, GaussianKernel(10), seed=[7])
+        self.assertEqual(noised.getX(), collection.getTrack(2).getX())
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestStochasticsMethods("test_noise_circulant"))
+    suite.addTest(TestStochasticsMethods("test_noise_seed"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -32,10 +32,28 @@ class TestGPSTime(unittest.TestCase):
         self.assertEqual(57, d.min)
         self.assertEqual(18, d.sec)
         
+    def test_unix_time(self):
+        
+        d = GPSTime.readUnixTime(951782400.0)
+        self.assertEqual('29/02/2000 00:00:00', str(d))
+        d = GPSTime.readUnixTime(978220800.0)
+        self.assertEqual('31/12/2000 00:00:00', str(d))
+        d = GPSTime.readUnixTime(1550941038.123)
+        self.assertEqual(123, d.ms)
+        self.assertEqual(1550941038.123, d.toAbsTime())
+        
+        T = [0.0, 951782399.5, 978307200.0, 1550941038.123]
+        times = GPSTime.readUnixTimes(T)
+        for i in range(len(T)):
+            self.assertEqual(str(GPSTime.readUnixTime(T[i])), str(times[i]))
+            self.assertEqual(GPSTime.readUnixTime(T[i]).ms, times[i].ms)
+        self.assertEqual(T, GPSTime.toAbsTimes(times).tolist())
+        
         
 if __name__ == '__main__':
     #unittest.main()
     suite = unittest.TestSuite()
     suite.addTest(TestGPSTime("test_format_time"))
+    suite.addTest(TestGPSTime("test_unix_time"))
     runner = unittest.TextTestRunner()
     runner.run(suite)
\ No newline at end of file
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import math
+import unittest
+
+from tracklib.core.Obs import Obs
+from tracklib.core.Coords import ENUCoords
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Track import Track
+from tracklib.core.ObsTable import ObsTable
+
+
+class TestColumnarTrack(unittest.TestCase):
+
+    def setUp(self):
+        GPSTime.setReadFormat("4Y-2M-2D 2h:2m:2s")
+        self.track = Track()
+        for i in range(10):
+            t = GPSTime.readTimestamp("2018-01-01 10:00:00").addSec(i)
+            self.track.addObs(Obs(ENUCoords(i, 2*i, 0), t))
+        self.track.createAnalyticalFeature("a", [float(i) for i in range(10)])
+
+    def test_conversion(self):
+        track = self.track.copy()
+        track.toColumnar()
+        self.assertTrue(track.isColumnar())
+        self.assertIsInstance(track.getObsList(), ObsTable)
+        self.assertEqual("ENU", track.getSRID())
+        self.assertEqual(self.track.getX(), track.getX())
+        self.assertEqual(self.track.getT(), track.getT())
+        self.assertEqual(self.track["a"], track["a"])
+        self.assertEqual(str(self.track[3].timestamp), str(track[3].timestamp))
+        track.toObsList()
+        self.assertFalse(track.isColumnar())
+        self.assertEqual(self.track["a"], track["a"])
+
+    def test_views(self):
+        track = self.track.copy()
+        track.toColumnar()
+        track.getObs(2).position.setX(5.0)
+        self.assertEqual(5.0, track.getX(2))
+        track.setObsAnalyticalFeature("a", 4, -1.0)
+        self.assertEqual(-1.0, track["a", 4])
+        track.createAnalyticalFeature("name", "p")
+        track.setObsAnalyticalFeature("name", 1, "q")
+        self.assertEqual(["p", "q", "p"], track["name"][0:3])
+        track.removeAnalyticalFeature("a")
+        self.assertEqual(["name"], track.getListAnalyticalFeatures())
+        self.assertEqual("q", track.getObs(1).features[0])
+
+    def test_edition(self):
+        track = self.track.copy()
+        track.toColumnar()
+        obs = track.popObs(0)
+        self.assertEqual(9, track.size())
+        self.assertEqual(0, obs.position.getX())
+        track.insertObs(obs, 0)
+        self.assertEqual(self.track.getX(), track.getX())
+        track.addObs(Obs(ENUCoords(20, 0, 0), GPSTime.readTimestamp("2018-01-01 09:00:00")))
+        track.sort()
+        self.assertEqual(20, track.getX(0))
+        self.assertEqual(7, (track > 4).size())
+        self.assertEqual(22, (track + track).size())
+        self.assertEqual(6, track.extract(2, 7).size())
+        self.assertTrue(track.extract(2, 7).isColumnar())
+
+    def test_concatenation(self):
+        track1 = self.track.copy()
+        track1.toColumnar()
+        track1.getObsList().setExtra("hdop", 2, 1.5)
+        track2 = self.track.copy()
+        track2.createAnalyticalFeature("b", 7.0)
+        track2.toColumnar()
+        track = track1 + track2
+        self.assertEqual(20, track.size())
+        self.assertEqual(["a", "b"], track.getListAnalyticalFeatures())
+        self.assertEqual(self.track["a"] + self.track["a"], track["a"])
+        self.assertTrue(all(math.isnan(v) for v in track["b"][0:10]))
+        self.assertEqual([7.0]*10, track["b"][10:20])
+        self.assertEqual(1.5, track[2].hdop)
+        self.assertEqual(0, track[12].hdop)
+        
+        # Same result as list mode when AF are identical
+        track = track1 + self.track
+        self.assertEqual(["a"], track.getListAnalyticalFeatures())
+        self.assertEqual((self.track + self.track)["a"], track["a"])
+
+    def test_cumulative_length(self):
+        for columnar in [False, True]:
+            track = self.track.copy()
+            if columnar:
+                track.toColumnar()
+            S = track.cumulativeLength()
+            self.assertAlmostEqual(9*5**0.5, S[-1], 9)
+            self.assertAlmostEqual(9*5**0.5, track.length(), 9)
+            self.assertAlmostEqual(2*5**0.5, track.getCurvAbsBetweenTwoPoints(3, 5), 9)
+            track.getObs(9).position.setY(18+1)
+            self.assertAlmostEqual(8*5**0.5 + 10**0.5, track.length(), 9)
+            track.getObs(9).position = ENUCoords(9, 18, 0)
+            self.assertAlmostEqual(9*5**0.5, track.length(), 9)
+            track.setObs(0, Obs(ENUCoords(-1, -2, 0), track.getObs(0).timestamp))
+            self.assertAlmostEqual(10*5**0.5, track.length(), 9)
+            track.scale(2)
+            self.assertAlmostEqual(20*5**0.5, track.length(), 9)
+            track.translate(3, 4)
+            self.assertAlmostEqual(20*5**0.5, track.length(), 9)
+            track.getObs(9).position.translate(0, 10)
+            self.assertAlmostEqual(18*5**0.5 + 200**0.5, track.length(), 9)
+            track.rotate(0.7)
+            self.assertAlmostEqual(18*5**0.5 + 200**0.5, track.length(), 9)
+            self.assertAlmostEqual(18*5**0.5 + 200**0.5, track.cumulativeLength()[-1], 9)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestColumnarTrack("test_conversion"))
+    suite.addTest(TestColumnarTrack("test_views"))
+    suite.addTest(TestColumnarTrack("test_edition"))
+    suite.addTest(TestColumnarTrack("test_concatenation"))
+    suite.addTest(TestColumnarTrack("test_cumulative_length"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import unittest
+import numpy as np
+
+import tracklib.core.Coords as Coords
+from tracklib.core.Obs import Obs
+from tracklib.core.Coords import GeoCoords, ENUCoords
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Track import Track
+from tracklib.core.TrackCollection import TrackCollection
+
+
+class TestCoords(unittest.TestCase):
+
+    def setUp(self):
+        self.base = GeoCoords(2.4218, 48.8370, 51.0)
+        self.points = [GeoCoords(2.42+0.001*i, 48.83+0.0005*i, 40.0+i) for i in range(20)]
+        self.track = Track()
+        for i in range(len(self.points)):
+            self.track.addObs(Obs(self.points[i].copy(), GPSTime().addSec(i)))
+
+    def test_array_transforms(self):
+        geo = np.array([[p.lon, p.lat, p.hgt] for p in self.points])
+        enu = Coords.geoToENU(geo, self.base)
+        ecef = Coords.geoToECEF(geo)
+        for i in range(len(self.points)):
+            p = self.points[i].toENUCoords(self.base)
+            self.assertAlmostEqual(p.E, enu[i,0], 6)
+            self.assertAlmostEqual(p.N, enu[i,1], 6)
+            self.assertAlmostEqual(p.U, enu[i,2], 6)
+            p = self.points[i].toECEFCoords()
+            self.assertAlmostEqual(p.X, ecef[i,0], 6)
+        self.assertTrue(np.allclose(geo, Coords.enuToGeo(enu, self.base), atol=1e-8))
+        self.assertTrue(np.allclose(geo, Coords.ecefToGeo(ecef), atol=1e-8))
+        self.assertTrue(np.allclose(Coords.geoToENU(geo, self.points[3]),
+                        Coords.enuToENU(enu, self.base, self.points[3]), atol=1e-6))
+        d = self.points[2].toENUCoords(self.points[5]).norm2D()
+        self.assertAlmostEqual(d, self.points[2].distance2DTo(self.points[5]), 6)
+
+    def test_track_transforms(self):
+        for columnar in [False, True]:
+            track = self.track.copy()
+            if columnar:
+                track.toColumnar()
+            track.toENUCoords(self.base)
+            self.assertEqual("ENU", track.getSRID())
+            self.assertIsInstance(track[4].position, ENUCoords)
+            p = self.points[4].toENUCoords(self.base)
+            self.assertAlmostEqual(p.E, track.getX(4), 6)
+            self.assertAlmostEqual(p.N, track.getY(4), 6)
+            track.toGeoCoords()
+            self.assertEqual("Geo", track.getSRID())
+            self.assertAlmostEqual(self.points[4].lon, track.getX(4), 8)
+            self.assertAlmostEqual(self.points[4].lat, track.getY(4), 8)
+
+        collection = TrackCollection([self.track.copy(), self.track.copy()])
+        collection.toENUCoords(self.base)
+        self.assertEqual("ENU", collection[1].getSRID())
+        self.assertAlmostEqual(p.E, collection[1].getX(4), 6)
+        self.assertEqual(str(self.base), str(collection[1].base))
+        collection.toECEFCoords(self.base)
+        self.assertEqual("ECEF", collection[0].getSRID())
+        collection.toGeoCoords()
+        self.assertAlmostEqual(self.points[4].lat, collection[0].getY(4), 8)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestCoords("test_array_transforms"))
+    suite.addTest(TestCoords("test_track_transforms"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
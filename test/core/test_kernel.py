@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import math
+from unittest import TestCase, TestSuite, TextTestRunner
+import numpy as np
+
+import tracklib.core.Utils as Utils
+from tracklib.core.Kernel import Kernel, DiracKernel, UniformKernel, TriangularKernel
+from tracklib.core.Kernel import GaussianKernel, ExponentialKernel, EpanechnikovKernel, SincKernel
+
+
+class MathKernel(Kernel):
+    def __init__(self, sigma):
+        self.setFunction(lambda x : math.exp(-abs(x)/sigma))
+        self.support = 3*sigma
+
+
+class TestKernel(TestCase):
+
+    def setUp(self):
+        self.KERNELS = [DiracKernel(), UniformKernel(5), TriangularKernel(5), GaussianKernel(5),
+                        ExponentialKernel(5), EpanechnikovKernel(5), SincKernel(5), MathKernel(5)]
+
+    def test_evaluate(self):
+        X = np.linspace(-20, 20, 41).reshape(1, 41)
+        for kernel in self.KERNELS:
+            Y = kernel.evaluate(X)
+            self.assertEqual((1, 41), Y.shape)
+            for i in range(X.shape[1]):
+                self.assertIsInstance(kernel.evaluate(X[0,i]), float)
+                self.assertAlmostEqual(Y[0,i], kernel.evaluate(X[0,i]), 12)
+                if abs(X[0,i]) > kernel.support:
+                    self.assertEqual(0, Y[0,i])
+                else:
+                    self.assertAlmostEqual(Y[0,i], kernel.getFunction()(X[0,i]), 12)
+
+    def test_covariance_matrix(self):
+        T1 = np.arange(0, 30, 0.5)
+        T2 = np.arange(7, 21, 0.5)
+        T3 = np.sort(np.random.uniform(0, 30, 40))
+        for kernel in self.KERNELS:
+            for (A, B) in [(T1, T1), (T1, T2), (T2, T1), (T1, T3), (T1[::-1], T1[::-1])]:
+                K1 = Utils.makeCovarianceMatrixFromKernel(kernel, A, B, 2.0)
+                K2 = Utils.makeCovarianceMatrixFromKernel(kernel, A, B, 2.0, toeplitz=False)
+                self.assertEqual((len(A), len(B)), K1.shape)
+                self.assertTrue(np.allclose(K1, K2, rtol=1e-9, atol=1e-12))
+                for (i, j) in [(0, 0), (3, 5), (len(A)-1, len(B)-1)]:
+                    self.assertAlmostEqual(K1[i,j], 4*kernel.getFunction()(abs(A[i]-B[j])), 9)
+
+
+if __name__ == '__main__':
+    suite = TestSuite()
+    suite.addTest(TestKernel("test_evaluate"))
+    suite.addTest(TestKernel("test_covariance_matrix"))
+    runner = TextTestRunner()
+    runner.run(suite)
@@ -1,11 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import os.path
+import pickle
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase, TestSuite, TextTestRunner
 
 from tracklib.core.Track import Track
-from tracklib.core.Network import Node, Edge
+from tracklib.core.Network import Network, Node, Edge
 from tracklib.io.NetworkReader import NetworkReader
+from tracklib.io.NetworkWriter import NetworkWriter
 from tracklib.io.IgnReader import IgnReader
 
 import matplotlib.pyplot as plt
@@ -132,6 +136,181 @@ class TestDijkstra(TestCase):
         self.assertEqual(trace.size(), 3)
         
         
+    def test_compile(self):
+        
+        chemin = os.path.join(self.resource_path, 'data/network/network_ecrin_extrait.csv')
+        network = NetworkReader.readFromFile(chemin, 'TEST2', False)
+        graph = network.compile()
+        
+        self.assertEqual(len(network.NODES), graph.getNumberOfNodes())
+        self.assertEqual(len(network.EDGES), graph.getNumberOfEdges())
+        for id in network.getNodesId():
+            i = graph.getNodeIndex(id)
+            self.assertEqual(id, graph.getNodeId(i))
+            arcs = range(graph.FWD_PTR[i], graph.FWD_PTR[i+1])
+            self.assertEqual(network.getNextEdges(id), [graph.getEdgeId(graph.FWD_EDGE[k]) for k in arcs])
+            self.assertEqual(network.getNextNodes(id), [graph.getNodeId(graph.FWD_NODE[k]) for k in arcs])
+            for k in arcs:
+                self.assertEqual(network.getEdge(graph.getEdgeId(graph.FWD_EDGE[k])).weight, graph.FWD_WGT[k])
+            arcs = range(graph.BWD_PTR[i], graph.BWD_PTR[i+1])
+            self.assertEqual(network.getPrevEdges(id), [graph.getEdgeId(graph.BWD_EDGE[k]) for k in arcs])
+        self.assertIs(graph, network.getCompiledNetwork())
+        
+    def test_concurrent_routing(self):
+        
+        chemin = os.path.join(self.resource_path, 'data/network/network_ecrin_extrait.csv')
+        network = NetworkReader.readFromFile(chemin, 'TEST2', False)
+        ids = network.getNodesId()
+        pairs = [(ids[i], ids[(37*i) % len(ids)]) for i in range(0, len(ids), 25)]
+        
+        serial = [network.shortest_distance(s, t) for (s, t) in pairs]
+        with ThreadPoolExecutor(4) as pool:
+            parallel = list(pool.map(lambda p: network.shortest_distance(p[0], p[1]), pairs))
+        self.assertEqual(serial, parallel)
+        self.assertFalse(hasattr(network.getNode(ids[0]), "poids"))
+        
+        tree1 = network.run_routing_forward(pairs[1][0])
+        tree2 = network.run_routing_forward(pairs[2][0], cut=100)
+        trace = network.run_routing_backward(pairs[1][1], tree1)
+        self.assertAlmostEqual(serial[1], trace.length(), 6)
+        self.assertLess(len(tree2.SETTLED), len(tree1.SETTLED))
+        
+    def test_prepare(self):
+        
+        chemin = os.path.join(self.resource_path, 'data/network/network_ecrin_extrait.csv')
+        network = NetworkReader.readFromFile(chemin, 'TEST2', False)
+        DISTANCES = network.all_shortest_distances(cut=1000)
+        
+        network.prepare(cut=1000, workers=2, verbose=False)
+        self.assertEqual(len(DISTANCES), network.DISTANCES.size())
+        for (source, target), d in DISTANCES.items():
+            self.assertEqual(d, network.prepared_shortest_distance(source, target))
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            network.save_prep(os.path.join(tmp, 'prep'))
+            network.DISTANCES = None
+            network.load_prep(os.path.join(tmp, 'prep.npy'))
+            for (source, target), d in DISTANCES.items():
+                self.assertEqual(d, network.prepared_shortest_distance(source, target))
+            network.DISTANCES = None
+        
+        ids = network.getNodesId()
+        network.prepare(sources=ids[0:5], targets=ids[300:400], verbose=False)
+        for source in ids[0:5]:
+            for target in ids[300:400]:
+                d = network.shortest_distance(source, target)
+                self.assertAlmostEqual(d, network.prepared_shortest_distance(source, target), 6)
+        self.assertFalse(network.has_prepared_shortest_distance(ids[0], ids[1]))
+        
+    def test_routing_modes(self):
+        
+        chemin = os.path.join(self.resource_path, 'data/network/network_ecrin_extrait.csv')
+        network = NetworkReader.readFromFile(chemin, 'TEST2', False)
+        ids = network.getNodesId()
+        pairs = [(ids[i], ids[(53*i+7) % len(ids)]) for i in range(0, len(ids), 15)]
+        DISTANCES = [network.shortest_distance(s, t) for (s, t) in pairs]
+        
+        network.createLandmarks(4, verbose=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            network.exportLandmarks(os.path.join(tmp, 'ecrin'))
+            network.importLandmarks(os.path.join(tmp, 'ecrin'), mmap=False)
+        
+        for mode in [Network.ROUTING_ALGO_ASTAR, Network.ROUTING_ALGO_BIDIRECTIONAL, Network.ROUTING_ALGO_ALT]:
+            network.setRoutingMethod(mode)
+            for (s, t), d in zip(pairs, DISTANCES):
+                self.assertAlmostEqual(d, network.shortest_distance(s, t), 6)
+            trace = network.shortest_path(pairs[3][0], pairs[3][1])
+            self.assertAlmostEqual(DISTANCES[3], trace.length(), 6)
+        
+        d1 = network.distanceBtwPts(10, 5.0, 250, 12.0)
+        network.prepare(verbose=False)
+        d2 = network.distanceBtwPts(10, 5.0, 250, 12.0)
+        self.assertAlmostEqual(d1, d2, 6)
+        
+    def test_recompile(self):
+        
+        chemin = os.path.join(self.resource_path, 'data/network/network_ecrin_extrait.csv')
+        network = NetworkReader.readFromFile(chemin, 'TEST2', False)
+        ids = network.getNodesId()
+        pairs = [(ids[i], ids[(53*i+7) % len(ids)]) for i in range(0, len(ids), 15)]
+        network.createLandmarks(4, verbose=False)
+        network.createContractionHierarchy(verbose=False)
+        network.prepare(cut=500, verbose=False)
+        
+        # Modified weights: derived structures are dropped
+        for (k, edge) in enumerate(network):
+            edge.weight *= 1 + (k % 5)
+        network.compile()
+        self.assertIsNone(network.landmarks)
+        self.assertIsNone(network.hierarchy)
+        self.assertIsNone(network.DISTANCES)
+        
+        network.setRoutingMethod(Network.ROUTING_ALGO_DIJKSTRA)
+        DISTANCES = [network.shortest_distance(s, t) for (s, t) in pairs]
+        network.setRoutingMethod(Network.ROUTING_ALGO_ALT)
+        for (s, t), d in zip(pairs, DISTANCES):
+            self.assertAlmostEqual(d, network.shortest_distance(s, t), 6)
+        network.createContractionHierarchy(verbose=False)
+        for (s, t), d in zip(pairs, DISTANCES):
+            self.assertAlmostEqual(1e300 if d < 0 else d, network.prepared_shortest_distance(s, t), 6)
+        
+    def test_contraction_hierarchy(self):
+        
+        chemin = os.path.join(self.resource_path, 'data/network/network_ecrin_extrait.csv')
+        network = NetworkReader.readFromFile(chemin, 'TEST2', False)
+        ids = network.getNodesId()
+        pairs = [(ids[i], ids[(91*i+3) % len(ids)]) for i in range(0, len(ids), 4)]
+        
+        network.createContractionHierarchy(verbose=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            network.exportContractionHierarchy(os.path.join(tmp, 'ecrin'))
+            network.importContractionHierarchy(os.path.join(tmp, 'ecrin'))
+        
+        for (s, t) in pairs:
+            d = network.shortest_distance(s, t)
+            if d < 0:
+                d = 1e300
+            self.assertTrue(network.has_prepared_shortest_distance(s, t))
+            self.assertAlmostEqual(d, network.prepared_shortest_distance(s, t), 6)
+        
+        d1 = network.distanceBtwPts(10, 5.0, 250, 12.0)
+        network.hierarchy = None
+        d2 = network.distanceBtwPts(10, 5.0, 250, 12.0)
+        self.assertAlmostEqual(d1, d2, 6)
+        
+    def test_directory_format(self):
+        
+        chemin = os.path.join(self.resource_path, 'data/network/network_ecrin_extrait.csv')
+        network = NetworkReader.readFromFile(chemin, 'TEST2', False)
+        network.createSpatialIndex((25, 25), verbose=False)
+        network.prepare(cut=500, verbose=False)
+        ids = network.getNodesId()
+        pairs = [(ids[i], ids[(37*i+11) % len(ids)]) for i in range(0, len(ids), 20)]
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            NetworkWriter.writeToDirectory(network, os.path.join(tmp, 'ecrin'))
+            copy = NetworkReader.readFromDirectory(os.path.join(tmp, 'ecrin'), verbose=False)
+            
+            self.assertEqual(network.getNodesId(), copy.getNodesId())
+            self.assertEqual(network.getEdgesId(), copy.getEdgesId())
+            for id in network.getEdgesId()[0:50]:
+                self.assertAlmostEqual(network.EDGES[id].geom.length(), copy.EDGES[id].geom.length(), 6)
+                self.assertEqual(network.EDGES[id].orientation, copy.EDGES[id].orientation)
+            for (s, t) in pairs:
+                self.assertAlmostEqual(network.shortest_distance(s, t), copy.shortest_distance(s, t), 6)
+                self.assertEqual(network.prepared_shortest_distance(s, t), copy.prepared_shortest_distance(s, t))
+            
+            coord = network.NODES[ids[10]].coord
+            R1 = network.spatial_index.nearest(coord, 3)
+            R2 = copy.spatial_index.nearest(coord, 3)
+            self.assertEqual([r[0] for r in R1], [r[0] for r in R2])
+            
+            # Memory-mapped compiled network is pickled by reference
+            graph = copy.getCompiledNetwork()
+            self.assertLess(len(pickle.dumps(graph)), 1000)
+            self.assertEqual(list(graph.FWD_PTR), list(pickle.loads(pickle.dumps(graph)).FWD_PTR))
+            del copy, graph, R2
+        
     def test_igast(self):
         
         chemin = os.path.join(self.resource_path, 'data/network/network_igast.csv')
@@ -170,6 +349,13 @@ if __name__ == '__main__':
     suite = TestSuite()
     suite.addTest(TestDijkstra("test_dijkstra"))
     suite.addTest(TestDijkstra("test_igast"))
+    suite.addTest(TestDijkstra("test_compile"))
+    suite.addTest(TestDijkstra("test_concurrent_routing"))
+    suite.addTest(TestDijkstra("test_prepare"))
+    suite.addTest(TestDijkstra("test_routing_modes"))
+    suite.addTest(TestDijkstra("test_recompile"))
+    suite.addTest(TestDijkstra("test_contraction_hierarchy"))
+    suite.addTest(TestDijkstra("test_directory_format"))
     suite.addTest(TestDijkstra("test_dijkstra_bdtopo"))
     suite.addTest(TestDijkstra("test_bdtopo"))
     runner = TextTestRunner()
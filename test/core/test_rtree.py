@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from unittest import TestCase, TestSuite, TextTestRunner
+import random
+
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Coords import ENUCoords
+from tracklib.core.Obs import Obs
+from tracklib.core.Track import Track
+from tracklib.core.TrackCollection import TrackCollection
+from tracklib.core.SpatialIndex import SpatialIndex
+from tracklib.core.RTree import RTree
+
+
+class TestRTree(TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        TRACES = []
+        for k in range(30):
+            x = random.uniform(0, 100); y = random.uniform(0, 100)
+            track = Track()
+            for i in range(20):
+                x += random.gauss(0, 3); y += random.gauss(0, 3)
+                track.addObs(Obs(ENUCoords(x, y), GPSTime()))
+            TRACES.append(track)
+        self.collection = TrackCollection(TRACES)
+
+    def test_backend(self):
+        self.collection.createSpatialIndex((5, 5), False, SpatialIndex.BACKEND_RTREE)
+        self.assertIsInstance(self.collection.spatial_index, RTree)
+        self.collection.createSpatialIndex((5, 5), False)
+        self.assertIsInstance(self.collection.spatial_index, SpatialIndex)
+
+    def test_queries(self):
+        grid = SpatialIndex(self.collection, (5, 5), 0.05, False)
+        tree = RTree(self.collection, (5, 5), 0.05, False)
+
+        for q in range(50):
+            coord = ENUCoords(random.uniform(-10, 110), random.uniform(-10, 110))
+            R1 = grid.nearest(coord, 3)
+            R2 = tree.nearest(coord, 3)
+            self.assertEqual([r[0] for r in R1], [r[0] for r in R2])
+            for (r1, r2) in zip(R1, R2):
+                self.assertAlmostEqual(r1[2], r2[2], 9)
+            self.assertEqual([r[0] for r in grid.within(coord, 8)], [r[0] for r in tree.within(coord, 8)])
+
+            # Features with a segment bbox containing coord
+            EXPECTED = []
+            for n in range(self.collection.size()):
+                track = self.collection[n]
+                for i in range(track.size()-1):
+                    x1 = track[i].position.getX(); x2 = track[i+1].position.getX()
+                    y1 = track[i].position.getY(); y2 = track[i+1].position.getY()
+                    if min(x1, x2) <= coord.getX() <= max(x1, x2) and min(y1, y2) <= coord.getY() <= max(y1, y2):
+                        EXPECTED.append(n)
+                        break
+            self.assertCountEqual(tree.request(coord), EXPECTED)
+
+            V = tree.neighborhood(coord, None, -1)
+            self.assertIn(R2[0][0], V)
+
+        track = self.collection[3]
+        self.assertIn(3, tree.request(track))
+        self.assertIn(3, tree.neighborhood(track, None, 1))
+        self.assertIn(3, tree.neighborhood([track[0].position, track[1].position], None, -1))
+
+
+if __name__ == '__main__':
+    suite = TestSuite()
+    suite.addTest(TestRTree("test_backend"))
+    suite.addTest(TestRTree("test_queries"))
+    runner = TextTestRunner()
+    runner.run(suite)
@@ -411,6 +411,65 @@ class TestSpatialIndex(TestCase):
         
         
         
+    def test_bulk_insertion(self):
+        
+        index = SpatialIndex((0, 10, 0, 10), (1, 1), 0, False)
+        X = [0.5, 3.5, 3.5, 2.0, 2.0, 9.5]
+        Y = [0.5, 2.5, 2.5, 2.0, 8.0, 8.0]
+        index.addPolylines(X, Y, [4, 4, 7, 7, 7, 7])
+        
+        self.assertEqual(index.request(0, 0), [4])
+        self.assertEqual(index.request(2, 1), [4])
+        self.assertEqual(index.request(3, 2), [4, 7])
+        self.assertEqual(index.request(2, 5), [7])
+        self.assertEqual(index.request(9, 8), [7])
+        self.assertEqual(index.request(1, 1), [4])
+        self.assertEqual(index.request(1, 2), [])
+        
+        # Same cells with per-feature insertion
+        index2 = SpatialIndex((0, 10, 0, 10), (1, 1), 0, False)
+        track = Track([Obs(ENUCoords(X[k], Y[k]), GPSTime()) for k in range(2)])
+        index2.addFeature(track, 4)
+        track = Track([Obs(ENUCoords(X[k], Y[k]), GPSTime()) for k in range(2, 6)])
+        index2.addFeature(track, 7)
+        for i in range(10):
+            for j in range(10):
+                self.assertEqual(index.request(i, j), index2.request(i, j))
+        
+        # Out of grid segments are skipped, with rate-limited warnings
+        track = Track([Obs(ENUCoords(x, 0.5), GPSTime()) for x in range(-50, 3)])
+        index.addFeature(track, 9)
+        self.assertEqual(index.overflows, 50)
+        self.assertEqual(index.request(1, 0), [4, 9])
+        self.assertEqual(index.request(2, 0), [9])
+        
+        
+    def test_nearest(self):
+        
+        index = SpatialIndex((0, 10, 0, 10), (1, 1), 0, False)
+        index.addPolylines([1, 1, 8, 8, 9.5, 9.5], [1, 9, 9, 1, 1, 9], [0, 0, 0, 1, 1, 1])
+        index.addSegments([4], [4], [6], [4], [2])
+        
+        (feature, segment, d, p) = index.nearest(ENUCoords(5, 8))[0]
+        self.assertEqual((feature, segment), (0, 1))
+        self.assertAlmostEqual(d, 1, 9)
+        self.assertAlmostEqual(p.getX(), 5, 9)
+        self.assertAlmostEqual(p.getY(), 9, 9)
+        
+        R = index.nearest(ENUCoords(7, 4), 2)
+        self.assertEqual([r[0] for r in R], [2, 1])
+        self.assertAlmostEqual(R[0][2], 1, 9)
+        self.assertAlmostEqual(R[1][2], 2.5, 9)
+        self.assertEqual(R[1][1], 1)
+        
+        R = index.nearest(ENUCoords(20, 20), 5)
+        self.assertEqual([r[0] for r in R], [1, 0, 2])
+        
+        self.assertEqual([r[0] for r in index.within(ENUCoords(5, 5), 1)], [2])
+        self.assertEqual([r[0] for r in index.within(ENUCoords(5, 5), 4.2)], [2, 0])
+        self.assertEqual(index.within(ENUCoords(5, 6.5), 1), [])
+        
+        
     # def test_index_trackcollection(self):
        
     #     GPSTime.setReadFormat("4Y-2M-2D 2h:2m:2s")
@@ -456,6 +515,8 @@ if __name__ == '__main__':
     suite.addTest(TestSpatialIndex("test_create_index"))
     suite.addTest(TestSpatialIndex("test_create_index_collection1"))
     suite.addTest(TestSpatialIndex("test_create_index_collection2"))
+    suite.addTest(TestSpatialIndex("test_bulk_insertion"))
+    suite.addTest(TestSpatialIndex("test_nearest"))
     #suite.addTest(TestSpatialIndex("test_index_trackcollection"))
     #suite.addTest(TestSpatialIndex("test_index_network"))
     #suite.addTest(TestSpatialIndex("testIndexPoint"))
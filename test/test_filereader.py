@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+"""
+
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from tracklib.core.GPSTime import GPSTime
+from tracklib.io.FileReader import FileReader
+
+
+class TestFileReader(unittest.TestCase):
+
+    def setUp(self):
+        self.resource_path = os.path.join(os.path.split(__file__)[0], "..")
+        self.path = os.path.join(self.resource_path, "data/MC1_ublox.pos")
+
+    def test_read_pos(self):
+        track = FileReader.readFromFile(self.path)
+        self.assertEqual(4301, track.size())
+        self.assertEqual("Geo", track.getSRID())
+        self.assertFalse(track.isColumnar())
+        self.assertEqual(177718.4635, track.getX(0))
+        self.assertEqual(4202417.9527, track.getY(0))
+        self.assertEqual("16/07/2021 09:46:29", str(track[0].timestamp))
+        self.assertEqual(5, track[0].timestamp.ms)
+        self.assertEqual(GPSTime(2021, 7, 16, 9, 46, 29, 5).toAbsTime(), track.getT(0))
+        
+        columnar = FileReader.readFromFile(self.path, columnar=True)
+        self.assertTrue(columnar.isColumnar())
+        self.assertEqual(track.getX(), columnar.getX())
+        self.assertEqual(track.getT(), columnar.getT())
+
+    def test_read_by_chunks(self):
+        track = FileReader.readFromFile(self.path)
+        chunks = list(FileReader.readFromFileByChunks(self.path, chunk_size=1000))
+        self.assertEqual([1000, 1000, 1000, 1000, 301], [chunk.size() for chunk in chunks])
+        self.assertEqual(track.getY()[2000:3000], chunks[2].getY())
+        self.assertEqual(track.getT()[4000:], chunks[4].getT())
+
+    def test_read_from_files(self):
+        pathdir = tempfile.mkdtemp()
+        try:
+            for name in ["MC1_ublox.pos", "FC2_ublox.pos", "raw_gps.pos"]:
+                shutil.copy(os.path.join(self.resource_path, "data", name), pathdir)
+            serial = FileReader.readFromFiles(pathdir)
+            parallel = FileReader.readFromFiles(pathdir, workers=2)
+            self.assertEqual(3, parallel.size())
+            for i in range(serial.size()):
+                self.assertFalse(parallel[i].isColumnar())
+                self.assertEqual(serial[i].getX(), parallel[i].getX())
+                self.assertEqual(serial[i].getT(), parallel[i].getT())
+            self.assertEqual(4301, parallel[1].size())
+        finally:
+            shutil.rmtree(pathdir)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite()
+    suite.addTest(TestFileReader("test_read_pos"))
+    suite.addTest(TestFileReader("test_read_by_chunks"))
+    suite.addTest(TestFileReader("test_read_from_files"))
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
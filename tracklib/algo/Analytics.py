@@ -4,6 +4,8 @@
 # -----------------------------------------------------------------------------
 
 import math
+import numpy as np
+
 import tracklib.core.Utils as utils
 
 
@@ -29,11 +31,7 @@ def ds(track, i):
 
 
 def abs_curv(track, i):
-    S = [0]
-    for i in range(1, track.size()):
-        ds = track.getObs(i-1).position.distance2DTo(track.getObs(i).position)
-        S.append(S[i-1] + ds)
-    return S
+    return float(track.cumulativeLength()[i])
 
 def heading(track, i):
     if i == len(track):
@@ -283,3 +281,247 @@ def stop_point_with_time_window_criteria(trace, i):
     
     return retour
 
+
+
+# =============================================================================
+#    Vectorized versions of built-in AF algorithms
+# -----------------------------------------------------------------------------
+# Registered as 'batch' attribute of the per-point algorithm, and called by 
+# Track.addAnalyticalFeature to compute the whole AF in one pass. A batch 
+# function returns None when it can't handle the track (e.g. non-ENU coords 
+# or too few points), in which case the per-point algorithm is used instead.
+# =============================================================================
+
+# Planimetric distances between points of indices I and J (ENU only)
+def __distances2D(track, I, J):
+    X = track.getAnalyticalFeatureArray("x")
+    Y = track.getAnalyticalFeatureArray("y")
+    return np.sqrt((X[I]-X[J])**2 + (Y[I]-Y[J])**2)
+
+def __isPlanimetric(track, min_size=2):
+    return (track.size() >= min_size) and (track.getSRID() == "ENU")
+    
+def __ratio(num, den):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den == 0, utils.NAN, num/np.where(den == 0, 1, den))
+
+def _ds(track):
+    if not __isPlanimetric(track):
+        return None
+    N = track.size()
+    D = np.zeros(N)
+    D[1:] = __distances2D(track, np.arange(1, N), np.arange(0, N-1))
+    return D
+
+def _abs_curv(track):
+    if track.size() == 0:
+        return None
+    return track.cumulativeLength().copy()
+
+def _heading(track):
+    if not __isPlanimetric(track):
+        return None
+    X = track.getAnalyticalFeatureArray("x")
+    Y = track.getAnalyticalFeatureArray("y")
+    H = np.full(track.size(), utils.NAN)
+    H[1:] = np.arctan2(X[1:]-X[:-1], Y[1:]-Y[:-1])
+    return H
+
+# Indices (I, J) of points used for centered finite differences
+def __centered(N):
+    I = np.concatenate(([1], np.arange(2, N), [N-1]))
+    J = np.concatenate(([0], np.arange(0, N-2), [N-2]))
+    return I, J
+
+def _speed(track):
+    if not __isPlanimetric(track):
+        return None
+    I, J = __centered(track.size())
+    T = track.getAnalyticalFeatureArray("t")
+    return __ratio(__distances2D(track, I, J), T[I]-T[J])
+
+def _acceleration(track):
+    V = _speed(track)
+    if V is None:
+        return None
+    I, J = __centered(track.size())
+    T = track.getAnalyticalFeatureArray("t")
+    A = __ratio(V[I]-V[J], T[I]-T[J])
+    A[0] = utils.NAN
+    return A
+
+def _anglegeom(track):
+    if not __isPlanimetric(track, 3):
+        return None
+    N = track.size()
+    I = np.arange(1, N-1)
+    ab = __distances2D(track, I-1, I)
+    bc = __distances2D(track, I, I+1)
+    ac = __distances2D(track, I-1, I+1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_abc = (ab*ab + bc*bc - ac*ac) / (2*ab*bc)
+        angle = np.degrees(np.arccos(cos_abc))
+    angle[(np.abs(cos_abc - 1) < 0.0001) | (np.abs(cos_abc + 1) < 0.0001)] = 90
+    output = np.full(N, utils.NAN)
+    output[1:-1] = angle
+    return output
+
+def _calculAngleOriente(track):
+    if not __isPlanimetric(track, 3):
+        return None
+    X = track.getAnalyticalFeatureArray("x")
+    Y = track.getAnalyticalFeatureArray("y")
+    angle = np.arctan2(Y[2:]-Y[1:-1], X[2:]-X[1:-1])
+    angle -= np.arctan2(Y[:-2]-Y[1:-1], X[:-2]-X[1:-1])
+    angle = np.degrees(angle)
+    angle[angle == -180] = 180
+    angle = np.where(angle < -180, angle + 360, angle)
+    angle = np.where(angle > 180, angle - 360, angle)
+    output = np.full(track.size(), utils.NAN)
+    output[1:-1] = angle
+    return output
+
+def _orientation(track):
+    if track.size() < 2:
+        return None
+    X = track.getAnalyticalFeatureArray("x")
+    Y = track.getAnalyticalFeatureArray("y")
+    angle = np.arctan2(Y[1:]-Y[:-1], X[1:]-X[:-1])
+    cap = np.full(angle.shape, utils.NAN)
+    # Same (strict) bounds as in per-point orientation (W is never reached)
+    SECTORS = [(1, -1/8, 1/8), (2, 1/8, 3/8), (3, 3/8, 5/8), (4, 5/8, 7/8), 
+               (6, -7/8, -5/8), (7, -5/8, -3/8), (8, -3/8, -1/8)]
+    for (direction, a, b) in SECTORS:
+        cap[(angle > a*math.pi) & (angle < b*math.pi)] = direction
+    output = np.full(track.size(), utils.NAN)
+    output[1:] = cap
+    return output
+
+def _stop_point_with_acceleration_criteria(track):
+    V = _speed(track)
+    A = _acceleration(track)
+    if (V is None) or (track.size() < 3):
+        return None
+    N = track.size()
+    # Index of next point (strictly after i) where acceleration is not <= 0
+    with np.errstate(invalid='ignore'):
+        B = ~(A <= 0)
+    NEXT = np.where(B, np.arange(N), N)
+    NEXT = np.minimum.accumulate(NEXT[::-1])[::-1]
+    NEXT = np.concatenate((NEXT[1:], [N]))
+    found = NEXT < N
+    with np.errstate(invalid='ignore'):
+        stop = (V == 0) & (A < 0) & found
+        stop[found] &= A[NEXT[found]] > 0
+    stop[0] = False
+    return stop.astype(float)
+
+def _stop_point_with_time_window_criteria(trace):
+    name_af = 'stop_point_with_time_window_criteria'
+    if not (trace.hasAnalyticalFeature(name_af) and trace.hasAnalyticalFeature(BIAF_ABS_CURV)):
+        return None
+    N = trace.size()
+    T = trace.getAnalyticalFeatureArray("t")
+    S = np.array(trace.getAnalyticalFeature(BIAF_ABS_CURV), dtype=float)
+    AF = np.array(trace.getAnalyticalFeature(name_af), dtype=float)
+    W = 40; D = 30
+    if N < 3:
+        return __stop_time_window_loop(T.tolist(), S.tolist(), AF.tolist(), W, D)
+    if np.any(np.diff(T) < 0) or np.any(np.diff(S) < 0) or np.any(np.isnan(S)):
+        return __stop_time_window_loop(T.tolist(), S.tolist(), AF.tolist(), W, D)
+    
+    I = np.arange(N-1)
+    # First index j > i with T[j]-T[i] > W (end of time window)
+    J = __firstAbove(T, I, W, I+1)
+    # Window fully inside track: pause if moving distance <= D, and
+    # window is extended up to first point at distance > D from i
+    inside = J <= N-2
+    Jc = np.minimum(J, N-2)
+    pause = inside & (S[Jc] - S[I] <= D)
+    END = np.minimum(__firstAbove(S, I, D, Jc), N-1)
+    # Window reaching last point: examined on last but one timestamp 
+    # (last timestamp for i = N-2), undefined if it is a pause
+    TL = np.full(N-1, T[N-2]); TL[N-2] = T[N-1]
+    undefined = ~inside & (TL - T[I] >= W) & (S[N-1] - S[I] <= D)
+    undefined[N-2] |= (T[N-1] - T[N-2] <= W)
+    
+    # Points already examined are left unchanged
+    with np.errstate(invalid='ignore'):
+        todo = ~(AF[0:N-1] > -1)
+    VAL = np.where(undefined, utils.NAN, VAL_AF_TIME_WINDOW_MOVE)
+    OUTPUT = AF.copy()
+    OUTPUT[0:N-1][todo] = VAL[todo]
+    
+    # Each stop covers points [i, j-2], which are then not examined
+    STARTS = np.where(pause & todo)[0]
+    k = 0
+    while k < len(STARTS):
+        i = STARTS[k]
+        e = max(i, END[i]-2)
+        OUTPUT[i:e+1] = VAL_AF_TIME_WINDOW_STOP
+        k = np.searchsorted(STARTS, e, side='right')
+        
+    if not (AF[N-1] > -1):
+        OUTPUT[N-1] = OUTPUT[N-2]
+    return OUTPUT
+
+# First index j >= J0[i] such that V[j]-V[i] > delta (len(V) if none) 
+# in a sorted array V 
+def __firstAbove(V, I, delta, J0):
+    J = np.maximum(np.searchsorted(V, V[I] + delta, side='right'), J0)
+    n = len(V)
+    # Rounding errors on V[i] + delta
+    back = (J > J0) & (V[np.maximum(J-1, 0)] - V[I] > delta)
+    J[back] -= 1
+    forward = (J < n) & (V[np.minimum(J, n-1)] - V[I] <= delta)
+    J[forward] += 1
+    return J
+
+# Per-point algorithm on lists (unsorted timestamps or abscissa)
+def __stop_time_window_loop(T, S, AF, W, D):
+    N = len(T)
+    # Transcription of the per-point algorithm on arrays
+    for i in range(N):
+        if AF[i] > -1:
+            continue
+        if i == N-1:
+            AF[i] = AF[N-2]
+            continue
+        try:
+            j = i + 1
+            ispause = False
+            tj = T[j]
+            ti = T[i]
+            while ((tj - ti) <= W):
+                j = j + 1
+                if j == N-1:
+                    break
+                tj = T[j]
+            while ((tj - ti) >= W and (S[j] - S[i]) <= D):
+                ispause = True
+                j = j + 1
+                if j == N-1:
+                    break
+                tj = T[j]
+        except IndexError:
+            AF[i] = utils.NAN
+            continue
+        if ispause:
+            for k in range(i, j-1):
+                AF[k] = VAL_AF_TIME_WINDOW_STOP
+            AF[i] = VAL_AF_TIME_WINDOW_STOP
+        else:
+            AF[i] = VAL_AF_TIME_WINDOW_MOVE
+    return np.array(AF, dtype=float)
+
+
+ds.batch = _ds
+abs_curv.batch = _abs_curv
+heading.batch = _heading
+speed.batch = _speed
+acceleration.batch = _acceleration
+anglegeom.batch = _anglegeom
+calculAngleOriente.batch = _calculAngleOriente
+orientation.batch = _orientation
+stop_point_with_acceleration_criteria.batch = _stop_point_with_acceleration_criteria
+stop_point_with_time_window_criteria.batch = _stop_point_with_time_window_criteria
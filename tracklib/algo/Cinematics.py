@@ -103,11 +103,8 @@ def computeAvgAscSpeed(track, id_ini=0, id_fin=None):
 def computeAbsCurv(track):
     '''Compute and return curvilinear abscissa for each points'''
     
-    if not track.hasAnalyticalFeature(Analytics.BIAF_DS):
-        track.addAnalyticalFeature(Analytics.ds, Analytics.BIAF_DS)
     if not track.hasAnalyticalFeature(Analytics.BIAF_ABS_CURV):
-        track.operate(Operator.Operator.INTEGRATOR, Analytics.BIAF_DS, Analytics.BIAF_ABS_CURV)
-    track.removeAnalyticalFeature(Analytics.BIAF_DS)
+        track.createAnalyticalFeature(Analytics.BIAF_ABS_CURV, track.cumulativeLength().tolist())
    
     return track.getAnalyticalFeature(Analytics.BIAF_ABS_CURV)
 	
@@ -117,10 +114,10 @@ def computeCurvAbsBetweenTwoPoints(track, id_ini=0, id_fin=None):
     TODO : adapter avec le filtre''' 
     if id_fin is None:
         id_fin = track.size()-1
-    s = 0
-    for i in range(id_ini, id_fin):
-        s = s + track[i].position.distance2DTo(track[i+1].position)
-    return s
+    if id_fin <= id_ini:
+        return 0
+    S = track.cumulativeLength()
+    return S[id_fin] - S[id_ini]
 	
 def computeNetDeniv(track, id_ini=0, id_fin=None):
     '''Computes net denivellation (in meters)'''
@@ -32,7 +32,17 @@ def plotDifferenceProfile(profile, track2, af_name="pair", sym='g--', NO_DATA_VA
 # Profile of difference between two traces : t2 - t1
 # Two possible modes: 
 # - NN (Nearest Neighbour): O(n^2) time and O(n) space
-# - DTW (Dynamic Time Warping): O(n^3) time and O(n^2) space
+# - DTW (Dynamic Time Warping): O(n^2) time and O(n^2) bits
+#   of space (only backtracking directions are stored). The
+#   search space may be reduced to a Sakoe-Chiba band with 
+#   'window' parameter (maximal shift, in number of points of 
+#   track2, from the diagonal) and/or to an Itakura 
+#   parallelogram with 'slope' parameter (maximal ratio of 
+#   local speeds of both tracks, must be > 1). Both reduce
+#   time and space to O(n.w), where w is the band width. If 
+#   'cutoff' is set, computation is abandoned (and None is 
+#   returned) as soon as all partial alignment costs exceed 
+#   cutoff (sum of distances to the power p).
 # - FDTW (Fast Dynamic Time Warping): same as DTW with reduced
 #   search space. In this particular case, 'ends' parameter is 
 #   an integer giving the number of points to search for a 
@@ -57,7 +67,8 @@ def plotDifferenceProfile(profile, track2, af_name="pair", sym='g--', NO_DATA_VA
 # value is 1 for summation of distances, 2 for least squares 
 # solution and 10 for an approximation of Frechet solution. 
 # ------------------------------------------------------------		
-def differenceProfile(track1, track2, mode="NN", ends=False, p=1, verbose=True):
+def differenceProfile(track1, track2, mode="NN", ends=False, p=1, verbose=True, 
+                      window=None, slope=None, cutoff=None):
 
     output = track1.copy()
     output.createAnalyticalFeature("diff");
@@ -69,23 +80,34 @@ def differenceProfile(track1, track2, mode="NN", ends=False, p=1, verbose=True):
     # Nearest Neighbor (NN) algorithm
     # --------------------------------------------------------
     if mode == "NN":
-        to_run = range(output.size())
-        if verbose:
-            to_run = progressbar.progressbar(to_run)
-        for i in to_run:
-            val_min = sys.float_info.max
-            id_min = 0
-            for j in range(track2.size()):
-                distance = output.getObs(i).distance2DTo(track2.getObs(j))
-                if distance < val_min:
-                    val_min = distance
-                    id_min = j
-            output.setObsAnalyticalFeature("diff", i, val_min)
-            output.setObsAnalyticalFeature("pair", i, id_min)
-            ex = track1.getObs(i).position.getX() - track2.getObs(id_min).position.getX()
-            ey = track1.getObs(i).position.getY() - track2.getObs(id_min).position.getY()
-            output.setObsAnalyticalFeature("ex", i, ex)
-            output.setObsAnalyticalFeature("ey", i, ey)
+        if track1.getSRID() == "ENU" and track2.getSRID() == "ENU":
+            X1 = track1.getAnalyticalFeatureArray("x")
+            Y1 = track1.getAnalyticalFeatureArray("y")
+            X2 = track2.getAnalyticalFeatureArray("x")
+            Y2 = track2.getAnalyticalFeatureArray("y")
+            D, S = __nearestNeighbours2D(X1, Y1, X2, Y2, verbose)
+            __setAFProfile(output, "diff", D.tolist())
+            __setAFProfile(output, "pair", S.tolist())
+            __setAFProfile(output, "ex", (X1 - X2[S]).tolist())
+            __setAFProfile(output, "ey", (Y1 - Y2[S]).tolist())
+        else:
+            to_run = range(output.size())
+            if verbose:
+                to_run = progressbar.progressbar(to_run)
+            for i in to_run:
+                val_min = sys.float_info.max
+                id_min = 0
+                for j in range(track2.size()):
+                    distance = output.getObs(i).distance2DTo(track2.getObs(j))
+                    if distance < val_min:
+                        val_min = distance
+                        id_min = j
+                output.setObsAnalyticalFeature("diff", i, val_min)
+                output.setObsAnalyticalFeature("pair", i, id_min)
+                ex = track1.getObs(i).position.getX() - track2.getObs(id_min).position.getX()
+                ey = track1.getObs(i).position.getY() - track2.getObs(id_min).position.getY()
+                output.setObsAnalyticalFeature("ex", i, ex)
+                output.setObsAnalyticalFeature("ey", i, ey)
 
     # --------------------------------------------------------
     # Dynamic time warping (DTW) algorithm
@@ -93,51 +115,9 @@ def differenceProfile(track1, track2, mode="NN", ends=False, p=1, verbose=True):
     if mode == "DTW":
 	
         p = max(min(p,15),1e-2)
-        
-        track1 = track1.copy()
-        track2 = track2.copy()
-		
-        # Forming distance matrix
-        D = np.zeros((track1.size(), track2.size()))
-        for i in range(track1.size()):
-            for j in range(track2.size()):
-                D[i,j] = track1.getObs(i).distance2DTo(track2.getObs(j))**p
-        
-        # Optimal path with dynamic programming
-        T = np.zeros((track1.size(), track2.size()))
-        M = np.zeros((track1.size(), track2.size()))
-        T[0,0] = D[0,0]
-        M[0,0] = -1
-		
-		# Forward step
-        step_to_run = range(1,T.shape[0])
-        if verbose:
-            step_to_run = progressbar.progressbar(step_to_run)
-        for i in step_to_run:
-            T[i,0] = T[i-1,0] + D[i,0]
-            M[i,0] = 0
-            for j in range(1, T.shape[1]):
-                K = D[i,0:(j+1)]
-                for k in range(j-1,-1,-1):
-                    K[k] = K[k] + K[k+1]
-                V = T[i-1,0:(j+1)] + K
-                M[i,j] = np.argmin(V) 
-                T[i,j] = V[int(M[i,j])]
-                
-        
-        # Backward step
-        S = [0]*(track1.size())
-        if ends:
-            S[track1.size()-1] = int(M[track1.size()-1,track2.size()-1]) 
-        else:
-            S[track1.size()-1] = np.argmin(T[track1.size()-1,:])
-        for i in range(track1.size()-2, -1, -1):
-            S[i] = int(M[i+1,S[i+1]])
-			
-        #print((T[track1.size()-1, S[track1.size()-1]] / track1.size())**(1.0/p))
-		
-        #plt.plot(S, 'r-')			
-        #plt.imshow(M)
+        S = __dynamicTimeWarping(track1, track2, ends, p, window, slope, cutoff, verbose)
+        if S is None:
+            return None
 
         __fillAFProfile(track1, track2, output, S)
 			
@@ -154,13 +134,213 @@ def differenceProfile(track1, track2, mode="NN", ends=False, p=1, verbose=True):
         Q = lambda i,j,k,t: (j<i+30)*(j>=i)*1
         P = lambda s,y,k,t: math.exp(-track2[s].position.distance2DTo(y))
 
-        Dynamics.HMM(S, Q, P).estimate(output, ["x","y"], mode=Dynamics.MODE_OBS_AS_2D_POSITIONS, verbose=2*verbose)
+        model = Dynamics.HMM(S, Q, P)
+        model.setTransitionMatrix(lambda S1,S2,k,t: Q(np.array(S1)[:,np.newaxis], np.array(S2)[np.newaxis,:], k, t))
+        if track2.getSRID() == "ENU":
+            X2 = np.array(track2.getX()); Y2 = np.array(track2.getY())
+            model.setObservationVector(lambda S,y,k,t: np.exp(-np.sqrt((X2[S]-y.getX())**2 + (Y2[S]-y.getY())**2)))
+        model.estimate(output, ["x","y"], mode=Dynamics.MODE_OBS_AS_2D_POSITIONS, verbose=2*verbose)
 
         __fillAFProfile(track1, track2, output, output['hmm_inference'])
 
     output.compute_abscurv()
     return output
 
+# ------------------------------------------------------------
+# Nearest neighbours in (X2, Y2) of all points (X1, Y1), with 
+# a grid index on (X2, Y2). Points of (X1, Y1) are processed 
+# by blocks of points falling in the same cell. For each block 
+# candidates are searched in a neighborhood of (2k+1)x(2k+1) 
+# cells, where k is doubled until nearest neighbour is closer 
+# than k cells (i.e. closer than any point outside). Returns 
+# distances and indices, with the same outputs (ties solved 
+# with lowest index, invalid points) as an exhaustive search. 
+# ------------------------------------------------------------
+def __nearestNeighbours2D(X1, Y1, X2, Y2, verbose=False):
+
+    D = np.full(len(X1), sys.float_info.max)
+    S = np.zeros(len(X1), dtype=int)
+    
+    valid2 = np.nonzero(~(np.isnan(X2) | np.isnan(Y2)))[0]
+    valid1 = np.nonzero(~(np.isnan(X1) | np.isnan(Y1)))[0]
+    if (len(valid2) == 0) or (len(valid1) == 0):
+        return D, S
+        
+    # Grid cell size: about 16 points of track 2 per cell (first 
+    # guess from length, then reduced if track is folded on itself)
+    L = np.sum(np.sqrt(np.diff(X2[valid2])**2 + np.diff(Y2[valid2])**2))
+    size = 16*L/len(valid2)
+    if size == 0:
+        size = 1.0
+    xmin = np.min(X2[valid2])
+    ymin = np.min(Y2[valid2])
+    
+    # Points of track 2 sorted by cell index
+    for iteration in range(4):
+        IX2 = np.floor((X2[valid2]-xmin)/size).astype(int)
+        IY2 = np.floor((Y2[valid2]-ymin)/size).astype(int)
+        nx = np.max(IX2)+1
+        ny = np.max(IY2)+1
+        keys = IX2*ny + IY2
+        occupancy = len(keys)/len(np.unique(keys))
+        if occupancy <= 32:
+            break
+        size /= math.sqrt(occupancy/16)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    index2 = valid2[order]
+    
+    # Points of track 1 grouped by cell
+    IX1 = np.floor((X1[valid1]-xmin)/size).astype(int)
+    IY1 = np.floor((Y1[valid1]-ymin)/size).astype(int)
+    cells, inverse = np.unique(np.stack((IX1, IY1)), axis=1, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    blocks = np.split(valid1[np.argsort(inverse, kind='stable')], np.cumsum(np.bincount(inverse))[0:-1])
+    
+    to_run = range(len(blocks))
+    if verbose:
+        to_run = progressbar.progressbar(to_run)
+    
+    for b in to_run:
+        cx = cells[0,b]
+        cy = cells[1,b]
+        queries = blocks[b]
+        k = 1
+        while len(queries) > 0:
+            
+            # Candidates in (2k+1)x(2k+1) neighborhood
+            full = (cx-k <= 0) and (cx+k >= nx-1) and (cy-k <= 0) and (cy+k >= ny-1)
+            if full:
+                candidates = valid2
+            else:
+                rows = np.arange(max(cx-k, 0), min(cx+k, nx-1)+1)
+                start = np.searchsorted(keys, rows*ny + max(cy-k, 0), side='left')
+                end = np.searchsorted(keys, rows*ny + min(cy+k, ny-1), side='right')
+                candidates = np.sort(np.concatenate([index2[0:0]] + [index2[start[r]:end[r]] for r in range(len(rows))]))
+            
+            if len(candidates) > 0:
+                DX = X2[candidates][np.newaxis,:] - X1[queries][:,np.newaxis]
+                DY = Y2[candidates][np.newaxis,:] - Y1[queries][:,np.newaxis]
+                DIST = np.sqrt(DX**2 + DY**2)
+                dmin = np.min(DIST, axis=1)
+                imin = candidates[np.argmin(DIST, axis=1)]
+                found = full | (dmin < k*size*(1-1e-9))
+                D[queries[found]] = dmin[found]
+                S[queries[found]] = imin[found]
+                queries = queries[~found]
+            k *= 2
+    
+    return D, S
+    
+# ------------------------------------------------------------
+# Bounds [lo[i], hi[i]) of the columns of DTW search space on 
+# each row i, with an optional Sakoe-Chiba band of half-width 
+# 'window' and/or an Itakura parallelogram of maximal 'slope'.
+# Bounds are widened if necessary so that consecutive rows 
+# share at least one column (i.e. the band remains connected 
+# with vertical and horizontal moves) and so that the whole 
+# last row is available when ends are not forced to meet.
+# ------------------------------------------------------------
+def __dtwBand(n, m, ends=False, window=None, slope=None):
+    lo = np.zeros(n, dtype=np.int64)
+    hi = np.full(n, m, dtype=np.int64)
+    u = np.arange(n) / max(n-1, 1)
+    if window is not None:
+        c = u*(m-1)
+        lo = np.maximum(lo, np.ceil(c - window - 1e-9).astype(np.int64))
+        hi = np.minimum(hi, np.floor(c + window + 1e-9).astype(np.int64) + 1)
+    if slope is not None:
+        if slope <= 1:
+            sys.exit("Error: Itakura parallelogram slope must be greater than 1")
+        vmin = np.maximum(u/slope, 1 - slope*(1-u))
+        vmax = np.minimum(u*slope, 1 - (1-u)/slope)
+        lo = np.maximum(lo, np.ceil(vmin*(m-1) - 1e-9).astype(np.int64))
+        hi = np.minimum(hi, np.floor(vmax*(m-1) + 1e-9).astype(np.int64) + 1)
+    lo = np.clip(lo, 0, m-1)
+    hi = np.maximum(hi, lo+1)
+    lo[0] = 0
+    if not ends:
+        hi[n-1] = m
+    for i in range(n-2, -1, -1):
+        hi[i] = max(hi[i], lo[i+1]+1)
+    for i in range(1, n):
+        lo[i] = min(lo[i], hi[i-1]-1)
+    return lo, hi
+
+# ------------------------------------------------------------
+# Dynamic programming DTW between track1 and track2. Cost of 
+# matching track1[i] with track2[j] is d(i,j)^p, and the path 
+# goes through the matrix with vertical (next point of track1)
+# and horizontal (next point of track2) moves. Each point i is 
+# paired with the last point j of its horizontal run:
+#    T[i,j] = D[i,j] + min(T[i-1,j], T[i,j-1])
+# Each row is computed in O(m) with numpy, as the minimum over
+# k <= j of T[i-1,k] + D[i,k] + ... + D[i,j], i.e. with a 
+# running minimum on prefix sums of D[i,:]. Only two rows of 
+# costs are kept, along with the packed bits of directions 
+# needed for backtracking. Returns the list of indices of 
+# track2 paired with each point of track1 (None if abandoned).
+# ------------------------------------------------------------
+def __dynamicTimeWarping(track1, track2, ends=False, p=1, window=None, 
+                         slope=None, cutoff=None, verbose=False):
+    
+    n = track1.size()
+    m = track2.size()
+    lo, hi = __dtwBand(n, m, ends, window, slope)
+    
+    if track1.getSRID() == "ENU" and track2.getSRID() == "ENU":
+        X1 = track1.getAnalyticalFeatureArray("x")
+        Y1 = track1.getAnalyticalFeatureArray("y")
+        X2 = track2.getAnalyticalFeatureArray("x")
+        Y2 = track2.getAnalyticalFeatureArray("y")
+        row = lambda i: np.hypot(X2[lo[i]:hi[i]] - X1[i], Y2[lo[i]:hi[i]] - Y1[i])
+    else:
+        row = lambda i: np.array([track1.getObs(i).distance2DTo(track2.getObs(j)) 
+                                  for j in range(lo[i], hi[i])])
+    
+    # Forward step
+    D = np.nan_to_num(row(0)**p, nan=0.0)
+    T = np.cumsum(D) if ends else D
+    UP = [None]*n
+    step_to_run = range(1, n)
+    if verbose:
+        step_to_run = progressbar.progressbar(step_to_run)
+    for i in step_to_run:
+        if cutoff is not None and np.min(T) > cutoff:
+            return None
+        D = np.nan_to_num(row(i)**p, nan=0.0)
+        C = np.cumsum(D)
+        A = np.full(hi[i]-lo[i], np.inf)
+        a = max(lo[i], lo[i-1]); b = min(hi[i], hi[i-1])
+        A[a-lo[i]:b-lo[i]] = T[a-lo[i-1]:b-lo[i-1]]
+        A -= C - D
+        R = np.minimum.accumulate(A)
+        up = np.ones(len(A), dtype=bool)
+        up[1:] = A[1:] < R[:-1]
+        UP[i] = np.packbits(up)
+        T = C + R
+    if cutoff is not None and np.min(T) > cutoff:
+        return None
+        
+    # Backward step
+    S = [0]*n
+    if ends:
+        S[n-1] = m-1
+    else:
+        S[n-1] = int(lo[n-1] + np.argmin(T))
+    for i in range(n-1, 0, -1):
+        up = np.unpackbits(UP[i], count=S[i]-lo[i]+1)
+        S[i-1] = int(lo[i] + np.nonzero(up)[0][-1])
+        
+    return S
+    
+# ------------------------------------------------------------
+# Sets all values of an AF of a difference profile
+# ------------------------------------------------------------
+def __setAFProfile(output, af_name, values):
+    output.removeAnalyticalFeature(af_name)
+    output.createAnalyticalFeature(af_name, values)
+    
 def __fillAFProfile(track1, track2, output, S):
     for i in range(track1.size()):
         x1 = track1.getObs(i).position.getX()
@@ -3,9 +3,12 @@
 # -----------------------------------------------------------------------------
 
 import math
+import inspect
 import progressbar
 import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor
+
 import tracklib.core.Utils as utils
 import tracklib.algo.Stochastics as Stochastics
 
@@ -151,30 +154,30 @@ class Kalman:
         self.control = control
 
     def getQ(self, k, track):
-        if not 'function' in str(type(self.Q)):
+        if not callable(self.Q):
             return self.Q
         else:
-            if self.Q.__code__.co_argcount == 0:
+            if self.__nbArgs(self.Q) == 0:
                 return self.Q()
-            if self.Q.__code__.co_argcount == 1:
+            if self.__nbArgs(self.Q) == 1:
                 return self.Q(k)
-            if self.Q.__code__.co_argcount == 2:
+            if self.__nbArgs(self.Q) == 2:
                 return self.Q(k, track)
 		
     def getR(self, k, track):
-        if not 'function' in str(type(self.R)):
+        if not callable(self.R):
             return self.R
         else:
-            if self.R.__code__.co_argcount == 0:
+            if self.__nbArgs(self.R) == 0:
                 return self.R()
-            if self.R.__code__.co_argcount == 1:
+            if self.__nbArgs(self.R) == 1:
                 return self.R(k)
-            if self.R.__code__.co_argcount == 2:
+            if self.__nbArgs(self.R) == 2:
                 return self.R(k, track)
         
     def summary(self):
  
-        if ("function" in str(type(self.F))) or ("function" in str(type(self.H))):
+        if callable(self.F) or callable(self.H):
             type_kalman = "unscented (UKF)"
         else:
             type_kalman = "standard (KF)"
@@ -184,24 +187,24 @@ class Kalman:
         t_dyn = "linear"
         t_obs = "linear"
         if type_kalman == "unscented (UKF)":
-            if "function" in str(type(self.F)):
+            if callable(self.F):
                 t_dyn = "non-linear"
-            if "function" in str(type(self.H)):
+            if callable(self.H):
                 t_obs = "non-linear"
             print("Dyn model:", t_dyn, "/ Obs model:", t_obs)
         stationarity = "Yes"
-        if 'function' in str(type(self.F)):
-            if self.F.__code__.co_argcount > 1:
+        if callable(self.F):
+            if self.__nbArgs(self.F) > 1:
                 stationarity = "No"	
-        if 'function' in str(type(self.Q)):
-            if self.Q.__code__.co_argcount > 0:
+        if callable(self.Q):
+            if self.__nbArgs(self.Q) > 0:
                 stationarity = "No"
-        if 'function' in str(type(self.R)):
-            if self.R.__code__.co_argcount > 0:
+        if callable(self.R):
+            if self.__nbArgs(self.R) > 0:
                 stationarity = "No"
         print("Stationnarity:", stationarity)
         n = self.P0.shape[0]
-        if 'function' in str(type(self.R)):
+        if callable(self.R):
             m = "?"
         else:
             m = self.R.shape[0]
@@ -215,7 +218,7 @@ class Kalman:
             y = (self.F @ x).transpose()
             print("E.g. x =", x.transpose(), "=>", "F(x) =", y)
         else:
-            if self.F.__code__.co_argcount == 1:
+            if self.__nbArgs(self.F) == 1:
                 y = self.F(x).transpose()
                 print("E.g. x =", x.transpose(), "=>", "F(x) =", y)
         print("-----------------------------------------------------------")
@@ -229,7 +232,7 @@ class Kalman:
                 y = (self.H @ x).transpose()
                 print("E.g. x =", x.transpose(), "=>", "H(x) =", y)
             else:
-                if self.H.__code__.co_argcount == 1:
+                if self.__nbArgs(self.H) == 1:
                     y = self.H(x).transpose()        
                     print("E.g. x =", x.transpose(), "=>", "H(x) =", y)
         print("-----------------------------------------------------------")
@@ -243,6 +246,18 @@ class Kalman:
         print(self.P0)
         print("===========================================================")
         
+    # ------------------------------------------------------------
+    # Transition (or observation) model is linear if provided as 
+    # a matrix. Linear models are handled with closed-form Kalman
+    # equations instead of unscented transform.
+    # ------------------------------------------------------------
+    def __isLinear(self, model):
+        return not callable(model)
+
+    # Number of arguments of a model function (or any callable)
+    def __nbArgs(self, function):
+        return len(inspect.signature(function).parameters)
+
     # ------------------------------------------------------------
     # Internal function to calculate sigma points.
     # Inputs:
@@ -324,16 +339,17 @@ class Kalman:
     # Internal function to apply F or H to sigma points
     # ------------------------------------------------------------
     def __apply(self, function, SIGMA, k, track): 
-        if 'function' in str(type(function)):
-           if function.__code__.co_argcount == 1:
+        if callable(function):
+           nb_args = self.__nbArgs(function)
+           if nb_args == 1:
                output = function(np.array([SIGMA[:,0]]).transpose())
                for i in range(1,SIGMA.shape[1]):
                    output = np.concatenate([output, function(np.array([SIGMA[:,i]]).transpose())], axis=1)
-           if function.__code__.co_argcount == 2:
+           if nb_args == 2:
                output = function(np.array([SIGMA[:,0]]).transpose(), k)
                for i in range(1,SIGMA.shape[1]):
                    output = np.concatenate([output, function(np.array([SIGMA[:,i]]).transpose(), k)], axis=1)
-           if function.__code__.co_argcount == 3:
+           if nb_args == 3:
                output = function(np.array([SIGMA[:,0]]).transpose(), k, track)
                for i in range(1,SIGMA.shape[1]):
                    output = np.concatenate([output, function(np.array([SIGMA[:,i]]).transpose(), k, track)], axis=1)
@@ -344,68 +360,37 @@ class Kalman:
    
         return output
 
-    # ------------------------------------------------------------
-    # Internal function to get all observations at epoch k in a 
-    # track, from a list of analytical feature names (obs) 
-    # ------------------------------------------------------------
-    def __getObs(self, track, obs, k, mode):
-        return utils.unlistify(track.getObsAnalyticalFeatures(obs,k))
-
     
     # ------------------------------------------------------------
-    # Main function of Kalman object, to estimate the states
-    # Inputs:
-    #   - track: the track on which estimation is performed
-    #   - obs: the name of an analytical feature (may also a list 
-    #     of analytical feature names for multi-dimensional input)
-    #     All the analytical features listed must be in the track
-    #   - out: names of estimated fields as recorded in AF
-    #   - mode: to specify how output states are used
-    #        - MODE_STATES_AS_2D_POSITIONS: the first two 
-    #          fields of  output are used to make a Coords object 
-    #        - MODE_STATES_AS_2D_POSITIONS: the first three 
-    #          fields of  output are used to make a Coords object
-    #     For MODE_STATES_AS_XX_POSITIONS modes, coordinates SRID
-    #      is the same as track SRID.
+    # Runs the filter (and the Rauch-Tung-Striebel smoother if 
+    # smooth is True) on a track, without recording anything in 
+    # track AF. Inputs are the same as in estimate function.
+    # Returns states X [N x n], covariances P [N x n x n], 
+    # innovations V [N x m] with covariances S [N x m x m], and 
+    # Kalman gains K [N x n x m] (None if gains is False).
     # ------------------------------------------------------------
-    # Estimated parameters are registered in AF listed in out 
-    # and ("kf_0", "kf_1",..., "kf_n" otherwise if not provided).
-    # Kalman gain matrix is saved at each epoch in "kf_gain" AF
-    # Posterior covariance matrix Pk|k is saved in "kf_P" AF. It 
-    # may be used as it is to plot 2D error ellipses, provided 
-    # that first two states are x and y coordinates. 
-    # ------------------------------------------------------------
-    def estimate(self, track, obs, out=[], mode=-1, verbose=True):
-
-
-        if (len(out) < self.X0.shape[0]):
-            for i in range(len(out), self.X0.shape[0]):
-                out.append("kf_"+str(i))
+    def process(self, track, obs, mode=-1, smooth=False, gains=False, verbose=False):
 
-        # Output states
-        for i in range(self.X0.shape[0]):
-            track.createAnalyticalFeature(out[i], [0]*len(track))
-        # Output states std values
-        for i in range(self.X0.shape[0]):
-            track.createAnalyticalFeature(out[i]+"_std" , [0]*len(track))
-        # Measurements innovation
-        for i in range(len(obs)):
-            track.createAnalyticalFeature("kf_"+obs[i]+"_inov", [0]*len(track))
-            track.createAnalyticalFeature("kf_"+obs[i]+"_inov_std", [0]*len(track))
-        
-        # Matrices AF (gain and covariance matrix)
-        track.createAnalyticalFeature("kf_gain", [0]*len(track))
-        track.createAnalyticalFeature("kf_P", [0]*len(track))
+        N = len(track); n = self.X0.shape[0]; m = len(utils.listify(obs))
+        OUT_X = np.zeros((N, n)); OUT_P = np.zeros((N, n, n))
+        OUT_V = np.zeros((N, m)); OUT_S = np.zeros((N, m, m))
+        OUT_K = np.zeros((N, n, m)) if gains else None
+        if smooth:
+            PRED_X = np.zeros((N, n)); PRED_P = np.zeros((N, n, n)); CROSS = np.zeros((N, n, n))
 
         # Initialization
         W = self.__sampleSigmaWeights()  
+        LINEAR_F = self.__isLinear(self.F)
+        LINEAR_H = self.__isLinear(self.H)
+        F_T = self.F.transpose() if LINEAR_F else None
+        H_T = self.H.transpose() if LINEAR_H else None
+        OBS = np.column_stack([track.getAnalyticalFeatureArray(af) for af in utils.listify(obs)]).astype(float)
+        THRESHOLD = Stochastics.khi2cdf(m, self.control)
         
         X = self.X0
         P = self.P0
-        I = np.eye(P.shape[0], P.shape[1])
-        OUTPUT = []
         
-        EPOCHS = range(len(track))
+        EPOCHS = range(N)
         if verbose:
             EPOCHS = progressbar.progressbar(EPOCHS)
        
@@ -414,59 +399,197 @@ class Kalman:
 
             if not self.restart is None:
                 self.restart(X, P, track, k)
+            K = np.zeros((n, m))
+            z = OBS[k][:, np.newaxis]
 
             for step in range(self.iter):
 
-                SIGMA_PTS = self.__sampleSigmaPts(X, P)
+                if (step == 0 and not LINEAR_F) or (step > 0 and not LINEAR_H):
+                    SIGMA_PTS = self.__sampleSigmaPts(X, P)
                  
                 # Prediction step
                 if step == 0:
-                    SIGMA_PTS = self.__apply(self.F, SIGMA_PTS, k, track)
-                    MU = self.__mean(SIGMA_PTS, W)
-                    COV = self.__cov(SIGMA_PTS, W, MU) + self.getQ(k, track)
+                    if LINEAR_F:
+                        MU = self.F @ X
+                        CROSS_K = P @ F_T
+                        COV = self.F @ CROSS_K + self.getQ(k, track)
+                        if smooth:
+                            CROSS[k] = CROSS_K
+                    else:
+                        SIGMA_PRE = SIGMA_PTS
+                        SIGMA_PTS = self.__apply(self.F, SIGMA_PTS, k, track)
+                        MU = self.__mean(SIGMA_PTS, W)
+                        COV = self.__cov(SIGMA_PTS, W, MU) + self.getQ(k, track)
+                        if smooth:
+                            CROSS[k] = self.__cross_cov(SIGMA_PRE, SIGMA_PTS, W, None, MU)
+                    if smooth:
+                        PRED_X[k] = MU[:,0]; PRED_P[k] = COV
+                    X = MU; P = COV
+                    if not LINEAR_H:
+                        SIGMA_PTS = self.__sampleSigmaPts(X, P)
 
                 # Update step
-                SIGMA_PTS2 = self.__apply(self.H, SIGMA_PTS, k, track)
-                z = self.__getObs(track, obs, k, mode)
-                Z = self.__mean(SIGMA_PTS2, W)  
-                I = (np.array([z]).transpose()-Z)
-                S =  self.__cov(SIGMA_PTS2, W, Z) + self.getR(k, track)
+                if LINEAR_H:
+                    Z = self.H @ MU
+                    T = COV @ H_T
+                    S = self.H @ T + self.getR(k, track)
+                else:
+                    SIGMA_PTS2 = self.__apply(self.H, SIGMA_PTS, k, track)
+                    Z = self.__mean(SIGMA_PTS2, W)  
+                    S = self.__cov(SIGMA_PTS2, W, Z) + self.getR(k, track)
+                    T = self.__cross_cov(SIGMA_PTS, SIGMA_PTS2, W, MU, Z)
+                I = z - Z
+
+                # Whitening of innovation with Cholesky factor S = LL^T
+                L_INV = np.linalg.inv(np.linalg.cholesky(S))
+                U = L_INV @ I
             
                 # Innovation control
-                if Stochastics.khi2test(I, S, self.control):
+                if (U.transpose() @ U)[0,0] > THRESHOLD:
                     continue
 				
-                T = self.__cross_cov(SIGMA_PTS, SIGMA_PTS2, W, MU, Z)
-                K = T @ np.linalg.inv(S)
+                G = T @ L_INV.transpose()
+                K = G @ L_INV
                 
-                X = MU + K@I
-                P = COV - K@S@K.transpose()
+                X = MU + G@U
+                P = COV - G@G.transpose()
                 MU = X
                 COV = P
             
-            # Output states
-            for i in range(X.shape[0]):
-                track.setObsAnalyticalFeature(out[i], k, X[i,0])
-                track.setObsAnalyticalFeature(out[i]+"_std", k, math.sqrt(P[i,i]))
-
-            # Measurement innovations
-            for i in range(len(obs)):
-                track.setObsAnalyticalFeature("kf_"+obs[i]+"_inov", k, I[i])
-                track.setObsAnalyticalFeature("kf_"+obs[i]+"_inov_std", k, I[i]/S[i,i])
-
-            # Matrices AF
-            track.setObsAnalyticalFeature("kf_gain", k, K)
-            track.setObsAnalyticalFeature("kf_P", k, P)
-            
+            OUT_X[k] = X[:,0]; OUT_P[k] = P
+            OUT_V[k] = I[:,0]; OUT_S[k] = S
+            if gains:
+                OUT_K[k] = K
+
+        # Rauch-Tung-Striebel smoother
+        if smooth:
+            for k in range(N-2, -1, -1):
+                G = np.linalg.solve(PRED_P[k+1], CROSS[k+1].transpose()).transpose()
+                OUT_X[k] = OUT_X[k] + G @ (OUT_X[k+1] - PRED_X[k+1])
+                OUT_P[k] = OUT_P[k] + G @ (OUT_P[k+1] - PRED_P[k+1]) @ G.transpose()
+
+        return OUT_X, OUT_P, OUT_V, OUT_S, OUT_K
+
+    # ------------------------------------------------------------
+    # Internal function to record estimation output in track AF
+    # (only AF names listed in store, all if store is None)
+    # ------------------------------------------------------------
+    def __record(self, track, obs, out, mode, store, OUTPUT):
+
+        (X, P, V, S, K) = OUTPUT
+        obs = utils.listify(obs)
+        RECORDS = []
+
+        # Output states and std values
+        for i in range(X.shape[1]):
+            RECORDS.append((out[i], X[:,i]))
+            RECORDS.append((out[i]+"_std", np.sqrt(P[:,i,i])))
+
+        # Measurement innovations
+        for i in range(len(obs)):
+            RECORDS.append(("kf_"+obs[i]+"_inov", V[:,i]))
+            RECORDS.append(("kf_"+obs[i]+"_inov_std", np.sqrt(S[:,i,i])))
+
+        # Matrices AF (gain and covariance matrix)
+        if not K is None:
+            RECORDS.append(("kf_gain", list(K)))
+        RECORDS.append(("kf_P", list(P)))
+
+        for (name, values) in RECORDS:
+            if (store is None) or (name in store):
+                track.setAnalyticalFeature(name, values)
+
         # MODE_STATES_AS_XX_POSITIONS
-        if mode == MODE_STATES_AS_2D_POSITIONS:
-            track.setXFromAnalyticalFeature(out[0])
-            track.setYFromAnalyticalFeature(out[1])
-        if mode == MODE_STATES_AS_3D_POSITIONS:
-            track.setXFromAnalyticalFeature(out[0])
-            track.setYFromAnalyticalFeature(out[1])
-            track.setZFromAnalyticalFeature(out[2])
-        
+        if mode in [MODE_STATES_AS_2D_POSITIONS, MODE_STATES_AS_3D_POSITIONS]:
+            for k in range(len(track)):
+                track[k].position.setX(X[k,0])
+                track[k].position.setY(X[k,1])
+                if mode == MODE_STATES_AS_3D_POSITIONS:
+                    track[k].position.setZ(X[k,2])
+
+    def __outputNames(self, out):
+        out = list(out)
+        for i in range(len(out), self.X0.shape[0]):
+            out.append("kf_"+str(i))
+        return out
+
+    # ------------------------------------------------------------
+    # Main function of Kalman object, to estimate the states
+    # Inputs:
+    #   - track: the track on which estimation is performed
+    #   - obs: the name of an analytical feature (may also a list 
+    #     of analytical feature names for multi-dimensional input)
+    #     All the analytical features listed must be in the track
+    #   - out: names of estimated fields as recorded in AF
+    #   - mode: to specify how output states are used
+    #        - MODE_STATES_AS_2D_POSITIONS: the first two 
+    #          fields of  output are used to make a Coords object 
+    #        - MODE_STATES_AS_2D_POSITIONS: the first three 
+    #          fields of  output are used to make a Coords object
+    #     For MODE_STATES_AS_XX_POSITIONS modes, coordinates SRID
+    #      is the same as track SRID.
+    #   - smooth: if True, filtered states are smoothed with a 
+    #     backward Rauch-Tung-Striebel pass, so that each state 
+    #     is estimated with all observations of the track
+    #   - store: list of AF names to record in track (all AF 
+    #     described below if None, no AF if empty list)
+    # ------------------------------------------------------------
+    # Estimated parameters are registered in AF listed in out 
+    # and ("kf_0", "kf_1",..., "kf_n" otherwise if not provided),
+    # with standard deviations in "<name>_std" AF, and innovation
+    # of each observation in "kf_<obs>_inov" and "kf_<obs>_inov_std".
+    # Kalman gain matrix is saved at each epoch in "kf_gain" AF
+    # Posterior covariance matrix Pk|k is saved in "kf_P" AF. It 
+    # may be used as it is to plot 2D error ellipses, provided 
+    # that first two states are x and y coordinates. 
+    # Returns estimated states [N x n] and covariances [N x n x n]
+    # arrays.
+    # ------------------------------------------------------------
+    def estimate(self, track, obs, out=[], mode=-1, verbose=True, smooth=False, store=None):
+
+        gains = (store is None) or ("kf_gain" in store)
+        OUTPUT = self.process(track, obs, mode, smooth, gains, verbose)
+        self.__record(track, obs, self.__outputNames(out), mode, store, OUTPUT)
+        return OUTPUT[0], OUTPUT[1]
+
+    # ------------------------------------------------------------
+    # Runs estimate function (with the same parameters) on all 
+    # tracks of a collection. Tracks are dispatched over a pool
+    # of processes if workers > 1 (model functions must then be 
+    # picklable, or processes forked). Returns the list of 
+    # (states, covariances) arrays of each track.
+    # ------------------------------------------------------------
+    def estimateOnCollection(self, collection, obs, out=[], mode=-1, verbose=True, smooth=False, store=None, workers=1):
+
+        gains = (store is None) or ("kf_gain" in store)
+        TASKS = [(track, obs, mode, smooth, gains) for track in collection]
+
+        if workers > 1:
+            chunksize = max(1, len(TASKS) // (4*workers))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initKalmanWorker, 
+                                     initargs=(self,)) as pool:
+                OUTPUTS = pool.map(_kalmanWorker, TASKS, chunksize=chunksize)
+                if verbose:
+                    OUTPUTS = progressbar.progressbar(OUTPUTS, max_value=len(TASKS))
+                OUTPUTS = list(OUTPUTS)
+        else:
+            if verbose:
+                TASKS = progressbar.progressbar(TASKS)
+            OUTPUTS = [self.process(*task) for task in TASKS]
+
+        for (track, OUTPUT) in zip(collection, OUTPUTS):
+            self.__record(track, obs, self.__outputNames(out), mode, store, OUTPUT)
+        return [(OUTPUT[0], OUTPUT[1]) for OUTPUT in OUTPUTS]
+
+
+_WORKER_MODEL = None
+
+def _initKalmanWorker(model):
+    global _WORKER_MODEL
+    _WORKER_MODEL = model
+
+def _kalmanWorker(task):
+    return _WORKER_MODEL.process(*task)
 
 # -------------------------------------------------------
 # Hidden Markov Model is designed to estimate discrete 
@@ -495,6 +618,14 @@ class Kalman:
 # 2-valued and 2-valued (respectively), if the boolean 
 # member value "stationarity" is set to True.
 # log: set to True if Q and P are already log values
+# For faster decoding, Q and P may be completed (or replaced)
+# with vectorized versions, evaluating all states at once:
+#    - QM(S1,S2,k,t) returns a [n1 x n2] numpy array with 
+#      transition probabilities between each state of S1 
+#      (epoch k) and each state of S2 (epoch k+1)
+#    - PM(S,y,k,t) returns a [n] numpy array with the 
+#      probabilities to observe y for each state of S
+# with the same log convention as Q and P. 
 # -------------------------------------------------------
 class HMM:
 
@@ -502,6 +633,8 @@ class HMM:
         self.S = S
         self.P = P
         self.Q = Q
+        self.QM = None
+        self.PM = None
         self.log = log
         self.stationarity = stationarity
 
@@ -520,6 +653,12 @@ class HMM:
     def setTransitionModel(self, Q):
         self.Q = Q   
 
+    def setTransitionMatrix(self, QM):
+        self.QM = QM
+
+    def setObservationVector(self, PM):
+        self.PM = PM
+
     def Qlog(self, s1, s2, k, track):
         q = self.Q(s1, s2, k, track)
         if not (self.log):
@@ -532,6 +671,28 @@ class HMM:
             p = math.log(p + 1e-300)
         return p     
 
+    # ------------------------------------------------------------
+    # Log-transition matrix between states S1 (epoch k) and S2 
+    # (epoch k+1) and log-observation vector of y on states S. 
+    # Evaluated element-wise with Q and P when vectorized models 
+    # QM and PM are not provided.
+    # ------------------------------------------------------------
+    def QlogMatrix(self, S1, S2, k, track):
+        if self.QM is None:
+            return np.array([[self.Qlog(s1, s2, k, track) for s2 in S2] for s1 in S1], dtype=float).reshape(len(S1), len(S2))
+        q = np.asarray(self.QM(S1, S2, k, track), dtype=float)
+        if not (self.log):
+            q = np.log(q + 1e-300)
+        return q
+
+    def PlogVector(self, S, y, k, track):
+        if self.PM is None:
+            return np.array([self.Plog(s, y, k, track) for s in S], dtype=float)
+        p = np.asarray(self.PM(S, y, k, track), dtype=float)
+        if not (self.log):
+            p = np.log(p + 1e-300)
+        return p
+
     # ------------------------------------------------------------
     # Internal function to get all observations at epoch k in a 
     # track, from a list of analytical feature names (obs) and a
@@ -591,6 +752,12 @@ class HMM:
     #          of obs are used to make a Coords object
     #     For MODE_OBS_AS_2D_POSITIONS / MODE_OBS_AS_3D_POSITIONS
     #     modes, coordinates SRID is the same as track SRID.
+    # Viterbi algorithm: at each epoch, costs of all transitions 
+    # are gathered in a matrix and minimized over previous states
+    # (column-wise). Only optimal predecessors are stored, in an
+    # integer array per epoch, until backward reconstruction. If 
+    # model is stationary, states are computed once, as well as 
+    # transition cost matrix, which is reused at every epoch.
     # ------------------------------------------------------------
     def estimate(self, track, obs, log=False, mode=MODE_OBS_AS_SCALAR, verbose=MODE_VERBOSE_PROGRESS_BY_EPOCH):
         
@@ -601,25 +768,21 @@ class HMM:
             
         N = len(track); STATES = []
         for k in range(N):
+            if self.stationarity and (k > 0):
+                STATES.append(STATES[0])
+                continue
             STATES.append(self.S(track, k))
-            
-        TAB_MRK = []; TAB_VAL = []; 
-        
-        self.printTrace("Cost and marker matrix initialization", [1,2,3], verbose)
-        
-        for k in range(N):
-            TAB_MRK.append([0]*len(STATES[k]))
-            TAB_VAL.append([0]*len(STATES[k]))
-             
+
         self.printTrace("Compilation of observations on track", [1,2,3], verbose)
 
         OBS = []
         for k in range(N):
             OBS.append(self.__getObs(track, obs, k, mode))
    
-        for l in range(len(TAB_MRK[0])):
-            TAB_MRK[0][l] = -1
-            TAB_VAL[0][l] =  -self.Plog(STATES[0][l],OBS[0],0,track)
+        self.printTrace("Cost and marker matrix initialization", [1,2,3], verbose)
+
+        TAB_MRK = [np.full(len(STATES[0]), -1, dtype=np.int32)]
+        TAB_VAL = [-self.PlogVector(STATES[0], OBS[0], 0, track)]
     
         # -----------------------------------------------
         # Forward step
@@ -629,46 +792,34 @@ class HMM:
         EPOCHS = range(1, N)
         if verbose == MODE_VERBOSE_PROGRESS:
             EPOCHS = progressbar.progressbar(EPOCHS)
+        COST = None
         for k in EPOCHS:
 
             y  = OBS[k]
-            STATES_TO_TEST = range(len(TAB_MRK[k]))
 
-            message = "Epoch "+str(k+1)+"/"+str((len(TAB_MRK)))+" ("+str(len(TAB_MRK[k]))+" states)"
+            message = "Epoch "+str(k+1)+"/"+str(N)+" ("+str(len(STATES[k]))+" states)"
             self.printTrace(message, [1,3], verbose)
 
-            if (verbose == MODE_VERBOSE_PROGRESS_BY_EPOCH):
-                STATES_TO_TEST = progressbar.progressbar(STATES_TO_TEST)
-
-            for l in STATES_TO_TEST:
-
-                best_val = 1e300
-                best_ant = 0
-                s2 = STATES[k][l]
-
-                for m in range(len(TAB_MRK[k-1])):
-
-                    s1 = STATES[k-1][m]
-                    q = -self.Qlog(s1,s2,k-1,track)
-                    val  = q + TAB_VAL[k-1][m]
-
-                    message  = "State "+str(l)+"/"+str(k-1)+" "+str(s1)+" --> " 
-                    message += "state "+str(m)+"/"+str(k)  +" "+str(s2) 
-                    message += " TRANSITION COST = " + str(q)
+            # Transition costs [previous states x states]
+            if not (self.stationarity and (COST is not None)):
+                COST = -self.QlogMatrix(STATES[k-1], STATES[k], k-1, track)
+            VAL = COST + TAB_VAL[k-1][:, np.newaxis]
+            MRK = np.argmin(VAL, axis=0).astype(np.int32)
+            p = -self.PlogVector(STATES[k], y, k, track)
+            TAB_MRK.append(MRK)
+            TAB_VAL.append(VAL[MRK, np.arange(len(MRK))] + p)
+
+            if verbose == MODE_VERBOSE_ALL:
+                for l in range(len(STATES[k])):
+                    for m in range(len(STATES[k-1])):
+                        message  = "State "+str(m)+"/"+str(k-1)+" "+str(STATES[k-1][m])+" --> " 
+                        message += "state "+str(l)+"/"+str(k)  +" "+str(STATES[k][l]) 
+                        message += " TRANSITION COST = " + str(COST[m,l])
+                        self.printTrace(message, [1], verbose)
+                    message  = "State "+str(l)+"/"+str(k)+" "+str(STATES[k][l])+" to "
+                    message += str(y)+"  OBS COST = "+str(p[l])
                     self.printTrace(message, [1], verbose)
-
-                    if val < best_val:
-                        best_val = val
-                        best_ant = m
-
-                p = -self.Plog(s2,y,k,track)
-                TAB_MRK[k][l] = best_ant
-                TAB_VAL[k][l] = best_val + p
-
-                message  = "State "+str(l)+"/"+str(k-1)+" "+str(s1)+" to "
-                message += str(y)+"  OBS COST = "+str(p)
-                self.printTrace(message, [1], verbose)
-                self.printSeparator([1], verbose, 0)
+                    self.printSeparator([1], verbose, 0)
 
             self.printSeparator([1], verbose, 1)    
         
@@ -678,13 +829,11 @@ class HMM:
         self.printTrace("Backward reconstruction phase", [1,2,3], verbose) 
         track.createAnalyticalFeature("hmm_inference")
         track.createAnalyticalFeature("hmm_cost")
-        idk = np.argmin(TAB_VAL[-1])
+        idk = int(np.argmin(TAB_VAL[-1]))
         for k in range(N-1,-1,-1):
             self.printTrace("Step "+str(k)+": state "+str(idk)+" (cost: "+str(TAB_VAL[k][idk])+")", [1], verbose)
             track.setObsAnalyticalFeature("hmm_inference", k, STATES[k][idk])
-            track.setObsAnalyticalFeature("hmm_cost", k, TAB_VAL[k][idk])
+            track.setObsAnalyticalFeature("hmm_cost", k, float(TAB_VAL[k][idk]))
             if mode in [3,4,5]:
                 track[k].position = STATES[k][idk]
-            idk = TAB_MRK[k][idk]
-
-        self.printSeparator([1], verbose, 1)  
\ No newline at end of file
+            idk = int(TAB_MRK[k][idk])
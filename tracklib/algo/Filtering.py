@@ -29,6 +29,7 @@ KALMAN_COMBINED = 2
 # -----------------------------------------
 sig = 0
 res = 0
+spd = None
 # -----------------------------------------
 
 # --------------------------------------------------------------------------
@@ -62,10 +63,14 @@ def KLFiltering(track):
 #    - sigma: Positional standard deviation (in ground units)
 #    - speed: standard deviation of speed
 #    - speed_af: AF field containing speeds (optional)
-#    - mode : forward, backward or combined
+#    - mode : forward, backward or combined (forward filter followed 
+#      by Rauch-Tung-Striebel smoothing)
 # Important: tracks are assumed to be sampled at constant time frequency
+# Estimated states and their standard deviations are recorded in kf_0, 
+# kf_1... and kf_0_std, kf_1_std... AF, and covariance matrices in kf_P 
+# AF (Kalman gain matrices are not recorded). 
 # --------------------------------------------------------------------------
-def __kalman(track, sigma, speed_std, speed_af=None, verbose=True):
+def __kalman(track, sigma, speed_std, speed_af=None, verbose=True, smooth=False):
 
     track = track.copy()
     dt = abs(track.frequency())
@@ -75,7 +80,7 @@ def __kalman(track, sigma, speed_std, speed_af=None, verbose=True):
 	# -----------------------------------------------------
     if not (speed_af is None):
 
-        F = lambda x: Dynamics.DYN_MAT_2D_CST_SPEED(dt) @ x      
+        F = Dynamics.DYN_MAT_2D_CST_SPEED(dt)
         H = lambda x: np.array([[x[0,0]], [x[1,0]], [(x[2,0]**2 + x[3,0]**2)**0.5]])           
         
         Q = np.eye(4,4); Q[2,2] = 0; Q[3,3] = 0
@@ -88,15 +93,15 @@ def __kalman(track, sigma, speed_std, speed_af=None, verbose=True):
         UKF.setObservation(H, R)                        
         UKF.setInitState(X0, P0)  
 
-        UKF.estimate(track, ["x", "y", speed_af], verbose=verbose) 
+        OBS = ["x", "y", speed_af]
 		
 	# -----------------------------------------------------
 	# Mode prior information on speed based on std value
 	# -----------------------------------------------------
     else:
 
-        F = lambda x: x                                 # Transition model
-        H = lambda x: np.array([[x[0,0]],[x[1,0]]])     # Observation model
+        F = np.eye(2,2)                                 # Transition model
+        H = np.eye(2,2)                                 # Observation model
         
         Q = (dt*speed_std)**2*np.eye(2,2)               # Transition covariance
         R = sigma**2*np.eye(2,2)                        # Observation covariance
@@ -110,11 +115,11 @@ def __kalman(track, sigma, speed_std, speed_af=None, verbose=True):
         UKF.setObservation(H, R)                        # Observation model
         UKF.setInitState(X0, P0)                        # Initialization
         
-        UKF.estimate(track, ["x", "y"], verbose=verbose)              
+        OBS = ["x", "y"]
     
-    for i in range(len(track)):
-        track[i].position.setX(track.getObsAnalyticalFeature("kf_0", i))
-        track[i].position.setY(track.getObsAnalyticalFeature("kf_1", i))
+    STORE = ["kf_"+str(i) for i in range(X0.shape[0])] + ["kf_"+str(i)+"_std" for i in range(X0.shape[0])]
+    STORE += ["kf_"+obs+"_inov" for obs in OBS] + ["kf_"+obs+"_inov_std" for obs in OBS] + ["kf_P"]
+    UKF.estimate(track, OBS, mode=Dynamics.MODE_STATES_AS_2D_POSITIONS, verbose=verbose, smooth=smooth, store=STORE)
   
     return track	
 
@@ -124,14 +129,7 @@ def Kalman(track, sigma, speed_std, speed_af=None, mode=KALMAN_FORWARD, verbose=
     if mode == KALMAN_BACKWARD:  
        return __kalman(track.reverse(), sigma, speed_std, speed_af, verbose).reverse()
     if mode == KALMAN_COMBINED:
-        track_fwd = Kalman(track, sigma, speed_std, speed_af, mode=KALMAN_FORWARD,  verbose=verbose)
-        track_bwd = Kalman(track, sigma, speed_std, speed_af, mode=KALMAN_BACKWARD, verbose=verbose)
-        for k in range(len(track_fwd)):
-            x_fusion = 0.5*track_fwd[k].position.getX() + 0.5*track_bwd[k].position.getX()
-            y_fusion = 0.5*track_fwd[k].position.getY() + 0.5*track_bwd[k].position.getY()
-            track_fwd[k].position.setX(x_fusion)
-            track_fwd[k].position.setY(y_fusion)
-        return track_fwd
+        return __kalman(track, sigma, speed_std, speed_af, verbose, smooth=True)
 	
 # --------------------------------------------------------------------------
 # Filtering with Markov process based on speed regularization
@@ -153,6 +151,11 @@ def Kalman(track, sigma, speed_std, speed_af=None, mode=KALMAN_FORWARD, verbose=
 #      positional standrad deviation (in ground units). So, for a typical 
 #      (standard positioning) GPS receiver with 3 m error, a search grid 
 #      resolution of 1 m provides a thin modelization.    
+# States form the same grid (centered on observed position) at each epoch,
+# hence displacements between states of two successive epochs only depend 
+# on the offset between their grid cells. Speed function is evaluated once 
+# per offset (i.e. O(n) times per epoch) and transition matrices are then 
+# filled by indexing.
 # --------------------------------------------------------------------------
 def __Markov_S(track, i):
     etats = []
@@ -166,15 +169,40 @@ def __Markov_S(track, i):
 	
 def __Markov_Plog(pi, y, k, track):
     return -(pi.distance2DTo(y)/20)**2
+
+def __Markov_Qlog(s1, s2, k, track):
+    dt = track[k+1].timestamp - track[k].timestamp
+    return np.log(spd(s1.distance2DTo(s2)/dt, k, track) + 1e-300)
+
+def __Markov_PlogVector(S, y, k, track):
+    X = np.array([s.getX() for s in S]) - y.getX()
+    Y = np.array([s.getY() for s in S]) - y.getY()
+    return -(np.sqrt(X**2 + Y**2)/20)**2
+
+def __Markov_QlogMatrix(S1, S2, k, track):
+    N = int(2*sig/res)+1
+    dt = track[k+1].timestamp - track[k].timestamp
+    dx = track[k+1].position.getX() - track[k].position.getX()
+    dy = track[k+1].position.getY() - track[k].position.getY()
+    OFFSETS = res*np.arange(-2*N, 2*N+1)
+    V = np.sqrt((dx + OFFSETS[:,np.newaxis])**2 + (dy + OFFSETS[np.newaxis,:])**2)/dt
+    F = np.array([[spd(v, k, track) for v in row] for row in V])
+    KX = np.repeat(np.arange(-N, N+1), 2*N+1)
+    KY = np.tile(np.arange(-N, N+1), 2*N+1)
+    F = F[KX[np.newaxis,:] - KX[:,np.newaxis] + 2*N, KY[np.newaxis,:] - KY[:,np.newaxis] + 2*N]
+    return np.log(F + 1e-300)
 	
 def MarkovRegularization(track, sigma, speed, resolution):
-    global res, sig
+    global res, sig, spd
     sig = sigma
     res = resolution
+    spd = speed
     model = Dynamics.HMM()
     model.setStates(__Markov_S)
-    model.setTransitionModel(speed)
+    model.setTransitionModel(__Markov_Qlog)
     model.setObservationModel(__Markov_Plog)
+    model.setTransitionMatrix(__Markov_QlogMatrix)
+    model.setObservationVector(__Markov_PlogVector)
     model.setLog(True)
     model.estimate(track, obs=["x","y","z"], mode=Dynamics.MODE_OBS_AND_STATES_AS_3D_POSITIONS)
 
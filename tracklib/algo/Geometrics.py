@@ -25,6 +25,9 @@ MODE_ENCLOSING_MBR = 1
 MODE_ENCLOSING_CIRCLE = 2
 MODE_ENCLOSING_CONVEX = 3
 
+__GRID_MAX_CELLS = 1e6    # Max number of cells along x or y
+__GRID_MAX_SPAN = 16      # Max number of cells covered by a short segment
+
 
 class Circle:
 
@@ -265,6 +268,109 @@ def isSegmentIntersects(segment1, segment2):
     return (val1 <= 0) & (val2 <= 0)
     
  
+# ----------------------------------------
+# Intersections between two sets of 
+# segments, given as arrays of rows 
+# [x1, y1, x2, y2]. Candidate pairs are
+# found with a grid whose cell size is 
+# about the median segment extent (long
+# segments are tested against all bboxes)
+# and then filtered with bbox overlaps 
+# and orientation tests (same as in 
+# isSegmentIntersects), all vectorized.
+# Returns indices (I, J) of intersecting
+# pairs, sorted by I and then by J.
+# ----------------------------------------
+def segmentsIntersections(segments1, segments2):
+    
+    S1 = np.asarray(segments1, dtype=float).reshape(-1, 4)
+    S2 = np.asarray(segments2, dtype=float).reshape(-1, 4)
+    empty = np.zeros(0, dtype=np.int64)
+    
+    B1 = __bboxes(S1)
+    B2 = __bboxes(S2)
+    V1 = np.nonzero(np.all(np.isfinite(S1), axis=1))[0]
+    V2 = np.nonzero(np.all(np.isfinite(S2), axis=1))[0]
+    if (len(V1) == 0) or (len(V2) == 0):
+        return empty, empty
+    
+    # Grid parameters
+    E = np.concatenate((B1[V1,2:4]-B1[V1,0:2], B2[V2,2:4]-B2[V2,0:2]))
+    size = np.median(np.max(E, axis=1))
+    x0 = min(np.min(B1[V1,0]), np.min(B2[V2,0]))
+    y0 = min(np.min(B1[V1,1]), np.min(B2[V2,1]))
+    x1 = max(np.max(B1[V1,2]), np.max(B2[V2,2]))
+    y1 = max(np.max(B1[V1,3]), np.max(B2[V2,3]))
+    size = max(size, max(x1-x0, y1-y0)/__GRID_MAX_CELLS, 1e-9)
+    ny = int((y1-y0)/size) + 1
+    
+    # Cells covered by (short) segments
+    C1, L1 = __gridCells(B1[V1], x0, y0, size, ny)
+    C2, L2 = __gridCells(B2[V2], x0, y0, size, ny)
+    order = np.argsort(C2[1], kind="stable")
+    keys = C2[1][order]
+    lo = np.searchsorted(keys, C1[1], side="left")
+    nb = np.searchsorted(keys, C1[1], side="right") - lo
+    I = [np.repeat(V1[C1[0]], nb)]
+    k = np.arange(np.sum(nb)) - np.repeat(np.cumsum(nb)-nb, nb) + np.repeat(lo, nb)
+    J = [V2[C2[0][order[k]]]]
+    
+    # Long segments against all segments
+    for i in V1[L1]:
+        I.append(np.full(len(V2), i)); J.append(V2)
+    for j in V2[L2]:
+        I.append(V1); J.append(np.full(len(V1), j))
+    I = np.concatenate(I).astype(np.int64)
+    J = np.concatenate(J).astype(np.int64)
+    
+    # Unique candidates and bbox filtering
+    code = np.unique(I*len(S2) + J)
+    I = code // len(S2)
+    J = code % len(S2)
+    keep  = (B1[I,0] <= B2[J,2]) & (B2[J,0] <= B1[I,2])
+    keep &= (B1[I,1] <= B2[J,3]) & (B2[J,1] <= B1[I,3])
+    I = I[keep]; J = J[keep]
+    
+    # Orientation tests
+    P1 = S1[I]; P2 = S2[J]
+    a1 = P1[:,3] - P1[:,1]; b1 = P1[:,0] - P1[:,2]; c1 = -(a1*P1[:,0] + b1*P1[:,1])
+    a2 = P2[:,3] - P2[:,1]; b2 = P2[:,0] - P2[:,2]; c2 = -(a2*P2[:,0] + b2*P2[:,1])
+    val1 = (a1*P2[:,0] + b1*P2[:,1] + c1)*(a1*P2[:,2] + b1*P2[:,3] + c1)
+    val2 = (a2*P1[:,0] + b2*P1[:,1] + c2)*(a2*P1[:,2] + b2*P1[:,3] + c2)
+    keep = (val1 <= 0) & (val2 <= 0)
+    
+    return I[keep], J[keep]
+
+# ----------------------------------------
+# Segments of a track as [x1, y1, x2, y2]
+# ----------------------------------------
+def trackSegments(track):
+    X = track.getAnalyticalFeatureArray("x").astype(float)
+    Y = track.getAnalyticalFeatureArray("y").astype(float)
+    return np.column_stack((X[:-1], Y[:-1], X[1:], Y[1:]))
+    
+def __bboxes(S):
+    return np.column_stack((np.minimum(S[:,0], S[:,2]), np.minimum(S[:,1], S[:,3]), 
+                            np.maximum(S[:,0], S[:,2]), np.maximum(S[:,1], S[:,3])))
+
+# ----------------------------------------
+# Grid cells covered by bboxes B. Returns
+# (indices, cell keys) of short segments
+# and the mask of long segments (covering
+# more than __GRID_MAX_SPAN cells)
+# ----------------------------------------
+def __gridCells(B, x0, y0, size, ny):
+    cx0 = ((B[:,0]-x0)/size).astype(np.int64)
+    cy0 = ((B[:,1]-y0)/size).astype(np.int64)
+    w = ((B[:,2]-x0)/size).astype(np.int64) - cx0 + 1
+    h = ((B[:,3]-y0)/size).astype(np.int64) - cy0 + 1
+    big = w*h > __GRID_MAX_SPAN
+    n = np.where(big, 0, w*h)
+    idx = np.repeat(np.arange(len(B)), n)
+    k = np.arange(np.sum(n)) - np.repeat(np.cumsum(n)-n, n)
+    keys = (cx0[idx] + k % w[idx])*ny + cy0[idx] + k // w[idx]
+    return (idx, keys), big
+
 # ----------------------------------------
 # Intersection between 2 tracks
 # withTime: time constraint (in secs)
@@ -281,57 +387,46 @@ def intersection(track1, track2, withTime=-1):
     TMP_J = []
     TMP_TPS2 = []
     
-    for i in range(len(track1)-1):
+    T1 = track1.getT()
+    T2 = track2.getT()
     
-        x11 = track1[i].position.getX()
-        y11 = track1[i].position.getY()
-        x12 = track1[i+1].position.getX()
-        y12 = track1[i+1].position.getY()
-        seg1 = [x11,y11,x12,y12]
+    S1 = trackSegments(track1)
+    S2 = trackSegments(track2)
+    IDX1, IDX2 = segmentsIntersections(S1, S2)
     
-        for j in range(len(track2)-1):
-            
-            x21 = track2[j].position.getX()
-            y21 = track2[j].position.getY()
-            x22 = track2[j+1].position.getX()
-            y22 = track2[j+1].position.getY()
-            seg2 = [x21,y21,x22,y22]
+    for i, j in zip(IDX1.tolist(), IDX2.tolist()):
+    
+        P1 = __cartesienne(S1[i].tolist())
+        P2 = __cartesienne(S2[j].tolist())
+        det = P1[0]*P2[1] - P1[1]*P2[0]
+        if det == 0:
+            continue
             
-            if (isSegmentIntersects(seg1, seg2)):
-                P1 = __cartesienne(seg1)
-                P2 = __cartesienne(seg2)
-                A = np.zeros((2,2))
-                B = np.zeros((2,1))
-                A[0,0] = P1[0]; A[0,1] = P1[1]; B[0,0] = -P1[2]
-                A[1,0] = P2[0]; A[1,1] = P2[1]; B[1,0] = -P2[2]
+        x = (P1[1]*P2[2] - P1[2]*P2[1])/det
+        y = (P1[2]*P2[0] - P1[0]*P2[2])/det
+        p = Utils.makeCoords(x, y, 0, track1.getSRID())
                 
-                X = np.linalg.solve(A,B)
+        # Linear interpolation on track 1
+        w1 = p.distance2DTo(track1[i].position)
+        w2 = p.distance2DTo(track1[i+1].position)
+        p.setZ((w1*track1[i+1].position.getZ() + w2*track1[i].position.getZ())/(w1+w2))
+        t1 = T1[i]
+        t2 = T1[i+1]
+        ta = (w1*t2 + w2*t1)/(w1+w2)
                 
-                x = X[0,0]
-                y = X[1,0]
-                p = Utils.makeCoords(x, y, 0, track1.getSRID())
+        # Linear interpolation on track 2
+        w1 = p.distance2DTo(track2[j].position)
+        w2 = p.distance2DTo(track2[j+1].position)
+        t1 = T2[j]
+        t2 = T2[j+1]
+        tb = (w1*t2 + w2*t1)/(w1+w2)
                 
-                # Linear interpolation on track 1
-                w1 = p.distance2DTo(track1[i].position)
-                w2 = p.distance2DTo(track1[i+1].position)
-                p.setZ((w1*track1[i+1].position.getZ() + w2*track1[i].position.getZ())/(w1+w2))
-                t1 = track1[i].timestamp.toAbsTime()
-                t2 = track1[i].timestamp.toAbsTime()
-                ta = (w1*t2 + w2*t1)/(w1+w2)
-                
-                # Linear interpolation on track 2
-                w1 = p.distance2DTo(track2[j].position)
-                w2 = p.distance2DTo(track2[j+1].position)
-                t1 = track2[i].timestamp.toAbsTime()
-                t2 = track2[i].timestamp.toAbsTime()
-                tb = (w1*t2 + w2*t1)/(w1+w2)
-                
-                # Add intersection
-                if ((withTime==-1) or (abs(tb-ta) < withTime)):
-                    I.addObs(Obs(p, GPSTime.readUnixTime(ta)))
-                    TMP_TPS2.append(GPSTime.readUnixTime(tb))
-                    TMP_I.append(i)
-                    TMP_J.append(j)
+        # Add intersection
+        if ((withTime==-1) or (abs(tb-ta) < withTime)):
+            I.addObs(Obs(p, GPSTime.readUnixTime(ta)))
+            TMP_TPS2.append(GPSTime.readUnixTime(tb))
+            TMP_I.append(i)
+            TMP_J.append(j)
                 
     if I.size() > 0:
         I.createAnalyticalFeature("timestamp2", TMP_TPS2);
@@ -344,27 +439,8 @@ def intersection(track1, track2, withTime=-1):
 # Intersection between 2 tracks (boolean)
 # ---------------------------------------- 
 def intersects(track1, track2):
-
-    for i in range(len(track1)-1):
-    
-        x11 = track1[i].position.getX()
-        y11 = track1[i].position.getY()
-        x12 = track1[i+1].position.getX()
-        y12 = track1[i+1].position.getY()
-        seg1 = [x11,y11,x12,y12]
-    
-        for j in range(len(track2)-1):
-            
-            x21 = track2[j].position.getX()
-            y21 = track2[j].position.getY()
-            x22 = track2[j+1].position.getX()
-            y22 = track2[j+1].position.getY()
-            seg2 = [x21,y21,x22,y22]
-            
-            if isSegmentIntersects(seg1, seg2):
-                return True
-                
-    return False
+    I, J = segmentsIntersections(trackSegments(track1), trackSegments(track2))
+    return len(I) > 0
    
 def __dist_point_droite(param, x, y):
     
@@ -11,6 +11,7 @@ from tracklib.core.Obs import Obs
 from tracklib.core.Track import Track
 from tracklib.core.Coords import ENUCoords
 from tracklib.core.GPSTime import GPSTime
+from tracklib.core.ObsTable import ObsTable
 
 MODE_SPATIAL = 1
 MODE_TEMPORAL = 2
@@ -78,43 +79,33 @@ def __resampleSpatial(track, ds):
 	'''Resampling of a track with linear interpolation
 	ds: curv abs interval (in m) between two samples'''
 	
-	S = [0]
-	for i in range(1,track.size()):
-		dl = track.getObs(i-1).position.distance2DTo(track.getObs(i).position)
-		S.append(S[i-1] + dl)
+	S = track.cumulativeLength()
 	
 	sini = S[0]
 	sfin = S[len(S)-1]
 	N = (int)((sfin-sini)/ds)
 	
-	interp_points = [track.getFirstObs()]
-	running_id = 0
+	# Interpolation indices and weights for all samples at once
+	s = np.arange(1, N+1)*ds + sini
+	fwd = np.minimum(np.searchsorted(S, s, side='left'), len(S)-1)
+	bwd = fwd-1
+	sbwd = S[bwd]
+	sfwd = S[fwd]
 	
-	for k in range(1,N+1):
+	wbwd = (sfwd-s)/(sfwd-sbwd)
+	wfwd = (s-sbwd)/(sfwd-sbwd)
 	
-		s = k*ds + sini
-		
-		while (S[running_id] < s):
-			running_id += 1
-		
-		pt_bwd = track.getObs(running_id-1)
-		pt_fwd = track.getObs(running_id)
-		sbwd = S[running_id-1]
-		sfwd = S[running_id]
-		
-		wbwd = (sfwd-s)/(sfwd-sbwd)
-		wfwd = (s-sbwd)/(sfwd-sbwd)
-		
-		X = wbwd*pt_bwd.position.getX() + wfwd*pt_fwd.position.getX()
-		Y = wbwd*pt_bwd.position.getY() + wfwd*pt_fwd.position.getY()
-		Z = wbwd*pt_bwd.position.getZ() + wfwd*pt_fwd.position.getZ()
-		T = wbwd*pt_bwd.timestamp.toAbsTime() + wfwd*pt_fwd.timestamp.toAbsTime()
-		
-		pi = Obs(ENUCoords(X,Y,Z), GPSTime.readUnixTime(T))
-		
-		interp_points.append(pi)
-		
-	track.setObsList(interp_points)
+	X = wbwd*track.getAnalyticalFeatureArray("x")[bwd] + wfwd*track.getAnalyticalFeatureArray("x")[fwd]
+	Y = wbwd*track.getAnalyticalFeatureArray("y")[bwd] + wfwd*track.getAnalyticalFeatureArray("y")[fwd]
+	Z = wbwd*track.getAnalyticalFeatureArray("z")[bwd] + wfwd*track.getAnalyticalFeatureArray("z")[fwd]
+	T = wbwd*track.getAnalyticalFeatureArray("t")[bwd] + wfwd*track.getAnalyticalFeatureArray("t")[fwd]
+	
+	X = np.concatenate(([track.getX(0)], X))
+	Y = np.concatenate(([track.getY(0)], Y))
+	Z = np.concatenate(([track.getZ(0)], Z))
+	T = np.concatenate(([track.getT(0)], T))
+	
+	__setInterpolatedPoints(track, X, Y, Z, T)
 	
 
 def __resampleTemporal(track, reference):
@@ -122,53 +113,57 @@ def __resampleTemporal(track, reference):
 	'''Resampling of a track with linear interpolation
 	reference: list of timestamps, track or sec interval'''
 
-	T = []
-	
-	for i in range(track.size()):
-		T.append(track.getObs(i).timestamp.toAbsTime())
+	T = track.getAnalyticalFeatureArray("t")
 		
 	tini = T[0]
 	tfin = T[len(T)-1]
 	
 	# Preparing reference list
-	REF = prepareTimeSampling(reference, tini, tfin)
+	REF = np.array(prepareTimeSampling(reference, tini, tfin), dtype=float)
 	
+	# Timestamps in ]tini, tfin] (reference list is assumed sorted)
+	after = np.nonzero(REF > tfin)[0]
+	if len(after) > 0:
+		REF = REF[0:after[0]]
+	t = REF[REF > tini]
 	
-	interp_points = []
-	running_id = 0
-	
-	for k in range(len(REF)):
-	
-		t = REF[k]
-		
-		if (t <= tini):
-			continue
-		if (t > tfin):
-			break
-		
-		while (T[running_id] < t):
-			running_id += 1
-		
-		pt_bwd = track.getObs(running_id-1)
-		pt_fwd = track.getObs(running_id)
-		tbwd = T[running_id-1]
-		tfwd = T[running_id]
+	# Interpolation indices and weights for all timestamps at once
+	fwd = np.searchsorted(T, t, side='left')
+	bwd = fwd-1
+	tbwd = T[bwd]
+	tfwd = T[fwd]
 		
-		wbwd = (tfwd-t)/(tfwd-tbwd)
-		wfwd = (t-tbwd)/(tfwd-tbwd)
+	wbwd = (tfwd-t)/(tfwd-tbwd)
+	wfwd = (t-tbwd)/(tfwd-tbwd)
 		
-		X = wbwd*pt_bwd.position.getX() + wfwd*pt_fwd.position.getX()
-		Y = wbwd*pt_bwd.position.getY() + wfwd*pt_fwd.position.getY()
-		Z = wbwd*pt_bwd.position.getZ() + wfwd*pt_fwd.position.getZ()
+	X = wbwd*track.getAnalyticalFeatureArray("x")[bwd] + wfwd*track.getAnalyticalFeatureArray("x")[fwd]
+	Y = wbwd*track.getAnalyticalFeatureArray("y")[bwd] + wfwd*track.getAnalyticalFeatureArray("y")[fwd]
+	Z = wbwd*track.getAnalyticalFeatureArray("z")[bwd] + wfwd*track.getAnalyticalFeatureArray("z")[fwd]
 		
-		pi = Obs(ENUCoords(X,Y,Z), GPSTime.readUnixTime(t))
+	__setInterpolatedPoints(track, X, Y, Z, t)
+	
+	
+def __setInterpolatedPoints(track, X, Y, Z, T):
+
+	'''Replaces observations of a track with interpolated
+	points (ENU coordinates and timestamps in sec arrays). 
+	GPSTime objects are not created for columnar tracks'''
+	
+	if track.isColumnar():
+		track.setObsList(ObsTable.fromArrays(X, Y, Z, T, "ENU"))
+		return
 		
-		interp_points.append(pi)
+	X = X.tolist(); Y = Y.tolist(); Z = Z.tolist()
+	TIMES = GPSTime.readUnixTimes(T)
+	
+	interp_points = []
+	for k in range(len(TIMES)):
+		interp_points.append(Obs(ENUCoords(X[k],Y[k],Z[k]), TIMES[k]))
 		
 	track.setObsList(interp_points)
 	
 	
-def gaussian_process(track, timestamps, kernel, factor=1.0, sigma=0.0, cp_var=False):
+def gaussian_process(track, timestamps, kernel, factor=1.0, sigma=0.0, cp_var=False, window=None, overlap=None):
 	'''Track interpolation and smoothing with Gaussian Process (GP)
 	self: a track to smooth (not modified by this function)
 	timestamps: points where interpolation must be computed. May be
@@ -180,63 +175,89 @@ def gaussian_process(track, timestamps, kernel, factor=1.0, sigma=0.0, cp_var=Fa
 					k(t2-t1) = Cov(Z(t1), Z(t2))
 	factor: unit factor of variance if the kernel must be scaled
 	sigma: observation noise standard deviation (in coords units)
-	cp_var: compute covariance matrix and store pointwise sigmas
+	cp_var: compute pointwise posterior sigmas (stored in @sigma_gp)
+	window: if not None, local GP computed on blocks of window 
+	successive observations (extended with overlap observations on 
+	each side, window/2 as a default) for points located between 
+	the first observation of the block and the first observation
+	of the next block. Time and memory are then linear in track 
+	size. Overlap should cover a few kernel scopes (exactly the 
+	scope for compactly supported kernels, such as triangular or 
+	Epanechnikov kernels, provided that observations are dense 
+	enough) so that local solutions match global solution.
 	returns: interpolated/smoothed track (without AF)'''
 		
 	new_track = Track()
 	
-	tini = track.getFirstObs().timestamp.toAbsTime()
-	tfin = track.getLastObs().timestamp.toAbsTime()
+	tini = track.getT(0)
+	tfin = track.getT(track.size()-1)
 	
 	# Vector of observed and unknown points
-	TO = prepareTimeSampling(track, tini, tfin)
-	TU = prepareTimeSampling(timestamps, tini, tfin)
+	TO = np.array(prepareTimeSampling(track, tini, tfin))
+	TU = np.array(prepareTimeSampling(timestamps, tini, tfin))
 	
-	# Observations
-	yx = np.array(track.getX())
-	yy = np.array(track.getY())
-	yz = np.array(track.getZ())
+	# Observations (x, y and z in columns)
+	Y = np.column_stack([track.getX(), track.getY(), track.getZ()])
 	
 	# Debiasing
-	bx = np.mean(yx)
-	by = np.mean(yy)
-	bz = np.mean(yz)
-	yx = yx-bx
-	yy = yy-by
-	yz = yz-bz
+	B = np.mean(Y, axis=0)
+	Y = Y - B
+	
+	# Computing posterior distribution means and variances
+	if window is None:
+		(MU, VAR) = __gp_predict(kernel, TO, Y, TU, factor, sigma, cp_var)
+	else:
+		if overlap is None:
+			overlap = window // 2
+		MU = np.zeros((len(TU), 3))
+		VAR = np.zeros(len(TU))
+		ORDER = np.argsort(TU, kind="stable")
+		n = len(TO)
+		for a in range(0, n, window):
+			b = min(a + window, n)
+			i1 = 0 if a == 0 else np.searchsorted(TU[ORDER], TO[a], side='left')
+			i2 = len(TU) if b == n else np.searchsorted(TU[ORDER], TO[b], side='left')
+			if i2 <= i1:
+				continue
+			SITES = ORDER[i1:i2]
+			lo = max(0, a - overlap); hi = min(n, b + overlap)
+			(MU[SITES], V) = __gp_predict(kernel, TO[lo:hi], Y[lo:hi], TU[SITES], factor, sigma, cp_var)
+			if cp_var:
+				VAR[SITES] = V
+	
+	# Filling track
+	MU = MU + B
+	TIMES = GPSTime.readUnixTimes(TU)
+	for i in range(MU.shape[0]):
+		coords = ENUCoords(MU[i,0], MU[i,1], MU[i,2])
+		new_track.addObs(Obs(coords, TIMES[i]))
+	
+	if cp_var:
+		new_track.createAnalyticalFeature("@sigma_gp", np.sqrt(np.abs(VAR))*factor)
+	
+	return new_track
+	
+	
+def __gp_predict(kernel, TO, Y, TU, factor, sigma, cp_var):
+	'''Posterior means (at sites TU, for each column of Y observed 
+	at sites TO) and variances (None if cp_var is False) of GP. 
+	All columns of Y and posterior variances are obtained with a 
+	single factorization of observation covariance matrix K.'''
 	
 	# Computing obs covariance matrix
 	K = utils.makeCovarianceMatrixFromKernel(kernel, TO, TO, factor)
 	K = np.add(K, sigma**2*np.identity(len(TO)))
 	
-	# Computing unknown sites covariance matrix
-	KSS = utils.makeCovarianceMatrixFromKernel(kernel, TU, TU, factor)
-	
 	# Computing obs - unknown sites covariance matrix
 	KS = utils.makeCovarianceMatrixFromKernel(kernel, TO, TU, factor)
 	
-	# Computing posterior distribution means
-	MUX = np.matmul(KS.T, np.linalg.solve(K, yx))
-	MUY = np.matmul(KS.T, np.linalg.solve(K, yy))
-	MUZ = np.matmul(KS.T, np.linalg.solve(K, yz))
-	
-	# Computing posterior distribution covariances
-	if cp_var:
-		SIGMA_XYZ = KSS - np.matmul(KS.T, np.matmul(np.linalg.inv(K),KS))
-	
-	# Filling track
-	for i in range(MUX.shape[0]):
-		coords = ENUCoords(MUX[i]+bx, MUY[i]+by, MUZ[i]+bz)
-		obs = Obs(coords, GPSTime.readUnixTime(TU[i]))
-		new_track.addObs(obs)
+	if not cp_var:
+		return KS.T @ np.linalg.solve(K, Y), None
 	
-	if cp_var:
-		new_track.createAnalyticalFeature("@sigma_gp")
-		for i in range(SIGMA_XYZ.shape[0]):
-			sigma = math.sqrt(abs(SIGMA_XYZ[i,i]))*factor
-			new_track.setObsAnalyticalFeature("@sigma_gp", i, sigma)
-	
-	return new_track
+	# Posterior variances: k(0) - diag(KS^T K^-1 KS)
+	W = np.linalg.solve(K, np.hstack([Y, KS]))
+	K0 = utils.makeCovarianceMatrixFromKernel(kernel, [0], [0], factor)[0,0]
+	return KS.T @ W[:,0:Y.shape[1]], K0 - np.sum(KS*W[:,Y.shape[1]:], axis=0)
 		
 		
 # --------------------------------------------------------------------------
@@ -253,11 +274,9 @@ def gaussian_process(track, timestamps, kernel, factor=1.0, sigma=0.0, cp_var=Fa
 def prepareTimeSampling(input, tini=None, tfin=None):
 	output = []
 	if isinstance(input, list):
-		for i in range(len(input)):
-			output.append(input[i].toAbsTime())
+		output = GPSTime.toAbsTimes(input).tolist()
 	if isinstance(input, Track):
-		for i in range(input.size()):
-			output.append(input.getObs(i).timestamp.toAbsTime())
+		output = input.getT()
 	if isinstance(input, int) or isinstance(input, float):
 		time = tini
 		while(1):
@@ -23,17 +23,13 @@ from tracklib.core.Track import Track
 # --------------------------------------------------------------------------
 # Utils function for map-matching
 # --------------------------------------------------------------------------
-def __projOnTrack(point, track):
-    proj = Utils.proj_polyligne(track.getX(), track.getY(), point.getX() , point.getY())
-    return ENUCoords(proj[1], proj[2], 0), proj[0], proj[3]
-	
-def __distToNode(track, coord, i, end=0):
-    si1 = track["abs_curv", i]
-    si2 = track["abs_curv", i+1]
+def __distToNode(track, S, coord, i, end=0):
+    si1 = S[i]
+    si2 = S[i+1]
     if end == 0:
         return si1 + track[i].position.distance2DTo(coord)
     if end == 1:
-        return track["abs_curv", len(track)-1] - si2 + track[i+1].position.distance2DTo(coord)	
+        return S[len(track)-1] - si2 + track[i+1].position.distance2DTo(coord)	
     return None		
 
 # --------------------------------------------------------------------------
@@ -64,14 +60,17 @@ def __mapOnNetwork(track, network, obs_noise=50, transition_cost=10, search_radi
     if verbose:
         print("Map-matching preparation...")
         to_run = progressbar.progressbar(to_run)
+    ABS_CURV = {}   # Curvilinear abscissa of candidate edges
     for i in to_run:
         STATES.append([])
-        E = network.spatial_index.neighborhood(track[i].position, unit=1)
-        for elem in E:
+        E = network.spatial_index.within(track[i].position, search_radius)
+        for (elem, v, d, p) in E:
             eg = network.EDGES[network.getEdgeId(elem)].geom
-            p, d, v = __projOnTrack(track[i].position, eg)
             if d < search_radius:
-                STATES[-1].append((p, elem, __distToNode(eg, p, v, 0), __distToNode(eg, p, v, 1)))
+                if not elem in ABS_CURV:
+                    ABS_CURV[elem] = eg.cumulativeLength()
+                S = ABS_CURV[elem]
+                STATES[-1].append((p, elem, __distToNode(eg, S, p, v, 0), __distToNode(eg, S, p, v, 1)))
                 if debug:
                     wkt = Track([Obs(track[i].position), Obs(p)]).toWKT()
                     f1.write(str(i) + " \""+wkt+"\" " + str(d) + "\n")
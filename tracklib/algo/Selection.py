@@ -126,6 +126,14 @@ class TimeConstraint:
         if not (self.pattern is None):
             output = output & utils.compLike(str(timestamp), self.pattern)
         return output
+        
+    # Test on all timestamps of a track at once (float seconds 
+    # comparisons). Returns a numpy array of booleans
+    def containsTrack(self, track):
+        if not (self.pattern is None):
+            return np.array([self.contains(t) for t in track.getTimestamps()], dtype=bool)
+        T = track.getAnalyticalFeatureArray("t")
+        return (self.minTimestamp.toAbsTime() <= T) & (T <= self.maxTimestamp.toAbsTime())
 
 # ------------------------------- CONSTRAINTS ----------------------------
 
@@ -153,6 +161,8 @@ class TrackConstraint:
             pt1.translate(+buffer*dy/R, -buffer*dx/R)
             pt2.translate(-buffer*dy/R, +buffer*dx/R)
             self.segments.append(Track([Obs(pt1), Obs(pt2)]))
+        self.__buffers = np.array([[s[0].position.getX(), s[0].position.getY(), 
+                                    s[1].position.getX(), s[1].position.getY()] for s in self.segments])
 
     def __str__(self):
         output = "Track-based selecting constraint (mode '"+printMode(self)+"')"              
@@ -166,15 +176,12 @@ class TrackConstraint:
         
     def contains(self, track):  
         if self.mode == MODE_PARALLEL:
-            counter = 0
+            I, J = Geometrics.segmentsIntersections(self.__buffers, Geometrics.trackSegments(track))
+            I = np.unique(I)
             lgth = 0
-            for i in range(len(self.segments)):
-                if Geometrics.intersects(self.segments[i], track):
-                    counter += 1
-                    lgth += self.track[i].position.distance2DTo(self.track[i+1].position)
-                    if ((counter > self.prop*len(self.segments)) and (lgth > self.length)):
-                        return True
-            return False 
+            for i in I.tolist():
+                lgth += self.track[i].position.distance2DTo(self.track[i+1].position)
+            return (len(I) > self.prop*len(self.segments)) and (lgth > self.length)
         else:
             return Geometrics.intersects(self.track, track)
         
@@ -249,31 +256,32 @@ class Constraint:
     def contains(self, track):
         if not str(type(self.shape))[33:-2] in ["Circle", "Rectangle", "Polygon"]:
             return False
+        TIME = self.time.containsTrack(track)
         if self.mode == MODE_CROSSES:
             for i in range(len(track)):
                 if self.shape.contains(track[i].position):
-                    if self.time.contains(track[i].timestamp):
+                    if TIME[i]:
                         return True
             return False
         if self.mode == MODE_INSIDE:
             for i in range(len(track)):
                 if not self.shape.contains(track[i].position):
                     return False
-                if not self.time.contains(track[i].timestamp):
+                if not TIME[i]:
                     return False
             return True
         if self.mode == MODE_GETS_IN:
             if not self.shape.contains(track[0].position):
                 for i in range(1,len(track)):
                     if self.shape.contains(track[i].position):
-                        if self.time.contains(track[i].timestamp):
+                        if TIME[i]:
                             return True
             return False
         if self.mode == MODE_GETS_OUT:
             if self.shape.contains(track[0].position):
                 for i in range(1,len(track)):
                     if not self.shape.contains(track[i].position):
-                        if self.time.contains(track[i].timestamp):
+                        if TIME[i]:
                             return True
             return False            
         
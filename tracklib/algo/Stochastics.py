@@ -19,6 +19,9 @@ DISTRIBUTION_NORMAL = 1
 DISTRIBUTION_UNIFORM = 2
 DISTRIBUTION_LAPLACE = 3
 
+NOISE_CHOLESKY = 1
+NOISE_CIRCULANT = 2
+
 __KHI_SQUARED_TABLE = [
 # 0.10 	 0.05 	 0.025 	  0.01 	 0.005
 [2.7060, 3.8410, 5.0240, 6.6350, 7.8790],
@@ -94,13 +97,17 @@ class NoiseProcess:
                 output += "\n + "
         return output
 		
-    def noise(self, track, N=1):
+    def noise(self, track, N=1, method=NOISE_CHOLESKY, seed=None):
         if N==1:
-            return noise(track, self.amplitudes, self.kernels, self.distribution) 
+            return noise(track, self.amplitudes, self.kernels, self.distribution, method, seed) 
         else:
+            Y = noiseSamples(track.cumulativeLength(), self.amplitudes, self.kernels, N, 
+                self.distribution, method, seed)
             collection = TrackCollection()
             for i in range(N):
-                collection.addTrack(noise(track, self.amplitudes, self.kernels, self.distribution))
+                noised_track = track.copy()
+                noised_track.setCoordsArray(track.getCoordsArray() + Y[i], track.getSRID())
+                collection.addTrack(noised_track)
             return collection
 		
     def plot(self):
@@ -116,7 +123,7 @@ def seed(integer):
     random.seed(integer)
     np.random.seed(integer)
 
-def gaussian_process(self, timestamps, kernel, factor=1.0, sigma=0.0, cp_var=False):
+def gaussian_process(self, timestamps, kernel, factor=1.0, sigma=0.0, cp_var=False, window=None, overlap=None):
     '''Track interpolation and smoothing with Gaussian Process (GP)
     self: a track to smooth (not modified by this function)
     timestamps: points where interpolation must be computed. May be
@@ -128,15 +135,18 @@ def gaussian_process(self, timestamps, kernel, factor=1.0, sigma=0.0, cp_var=Fal
                     k(t2-t1) = Cov(Z(t1), Z(t2))
     factor: unit factor of variance if the kernel must be scaled
     sigma: observation noise standard deviation (in coords units)
-    cp_var: compute covariance matrix and store pointwise sigmas
+    cp_var: compute pointwise posterior sigmas (stored in @sigma_gp)
+    window, overlap: local GP on blocks of observations (see 
+    Interpolation.gaussian_process)
     returns: interpolated/smoothed track (without AF)'''
     
-    return Interpolation.gaussian_process(self, timestamps, kernel, factor, sigma, cp_var)
+    return Interpolation.gaussian_process(self, timestamps, kernel, factor, sigma, cp_var, window, overlap)
 	
 def randomColor():
     return [random.random(),random.random(),random.random()]
 	
-def noise(track, sigma=[1], kernel=[Kernel.DiracKernel()], distribution=DISTRIBUTION_NORMAL):
+def noise(track, sigma=[1], kernel=[Kernel.DiracKernel()], distribution=DISTRIBUTION_NORMAL, 
+          method=NOISE_CHOLESKY, seed=None):
     '''Track noising with Cholesky factorization of gaussian 
     process covariance matrix: h(x2-x1)=exp(-((x2-x1)/scope)**2)
     If X is a gaussian white noise, Cov(LX) = L^t*L => if L is a 
@@ -144,76 +154,181 @@ def noise(track, sigma=[1], kernel=[Kernel.DiracKernel()], distribution=DISTRIBU
     then Cov(LX) = L^T*L = S and Y=LX has S as covariance matrix.
     track: the track to be smoothed (input track is not modified)
     sigma: noise amplitude(s) (in observation coordinate units)
-    kernel: noise autocovariance function(s)'''
+    kernel: noise autocovariance function(s)
+    method: NOISE_CHOLESKY or NOISE_CIRCULANT (see noiseSamples)
+    seed: random seed (default: numpy global random state)'''
+	
+    Y = noiseSamples(track.cumulativeLength(), sigma, kernel, 1, distribution, method, seed)
+    
+    noised_track = track.copy()
+    noised_track.setCoordsArray(track.getCoordsArray() + Y[0], track.getSRID())
+        
+    return noised_track
+    
+
+def noiseSamples(abscissa, sigma=[1], kernel=[Kernel.DiracKernel()], N=1, distribution=DISTRIBUTION_NORMAL, 
+                 method=NOISE_CHOLESKY, seed=None, step=None):
+    '''Simulation of N replicates of a 3D correlated noise along a 
+    (sorted) curvilinear abscissa. Returns a N x n x 3 array. 
+    abscissa: n abscissa values (e.g. track.cumulativeLength())
+    sigma: noise amplitude(s) (in observation coordinate units)
+    kernel: noise autocovariance function(s) (stationary)
+    method: 
+      - NOISE_CHOLESKY: Cholesky factor of the dense n x n covariance 
+        matrix (factorized once for all replicates). O(n^3) time. 
+      - NOISE_CIRCULANT: covariance on a regular grid is embedded in a 
+        circulant matrix, whose square root is applied with FFT in 
+        O(n log n). Irregular abscissa are handled by simulating on a 
+        regular grid (with spacing step, default: median of abscissa 
+        increments) and linear interpolation. Negative eigenvalues of 
+        the embedding (non positive-definite kernels) are set to 0.
+    seed: None (numpy global random state), an integer (each replicate 
+    gets its own generator spawned from seed, so that replicate r does 
+    not depend on N) or a list of N seeds (one per replicate, e.g. to 
+    share replicates between parallel runs)'''
 	
     sigma = utils.listify(sigma)
     kernel = utils.listify(kernel)       
 
     if len(sigma) != len(kernel):
         sys.exit("Error: amplitude and kernel arrays must have same size in 'noise' function")
+        
+    S = np.asarray(abscissa, dtype=float)
+    n = len(S)
     
-    N = track.size()
-    track.compute_abscurv()
+    generators = None
+    if isinstance(seed, (list, tuple, np.ndarray)):
+        if len(seed) != N:
+            sys.exit("Error: number of seeds must be equal to the number of replicates in 'noise' function")
+        generators = [np.random.default_rng(s) for s in seed]
+    elif seed is not None:
+        generators = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(N)]
     
-    noised_track = track.copy()
+    Y = np.zeros((N, 3, n))
     
-    for n in range(len(sigma)):
+    for k in range(len(sigma)):
+        
+        if (method == NOISE_CIRCULANT) or isinstance(kernel[k], DiracKernel):
+            Y += __circulantNoise(S, sigma[k], kernel[k], N, distribution, generators, step)
+            continue
 
-        S = track.getAnalyticalFeature(Analytics.BIAF_ABS_CURV)
-        SIGMA_S = utils.makeCovarianceMatrixFromKernel(kernel[n], S, S)
-        SIGMA_S += np.identity(N)*1e-12
-        SIGMA_S *= sigma[n]**2/SIGMA_S[0,0]
+        SIGMA_S = utils.makeCovarianceMatrixFromKernel(kernel[k], S, S)
+        SIGMA_S += np.identity(n)*1e-12
+        SIGMA_S *= sigma[k]**2/SIGMA_S[0,0]
     
         # Cholesky decomposition
         L = np.linalg.cholesky(SIGMA_S)
    
         # Noise simulation
-        if distribution == DISTRIBUTION_NORMAL:
-            Xx = np.random.normal(0.0, 1.0, N)
-            Xy = np.random.normal(0.0, 1.0, N)
-            Xz = np.random.normal(0.0, 1.0, N)
-        if distribution == DISTRIBUTION_UNIFORM:
-            Xx = np.random.uniform(-1.73205, 1.73205, N)
-            Xy = np.random.uniform(-1.73205, 1.73205, N)
-            Xz = np.random.uniform(-1.73205, 1.73205, N)
-        if distribution == DISTRIBUTION_LAPLACE:
-            Xx = np.random.laplace(0.0, 0.5, N)
-            Xy = np.random.laplace(0.0, 0.5, N)
-            Xz = np.random.laplace(0.0, 0.5, N)
-        Yx = np.matmul(L, Xx)
-        Yy = np.matmul(L, Xy)
-        Yz = np.matmul(L, Xz)
- 
-        # Building noised track
-        for i in range(N):
-            pt = noised_track.getObs(i).position
-            pt.setX(pt.getX()+Yx[i])
-            pt.setY(pt.getY()+Yy[i])
-            pt.setZ(pt.getZ()+Yz[i])
-            obs = Obs(pt, track.getObs(i).timestamp)
+        X = __whiteNoise(generators, distribution, (N, 3, n))
+        Y += X @ L.T
         
-    return noised_track
+    return np.transpose(Y, (0, 2, 1))
+    
+# -----------------------------------------------------------------------------
+# White noise (N x ...) drawn with numpy global state or one generator per 
+# replicate (unit variance for normal and uniform distributions)
+# -----------------------------------------------------------------------------
+def __whiteNoise(generators, distribution, shape):
+    if generators is None:
+        generators = [np.random]
+        size = shape
+    else:
+        size = shape[1:]
+    X = []
+    for g in generators:
+        if distribution == DISTRIBUTION_UNIFORM:
+            X.append(g.uniform(-1.73205, 1.73205, size))
+        elif distribution == DISTRIBUTION_LAPLACE:
+            X.append(g.laplace(0.0, 0.5, size))
+        else:
+            X.append(g.normal(0.0, 1.0, size))
+    if len(X) == 1 and size == shape:
+        return X[0]
+    return np.stack(X)
+    
+# -----------------------------------------------------------------------------
+# Circulant embedding: if C is the (symetric) circulant matrix built on the 
+# first row c, C = F* diag(FFT(c)) F and C^(1/2) W = IFFT(sqrt(FFT(c))*FFT(W))
+# is real, with covariance C. The first m values have the covariance of 
+# the kernel on the m grid points. Returns a N x 3 x n array.
+# -----------------------------------------------------------------------------
+def __circulantNoise(S, sigma, kernel, N, distribution, generators, step):
+    n = len(S)
+    
+    # White noise (no embedding needed)
+    if (n < 2) or isinstance(kernel, DiracKernel):
+        return sigma*__whiteNoise(generators, distribution, (N, 3, n))
+    
+    # Regular grid covering abscissa
+    dS = np.diff(S)
+    h = (S[-1]-S[0])/(n-1)
+    regular = (step is None) and (h > 0) and np.all(np.abs(dS-h) <= 1e-6*h)
+    if not regular:
+        h = step
+        if h is None:
+            h = np.median(dS[dS > 0]) if np.any(dS > 0) else 1.0
+        m = (int)(np.ceil((S[-1]-S[0])/h - 1e-9)) + 1
+    else:
+        m = n
+    m = max(m, 2)
+    
+    # Embedding (size 2M) with M >= m-1 and non-negative eigenvalues
+    M = 1 << (int)(np.ceil(np.log2(m-1)))
+    for i in range(4):
+        c = kernel.evaluate(h*np.arange(M+1), False)
+        c = np.concatenate((c, c[-2:0:-1]))*sigma**2/c[0]
+        LAMBDA = np.fft.rfft(c).real
+        if np.min(LAMBDA) >= -1e-9*np.max(LAMBDA):
+            break
+        M *= 2
+    LAMBDA = np.sqrt(np.maximum(LAMBDA, 0))
+    
+    X = __whiteNoise(generators, distribution, (N, 3, 2*M))
+    G = np.fft.irfft(LAMBDA*np.fft.rfft(X), 2*M)[:, :, 0:m]
+    
+    if regular:
+        return G
+    
+    # Linear interpolation at abscissa
+    U = (S-S[0])/h
+    I = np.clip(np.floor(U).astype(int), 0, m-2)
+    W = U-I
+    return G[:, :, I]*(1-W) + G[:, :, I+1]*W
         
     
-def randomizer(input, f, sigma=[7], kernel=[Kernel.GaussianKernel(650)], N=10):
+def randomizer(input, f, sigma=[7], kernel=[Kernel.GaussianKernel(650)], N=10, 
+               method=NOISE_CHOLESKY, seed=None):
     '''Randomizing traces for sensitivity analysis on output f
     input: a track, or list of tracks to be randomized
     f: a function taking a list of tracks as input 
     sigma: noise amplitude (in observation coordinate units)
     N: number of simulations to generate (default is 100)
     scope_s: spatial autocorrelation scope (measured along track 
-        curvilinear abscissa in observation coordinate units)'''
+        curvilinear abscissa in observation coordinate units)
+    method, seed: noise generation (see noiseSamples). With an integer 
+    seed, simulation i of track j is reproducible independently of N'''
     
     noised_output = []
     
     if not isinstance(input, list):
         input = [input]
         
+    # All replicates of a track are generated at once
+    NOISES = []
+    for j in range(len(input)):
+        seeds = seed
+        if seed is not None:
+            seeds = [np.random.SeedSequence(seed, spawn_key=(j, i)) for i in range(N)]
+        NOISES.append(noiseSamples(input[j].cumulativeLength(), sigma, kernel, N, 
+            DISTRIBUTION_NORMAL, method, seeds))
+        
     for i in range(N):
         noised_input = []
         print("  Randomizing tracks:", ('{}/'+(str)(N)+'\r').format(i+1), end="")
         for j in range(len(input)):
-            noised_track = input[j].noise(sigma, kernel)
+            noised_track = input[j].copy()
+            noised_track.setCoordsArray(input[j].getCoordsArray() + NOISES[j][i], input[j].getSRID())
             noised_input.append(noised_track)    
         noised_output.append(f(noised_input))
     print("")
@@ -7,6 +7,7 @@
 
 import math
 import copy
+import numpy as np
 import matplotlib.pyplot as plt
 
 Re = 6378137.0;                # Earth equatorial radius 
@@ -83,9 +84,23 @@ class GeoCoords:
         
     # --------------------------------------------------
     # Distance between two geodetic coordinates
+    # (planimetric distance in local frame of point)
     # --------------------------------------------------
     def distance2DTo(self, point):
-        return self.toENUCoords(point).norm2D()
+        if not isinstance(point, GeoCoords):
+            return self.toENUCoords(point).norm2D()
+        p = self.toECEFCoords()
+        b = point.toECEFCoords()
+        x = p.X - b.X
+        y = p.Y - b.Y
+        z = p.Z - b.Z
+        blon = point.lon * math.pi/180.0
+        blat = point.lat * math.pi/180.0
+        slon = math.sin(blon); clon = math.cos(blon)
+        slat = math.sin(blat); clat = math.cos(blat)
+        e = -x*slon + y*clon
+        n = -x*clon*slat - y*slon*slat + z*clat
+        return math.sqrt(e*e + n*n)
     
     # --------------------------------------------------
     # Elevation (in rad) between two geodetic coordinates
@@ -459,6 +474,80 @@ class ECEFCoords:
         self.Z = Z
     
 
+# --------------------------------------------------
+# Vectorized transforms on N x 3 numpy arrays of 
+# coordinates: (lon, lat, hgt), (X, Y, Z) or (E, N, U)
+# Base coordinates need to be provided in ECEF/Geo
+# --------------------------------------------------
+def geoToECEF(points):
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    e = math.sqrt(Fe*(2-Fe))
+    lon = points[:,0] * math.pi/180.0
+    lat = points[:,1] * math.pi/180.0
+    hgt = points[:,2]
+    slat = np.sin(lat)
+    clat = np.cos(lat)
+    n = Re/np.sqrt(1-(e*slat)**2)
+    output = np.empty(points.shape)
+    output[:,0] = (n+hgt)*clat*np.cos(lon)
+    output[:,1] = (n+hgt)*clat*np.sin(lon)
+    output[:,2] = ((1-e*e)*n+hgt)*slat
+    return output
+    
+def ecefToGeo(points):
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    b = Re*(1-Fe)
+    e = math.sqrt(Fe*(2-Fe))
+    X = points[:,0]; Y = points[:,1]; Z = points[:,2]
+    h = Re*Re-b*b
+    p = np.sqrt(X*X + Y*Y)
+    t = np.arctan2(Z*Re, p*b)
+    lon = np.arctan2(Y, X)
+    lat = np.arctan2(Z+h/b*np.sin(t)**3, p-h/Re*np.cos(t)**3)
+    n = Re/np.sqrt(1-(e*np.sin(lat))**2)
+    output = np.empty(points.shape)
+    output[:,0] = lon*180.0/math.pi
+    output[:,1] = lat*180.0/math.pi
+    output[:,2] = p/np.cos(lat)-n
+    return output
+    
+def ecefToENU(points, base):
+    origin, R = _localFrame(base)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    return np.matmul(points - origin, R.T)
+    
+def enuToECEF(points, base):
+    origin, R = _localFrame(base)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    return np.matmul(points, R) + origin
+    
+def geoToENU(points, base):
+    return ecefToENU(geoToECEF(points), base)
+    
+def enuToGeo(points, base):
+    return ecefToGeo(enuToECEF(points, base))
+    
+def enuToENU(points, base1, base2):
+    return ecefToENU(enuToECEF(points, base1), base2)
+    
+# --------------------------------------------------
+# Local frame at base point: ECEF origin and matrix
+# with rows of E, N, U unit vectors (computed once 
+# for all points to convert)
+# --------------------------------------------------
+def _localFrame(base):
+    base = base.toECEFCoords()
+    base_geo = base.toGeoCoords()
+    blon = base_geo.lon * math.pi/180.0
+    blat = base_geo.lat * math.pi/180.0
+    slon = math.sin(blon); clon = math.cos(blon)
+    slat = math.sin(blat); clat = math.cos(blat)
+    R = np.array([[     -slon,       clon,  0.0],
+                  [-clon*slat, -slon*slat, clat],
+                  [ clon*clat,  slon*clat, slat]])
+    return np.array([base.X, base.Y, base.Z]), R
+    
+
 # --------------------------------------------------
 # Static projection methods
 # --------------------------------------------------   
@@ -3,6 +3,7 @@
 # ----------------------------------------------------------------
 import copy
 import random
+import numpy as np
 
 class GPSTime:
 
@@ -22,6 +23,11 @@ class GPSTime:
             "1h", "2h", "1m", "2m", "1s", "2s", "1z", "2z", "3z"]
             
     __day_per_month = [31,28,31,30,31,30,31,31,30,31,30,31]
+    __day_before_month = [0,31,59,90,120,151,181,212,243,273,304,334]
+    
+    # Month and day of month for each day of a leap year
+    __month_of_day = sum([[m+1]*n for (m, n) in enumerate([31,29,31,30,31,30,31,31,30,31,30,31])], [])
+    __day_of_month = sum([list(range(1, n+1)) for n in [31,29,31,30,31,30,31,31,30,31,30,31]], [])
     
     __month_names = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", 
                      "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
@@ -82,79 +88,100 @@ class GPSTime:
     # ------------------------------------------------------------    
     @staticmethod
     def readUnixTime(elapsed_seconds):
-    
+        ms = int(round(elapsed_seconds*1000))
+        days, ms = divmod(ms, 86400000)
+        year, doy = GPSTime.__civilFromDays(days)
         time = GPSTime()
+        time.year  = year
+        time.month = GPSTime.__month_of_day[doy]
+        time.day   = GPSTime.__day_of_month[doy]
+        time.hour, ms = divmod(ms, 3600000)
+        time.min, ms  = divmod(ms, 60000)
+        time.sec, ms  = divmod(ms, 1000)
+        time.ms = ms
+        return time
         
-        SECOND_PER_YEAR = 86400*365
-        SECOND_PER_MONTH = 86400*28
-        
-        # Year
-        sec = 0
-        year = 1970
-        while (sec < elapsed_seconds - SECOND_PER_YEAR):
-            sec += SECOND_PER_YEAR
-            if (year % 4 == 0):
-                sec += 86400
-            year += 1
-        time.year = year
-        elapsed_seconds -= sec
-
-        # Month
-        month = 0
-        for i in range(12):
-            sec_on_month = GPSTime.__day_per_month[month]*86400
-            if ((month == 1) and (year % 4 == 0)):
-                sec_on_month += 86400
-            if (elapsed_seconds < sec_on_month):
-                break
-            elapsed_seconds -= sec_on_month
-            month += 1
-            
-        
-        time.month = month+1
-        
-        # Day
-        time.day = (int)(elapsed_seconds/86400)+1
-        elapsed_seconds -= (time.day-1)*86400
-        
-        # Hour
-        time.hour = (int)(elapsed_seconds/3600)
-        elapsed_seconds -= time.hour*3600
+    # ------------------------------------------------------------
+    # Vectorized conversions of (numpy arrays of) elapsed float 
+    # seconds since 01/01/1970 into calendar fields and back. 
+    # Fields are returned as a tuple of int64 arrays (year, month, 
+    # day, hour, min, sec, ms). 
+    # ------------------------------------------------------------    
+    @staticmethod
+    def readUnixTimeFields(elapsed_seconds):
+        ms = np.rint(np.asarray(elapsed_seconds, dtype=np.float64)*1000).astype(np.int64)
+        days, ms = np.divmod(ms, 86400000)
+        year, doy = GPSTime.__civilFromDays(days)
+        month = np.array(GPSTime.__month_of_day)[doy]
+        day = np.array(GPSTime.__day_of_month)[doy]
+        hour, ms = np.divmod(ms, 3600000)
+        min, ms = np.divmod(ms, 60000)
+        sec, ms = np.divmod(ms, 1000)
+        return year, month, day, hour, min, sec, ms
         
-        # Minute
-        time.min = (int)(elapsed_seconds/60)
-        elapsed_seconds -= time.min*60
+    @staticmethod
+    def toAbsTimeFields(year, month=1, day=1, hour=0, min=0, sec=0, ms=0):
+        year = np.asarray(year, dtype=np.int64)
+        month = np.maximum(np.asarray(month, dtype=np.int64), 1)
+        days = GPSTime.__daysFromCivil(year, month, np.asarray(day, dtype=np.int64))
+        seconds = days*86400 + np.asarray(hour)*3600 + np.asarray(min)*60 + np.asarray(sec)
+        return seconds + np.asarray(ms)/1000.0
+    
+    # ------------------------------------------------------------
+    # Vectorized versions of readUnixTime and toAbsTime on lists
+    # of timestamps (returns a list of GPSTime / a numpy array)
+    # ------------------------------------------------------------
+    @staticmethod
+    def readUnixTimes(elapsed_seconds):
+        fields = GPSTime.readUnixTimeFields(elapsed_seconds)
+        fields = [f.tolist() for f in fields]
+        return [GPSTime(*f) for f in zip(*fields)]
         
-        # Second
-        time.sec = (int)(elapsed_seconds)
-        elapsed_seconds -= time.sec
+    @staticmethod
+    def toAbsTimes(timestamps):
+        fields = [[], [], [], [], [], [], []]
+        for t in timestamps:
+            fields[0].append(t.year); fields[1].append(t.month)
+            fields[2].append(t.day);  fields[3].append(t.hour)
+            fields[4].append(t.min);  fields[5].append(t.sec)
+            fields[6].append(t.ms)
+        return GPSTime.toAbsTimeFields(*fields)
         
-        # Milisecond
-        time.ms = (int)(elapsed_seconds*1000)
+    # ------------------------------------------------------------
+    # Closed-form calendar arithmetic (int or numpy arrays) with 
+    # the leap year rule of the class (every 4 years, valid from 
+    # 1901 to 2099). Days are counted from 01/01/1970.
+    # ------------------------------------------------------------
+    @staticmethod
+    def __daysFromCivil(year, month, day):
+        y = year - 1968
+        days = 365*y + (y+3)//4 - 731
+        if isinstance(month, int):
+            days += GPSTime.__day_before_month[month-1]
+        else:
+            days += np.array(GPSTime.__day_before_month)[month-1]
+        days += (month > 2) & (year % 4 == 0)
+        return days + day - 1
         
-        return time
+    @staticmethod
+    def __civilFromDays(days):
+        days = days + 731                  # 01/01/1968 is a leap year
+        cycle = days // 1461
+        r = days % 1461
+        y = (r - 1) // 365
+        y = y + (y < 0)
+        doy = r - 365*y - (y > 0)
+        doy = doy + ((y > 0) & (doy >= 59)) # Skipping 29/02 on common years
+        return 1968 + 4*cycle + y, doy
         
     # ------------------------------------------------------------
     # Converting to elapsed float seconds since 01/01/1970
     # Warning: does not consider leap seconds (31 since 1970)
     # ------------------------------------------------------------    
     def toAbsTime(self):
-        seconds = 0
-        for y in range(1970, self.year):
-            seconds += 86400*365
-            if (y % 4 == 0):
-                seconds += 86400
-        for m in range(1, self.month):
-            seconds += GPSTime.__day_per_month[m-1]*86400
-            if ((m == 2) and (self.year % 4 == 0)):
-                seconds += 86400
-        seconds += (self.day-1)*86400
-        seconds += self.hour*3600
-        seconds += self.min*60
-        seconds += self.sec
-        seconds += self.ms/1000.0
-        
-        return seconds
+        days = GPSTime.__daysFromCivil(self.year, max(self.month, 1), self.day)
+        seconds = days*86400 + self.hour*3600 + self.min*60 + self.sec
+        return seconds + self.ms/1000.0
     
     # ------------------------------------------------------------
     # Generate random date between 01/01/1970 and 01/01/2050
@@ -251,6 +278,45 @@ class GPSTime:
             
         return time
                 
+    # ------------------------------------------------------------    
+    # Vectorized reading of a list of timestamps (strings in 
+    # READ_FMT) into a numpy array of elapsed seconds since
+    # 01/01/1970 (equivalent to readTimestamp + toAbsTime)
+    # ------------------------------------------------------------        
+    @staticmethod
+    def readTimestamps(timesAsStrings):
+    
+        fields = {"Y": 1970, "M": 1, "D": 1, "h": 0, "m": 0, "s": 0, "z": 0}
+        
+        # Fixed-width digits of all strings (blanks read as 0)
+        digits = None
+        try:
+            chars = np.array(timesAsStrings, dtype=bytes)
+            width = chars.dtype.itemsize
+            digits = chars.view(np.uint8).reshape(len(chars), width).astype(np.int64)
+            digits = np.where(digits == ord(" "), 0, digits - ord("0"))
+        except UnicodeEncodeError:
+            pass
+        
+        for (code, index) in GPSTime.__PRECOMPILED_READ_FMT:
+            n = (int)(code[0])
+            values = None
+            if (digits is not None) and (index+n <= digits.shape[1]):
+                block = digits[:, index:index+n]
+                if np.all((block >= 0) & (block <= 9)):
+                    values = np.matmul(block, 10**np.arange(n-1, -1, -1))
+            if values is None:
+                values = [s[index:index+n] for s in timesAsStrings]
+                values = np.array(values, dtype=str).astype(np.int64)
+            if (code == "2Y"):
+                values = values + GPSTime.BASE_YEAR
+            if (code[1] == "z"):
+                values = values*10**(3-n)
+            fields[code[1]] = values
+            
+        return GPSTime.toAbsTimeFields(fields["Y"], fields["M"], fields["D"], 
+                                       fields["h"], fields["m"], fields["s"], fields["z"])
+                
     # ------------------------------------------------------------
     # Remplacing substring of length 'length', starting at pos id
     # in string 'chaine' with new string 'new' 
@@ -10,7 +10,9 @@ import matplotlib.pyplot as plt
 from tracklib.core.TrackCollection import TrackCollection
 
 # -----------------------------------------------------------------------------
-# Kernels for filtering, smoothing and stochastics simulations        
+# Kernels for filtering, smoothing and stochastics simulations. Kernel 
+# functions are written with numpy operators, so that they may be applied
+# on arrays (e.g. distance matrices) as well as on numbers.
 # -----------------------------------------------------------------------------
 class Kernel:    
     
@@ -42,10 +44,22 @@ class Kernel:
         if not append:
             plt.show()
         
-    def evaluate(self, x):
-        f_support = lambda x : self.__kernel_function(x)*(abs(x) <= self.support)
-        vfunc = np.vectorize(f_support)
-        output = vfunc(x)
+    # ------------------------------------------------------------
+    # Evaluates kernel on x (number or numpy array of any shape),
+    # set to 0 outside of kernel support if support is True. 
+    # Kernel functions are applied on whole arrays (or element-
+    # wise if they do not support numpy arrays).
+    # ------------------------------------------------------------
+    def evaluate(self, x, support=True):
+        x = np.asarray(x, dtype=float)
+        try:
+            output = np.asarray(self.__kernel_function(x), dtype=float)
+            if output.shape != x.shape:
+                output = np.broadcast_to(output, x.shape).copy()
+        except (TypeError, ValueError):
+            output = np.vectorize(self.__kernel_function, otypes=[float])(x)
+        if support:
+            output = output*(np.abs(x) <= self.support)
         if output.shape == ():
             return float(output)
         return output
@@ -54,13 +68,9 @@ class Kernel:
         if self.support < 1:
             sys.exit("Error: kernel size must be > 1 to be transformed to sliding window")
         size = 2*(int)(self.support)+1
-        values = [0]*size
         center = size/2.0
-        norm = 0
-        for i in range(size):
-            x = center-i-0.5
-            values[i] = self.evaluate(x)
-            norm += values[i]
+        values = self.evaluate(center-np.arange(size)-0.5).tolist()
+        norm = sum(values)
         for i in range(size):
             values[i] /= norm
         return values
@@ -68,7 +78,7 @@ class Kernel:
 
 class DiracKernel(Kernel):    
     def __init__(self):
-        f = lambda x : 1*(abs(x)==0)
+        f = lambda x : 1*(np.abs(x)==0)
         self.setFunction(f)
         self.support = 500   # Arbitrary value for plot
     def __str__(self):
@@ -76,7 +86,7 @@ class DiracKernel(Kernel):
     
 class UniformKernel(Kernel):    
     def __init__(self, size):
-        f = lambda x : 1*(abs(x) <= size)/(2*size)
+        f = lambda x : 1*(np.abs(x) <= size)/(2*size)
         self.setFunction(f)
         self.support = 2*size
     def __str__(self):
@@ -84,7 +94,7 @@ class UniformKernel(Kernel):
         
 class TriangularKernel(Kernel):    
     def __init__(self, size):
-        f = lambda x : (size-abs(x))*(abs(x) <= size)/(size**2)
+        f = lambda x : (size-np.abs(x))*(np.abs(x) <= size)/(size**2)
         self.setFunction(f)
         self.support = 1.5*size
     def __str__(self):
@@ -92,7 +102,7 @@ class TriangularKernel(Kernel):
     
 class GaussianKernel(Kernel):    
     def __init__(self, sigma):
-        f = lambda x : math.exp(-0.5*(x/sigma)**2)/(sigma*math.sqrt(2*math.pi))
+        f = lambda x : np.exp(-0.5*(x/sigma)**2)/(sigma*math.sqrt(2*math.pi))
         self.setFunction(f)
         self.support = 3*sigma
     def __str__(self):
@@ -100,7 +110,7 @@ class GaussianKernel(Kernel):
         
 class ExponentialKernel(Kernel):    
     def __init__(self, sigma):
-        f = lambda x : math.exp(-abs(x)/sigma)/(2*sigma)
+        f = lambda x : np.exp(-np.abs(x)/sigma)/(2*sigma)
         self.setFunction(f)
         self.support = 3*sigma        
     def __str__(self):
@@ -108,7 +118,7 @@ class ExponentialKernel(Kernel):
         
 class EpanechnikovKernel(Kernel):    
     def __init__(self, size):
-        f = lambda x : 3/4*(1-(x/size)**2)*(abs(x) <= size)/size
+        f = lambda x : 3/4*(1-(x/size)**2)*(np.abs(x) <= size)/size
         self.setFunction(f)
         self.support = 1.5*size    
     def __str__(self):
@@ -117,7 +127,7 @@ class EpanechnikovKernel(Kernel):
 class SincKernel(Kernel):    
     def __init__(self, size):
         scale = 0.1*size
-        f = lambda x : scale*math.sin((x+1e-300)/scale)/(x+1e-300)/(math.pi*scale)
+        f = lambda x : scale*np.sin((x+1e-300)/scale)/(x+1e-300)/(math.pi*scale)
         self.setFunction(f)
         self.support = 3*size    
     def __str__(self):
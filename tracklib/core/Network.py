@@ -10,7 +10,9 @@ import tracklib.algo.Simplification as Simplification
 
 from tracklib.core.Obs import Obs
 from tracklib.core.Track import Track
-from tracklib.core.Utils import priority_dict
+import tracklib.core.Routing as Routing
+
+from tracklib.core.Routing import CompiledNetwork
 from tracklib.core.TrackCollection import TrackCollection
 
 
@@ -72,6 +74,8 @@ class Network:
     # Routing modes
     ROUTING_ALGO_DIJKSTRA = 0
     ROUTING_ALGO_ASTAR = 1 
+    ROUTING_ALGO_BIDIRECTIONAL = 2
+    ROUTING_ALGO_ALT = 3
     
     # Analytical features
     AF_LINK = "#link"
@@ -97,9 +101,14 @@ class Network:
         self.astar_wgt = 1
         
         self.spatial_index = None 
+        self.landmarks = None
+        self.hierarchy = None
+        self.__compiled = None
+        self.__search = None
         
     def addNode(self, node):
         if node.id not in self.NODES:
+            self.__invalidate()
             self.NODES[node.id] = node
             self.__idx_nodes.append(node.id)
             self.NEXT_EDGES[node.id] = []
@@ -120,6 +129,7 @@ class Network:
         edge.target = self.NODES[target.id]
         self.EDGES[edge.id] = edge
         self.__idx_edges.append(edge.id)
+        self.__invalidate()
         
         if edge.orientation >= 0:
             self.NEXT_EDGES[source.id].append(edge.id)
@@ -146,15 +156,59 @@ class Network:
     
     def getIndexNodes(self):
         return self.__idx_nodes
+    def getIndexEdges(self):
+        return self.__idx_edges
+        
+    # ------------------------------------------------------------
+    # Compiles network in a frozen array-based structure (integer
+    # node and edge indices, CSR adjacency arrays and weights, see 
+    # CompiledNetwork in Routing module) used by routing methods. 
+    # Compilation is done automatically before first routing
+    # operation, and invalidated when a node or an edge is added. 
+    # It must be called explicitly after modifying edge weights 
+    # or orientations of a network that has already been used.
+    # A compiled form loaded from disk (CompiledNetwork.load) may
+    # be attached with compile(graph). Structures built on the 
+    # previous compiled form (landmarks, contraction hierarchy and 
+    # prepared distances table) are dropped.
+    # ------------------------------------------------------------
+    def compile(self, graph=None):
+        if graph is None:
+            graph = CompiledNetwork(self)
+        self.__invalidate()
+        self.__compiled = graph
+        return self.__compiled
+    
+    def getCompiledNetwork(self):
+        if self.__compiled is None:
+            self.__compiled = CompiledNetwork(self)
+        return self.__compiled
+        
+    def __invalidate(self):
+        self.__compiled = None
+        self.landmarks = None
+        self.hierarchy = None
+        self.DISTANCES = None
         
     # ------------------------------------------------------------
     # Choose routing mode between:
     #  - ROUTING_ALGO_DIJKSTRA          (0)  [default]
     #  - ROUTING_ALGO_ASTAR             (1)
+    #  - ROUTING_ALGO_BIDIRECTIONAL     (2)
+    #  - ROUTING_ALGO_ALT               (3)
     # ------------------------------------------------------------
     # A* is an efficient approximate version of Dijkstra. It
     # returns exact solution under theoretical assumptions on the
-    # metrics used to set weights on graph edges.  
+    # metrics used to set weights on graph edges (weights not 
+    # lower than AStarWeight x euclidian length of edges).
+    # Bidirectional mode runs Dijkstra's algorithm from both source
+    # and target nodes and is always exact. ALT (A* with Landmarks
+    # and Triangle inequality) is an exact A* algorithm, guided by
+    # distances to a set of landmark nodes, precomputed once with
+    # createLandmarks (or automatically before first ALT query), 
+    # and that may be saved with the network (exportLandmarks).
+    # Modes other than Dijkstra only apply to point-to-point 
+    # queries (i.e. with a target node).
     # ------------------------------------------------------------
     def setRoutingMethod(self, method):
         self.routing_mode = method
@@ -193,17 +247,52 @@ class Network:
     # Spatial index creation, export and import functions
     # ------------------------------------------------------------ 		
 		
-    def createSpatialIndex(self, resolution=None, margin=0.05, verbose=True):
+    def createSpatialIndex(self, resolution=None, margin=0.05, verbose=True, backend=0):
         from tracklib.core.SpatialIndex import SpatialIndex
-        self.spatial_index = SpatialIndex(self, resolution, margin, verbose)
+        self.spatial_index = SpatialIndex.create(self, resolution, margin, verbose, backend)
 
     def exportSpatialIndex(self, filename):
         from tracklib.core.SpatialIndex import SpatialIndex
         self.spatial_index.save(filename)
 
-    def importSpatialIndex(self, filename):
+    def importSpatialIndex(self, filename, mmap=True):
         from tracklib.core.SpatialIndex import SpatialIndex
-        self.spatial_index = SpatialIndex.load(filename)
+        self.spatial_index = SpatialIndex.load(filename, mmap)
+        self.spatial_index.collection = self
+
+    # ------------------------------------------------------------
+    # Landmarks (for ALT routing) creation, export and import 
+    # functions. Landmarks are saved in 3 npy files (filename
+    # .landmarks.npy, filename.from.npy and filename.to.npy).
+    # ------------------------------------------------------------ 
+    def createLandmarks(self, number=16, verbose=True):
+        if verbose:
+            print("Computing landmarks distances...")
+        self.landmarks = Routing.Landmarks.build(self.getCompiledNetwork(), number, verbose)
+
+    def exportLandmarks(self, filename):
+        self.landmarks.save(filename)
+
+    def importLandmarks(self, filename, mmap=True):
+        self.landmarks = Routing.Landmarks.load(filename, mmap)
+
+    # ------------------------------------------------------------
+    # Contraction hierarchy creation, export and import functions.
+    # Once built (or imported), the hierarchy is used as backend of
+    # prepared_shortest_distance (when no distance table has been 
+    # prepared), with node-to-node queries independent of network
+    # size. Hierarchy is saved in a npz file (filename.ch.npz).
+    # ------------------------------------------------------------ 
+    def createContractionHierarchy(self, verbose=True):
+        if verbose:
+            print("Building contraction hierarchy...")
+        self.hierarchy = Routing.ContractionHierarchy.build(self.getCompiledNetwork(), verbose)
+
+    def exportContractionHierarchy(self, filename):
+        self.hierarchy.save(filename)
+
+    def importContractionHierarchy(self, filename):
+        self.hierarchy = Routing.ContractionHierarchy.load(filename)
             
     # ------------------------------------------------------------
     # Topologic methods
@@ -377,12 +466,14 @@ class Network:
     #  - all_shortest_distances: computes all shortest distances 
     #    between pairs of nodes in an efficient way.
     #  - shortest_path: compute shortest path between 2 nodes.
-    #  - prepare: computes all distances between pairs of nodes
+    #  - prepare: computes distances between pairs of nodes in a
+    #    sparse table (optionally in parallel, restricted to sets
+    #    of sources and targets and to a cut distance)
     #  - save_prep: saves the result computed by 'prepare'
-    #  - load_prep: imports the result saved by 'save_prep'
+    #  - load_prep: imports (memory-maps) the result of 'save_prep'
     #  - prepared_shortest_distance: reads shortest distance from 
-    #    a precomputed dictionnary structure. May be called only 
-    #    after prepare or load_prep functions.
+    #    a precomputed table structure. May be called only after 
+    #    prepare or load_prep functions.
     # ------------------------------------------------------------
     # Most of the above search functions may be interrupted before 
     # end by specifying a target node and/or a cut distance.
@@ -423,28 +514,32 @@ class Network:
     # ------------------------------------------------------------
     def sub_network(self, source, cut, mode="TOPOLOGIC", verbose=True):
         if mode == "TOPOLOGIC":
-            self.run_routing_forward(source, cut=cut)
-            return self.__sub_network_routing(verbose)
+            tree = self.run_routing_forward(source, cut=cut)
+            return self.__sub_network_routing(tree, verbose)
         if mode == "GEOMETRIC":
             return self.__sub_network_geometric(source, cut, verbose)
         print("Error: unknown network extraction mode: ",  mode)
         exit(1)
 
-    def __sub_network_routing(self, verbose):
+    def __sub_network_routing(self, tree, verbose):
         if verbose:
             print("Sub network extraction...")
+        graph = tree.graph
         sub_net = Network()
-        to_run = self.getEdgesId()
+        to_run = []
+        for n in tree.SETTLED:
+            for e in self.NBGR_EDGES[graph.getNodeId(n)]:
+                e = graph.getEdgeIndex(e)
+                if (graph.SOURCES[e] in tree.SETTLED) and (graph.TARGETS[e] in tree.SETTLED):
+                    to_run.append(e)
+        to_run = sorted(set(to_run))
         if verbose:
             to_run = progressbar.progressbar(to_run)
-        for eid in to_run:
-            e = self.EDGES[eid]
-            if (not e.source.visite) or (not e.target.visite):
-                continue
+        for e in to_run:
+            e = self.EDGES[graph.getEdgeId(e)]
             sub_net.addEdge(e, e.source, e.target)
         return sub_net
 
-
     def __sub_network_geometric(self, source, cut, verbose):
         if verbose:
             print("Sub network extraction...") 
@@ -465,16 +560,6 @@ class Network:
             sub_net.addEdge(e, e.source, e.target)
         return sub_net
     
-    # ------------------------------------------------------------
-    # Internal function to call before dijkstra forward step
-    # ------------------------------------------------------------    
-    def __resetFlags(self):
-        for elem in self.NODES.items():      
-            elem[1].poids = -1   
-            elem[1].visite = False
-            elem[1].antecedent = ""
-            elem[1].antecedent_edge = ""
-
     # ------------------------------------------------------------
     # Executes forward pass of routing algorithm to find 
     # shortest distance between source node and all other nodes in 
@@ -490,56 +575,52 @@ class Network:
     #  - cut         : a maximal distance for search (optional)
     #  - output_dict : output structure for retrieved distances
     # ------------------------------------------------------------
-    # Output: none (flags modified in node objects)
+    # Output: the search tree (see SearchTree in Routing module), 
+    # containing distances and predecessors of all nodes touched
+    # by the search. Network and node objects are not modified,
+    # hence routing functions may be called concurrently (e.g. 
+    # in a thread pool). The tree is also kept as the last search
+    # of the network, for calls of run_routing_backward without 
+    # search tree (not reentrant).
     # ------------------------------------------------------------
     def run_routing_forward(self, source, target=None, cut=1e300, output_dict=None):
     
         # Input format
         source = self.__correctInputNode(source)
         target = self.__correctInputNode(target)
-    
-        heuristic = 0            
-       
-        # Node initialization
-        self.__resetFlags()
-        self.NODES[source].poids = 0
-
-        pere = self.NODES[source];
-        
-        # Priority heap initialization    
-        fil = priority_dict({self.NODES[source]:self.NODES[source].poids})    
-
-        # Routing   
-        while len(fil) != 0:
-                
-            pere = fil.pop_smallest()
-
-            # Stop conditions
-            if (pere.poids > cut) or (pere.id == target):
-                break
-
-            if not output_dict is None:
-                output_dict[(source, pere.id)] = pere.poids                
-
-            pere.visite = True
-            nextEdges = self.getNextEdges(pere.id)
-
-            # Loop on connected edges
-            for edge_id in nextEdges:
-                e = self.EDGES[edge_id]
-                fils = e.target
-                if fils == pere:
-                    fils = e.source
-                if fils.visite:
-                    continue
-                if (fils.poids == -1) or (pere.poids + e.weight < fils.poids):
-                    if (self.routing_mode == 1) and not (target is None):
-                        heuristic = self.astar_wgt*fils.distanceTo(self.NODES[target])                
-                    fils.poids = pere.poids + e.weight + heuristic
-                    fils.antecedent = pere
-                    fils.antecedent_edge = e.id
-                    fil.__setitem__(fils, fils.poids)
-
+        
+        graph = self.getCompiledNetwork()
+        s = graph.getNodeIndex(source)
+        t = -1 if target is None else graph.getNodeIndex(target)
+        
+        if (target is None) or (self.routing_mode == Network.ROUTING_ALGO_DIJKSTRA):
+            search = Routing.dijkstra(graph, s, t, cut, output_dict)
+        elif self.routing_mode == Network.ROUTING_ALGO_ASTAR:
+            search = Routing.astar(graph, s, t, self.__euclidianPotential(graph, t), cut, output_dict)
+        elif self.routing_mode == Network.ROUTING_ALGO_BIDIRECTIONAL:
+            search = Routing.bidirectional(graph, s, t, cut, output_dict)
+        elif self.routing_mode == Network.ROUTING_ALGO_ALT:
+            if (self.landmarks is None) or (self.landmarks.getNumberOfNodes() != graph.getNumberOfNodes()):
+                self.createLandmarks(verbose=False)
+            search = Routing.astar(graph, s, t, self.landmarks.potential(t), cut, output_dict)
+        else:
+            print("Error: unknown routing mode: ", self.routing_mode)
+            exit(1)
+                    
+        self.__search = search
+        return search
+        
+    # ------------------------------------------------------------
+    # A* potential: weighted euclidian distance to target node
+    # ------------------------------------------------------------
+    def __euclidianPotential(self, graph, target):
+        w = self.astar_wgt
+        if self.getSRID() == "ENU":
+            X = memoryview(graph.X); Y = memoryview(graph.Y); Z = memoryview(graph.Z)
+            xt = X[target]; yt = Y[target]; zt = Z[target]
+            return lambda n: w*((X[n]-xt)**2 + (Y[n]-yt)**2 + (Z[n]-zt)**2)**0.5
+        node = self.NODES[graph.getNodeId(target)]
+        return lambda n: w*self.NODES[graph.getNodeId(n)].distanceTo(node)
 
     # ------------------------------------------------------------
     # Shortest_distance: finds shortest distance between source 
@@ -564,11 +645,11 @@ class Network:
         # Input format
         source = self.__correctInputNode(source) 
         target = self.__correctInputNode(target)
-        self.run_routing_forward(source, target, cut=cut, output_dict=output_dict)
+        tree = self.run_routing_forward(source, target, cut=cut, output_dict=output_dict)
         if not target is None:
-            return self.NODES[target].poids
+            return tree.distance(tree.graph.getNodeIndex(target))
         else:
-            return [(n[1].poids<0)*1e300 + n[1].poids for n in self.NODES.items()]
+            return [tree.distance(i, 1e300) for i in range(tree.graph.getNumberOfNodes())]
 
     # ------------------------------------------------------------
     # Computes all shortest distances between pairs of nodes and 
@@ -608,26 +689,32 @@ class Network:
     # ------------------------------------------------------------
     # Inputs:
     #  - target      : a target node (id or node object)
+    #  - search      : search tree output by run_routing_forward 
+    #                  (default: last search run on the network)
     # ------------------------------------------------------------
     # Output: a track between the source node specified in 
     # 'run_routing_forward" and a target node. The track contains 
     # topologic and non-topologic vertices. If the node target has 
     # not been reached during forward step, None object is output      
     # ------------------------------------------------------------
-    def run_routing_backward(self, target):
+    def run_routing_backward(self, target, search=None):
+        if search is None:
+            search = self.__search
         target = self.__correctInputNode(target)
+        graph = search.graph
         node = self.NODES[target]
         track = Track()
         track.addObs(Obs(node.coord))
-        if node.antecedent == "":
+        path = search.path(graph.getNodeIndex(target))
+        if path is None:
             return None
-        while (node.poids != 0) and (node.antecedent != ""):
-            e = self.EDGES[node.antecedent_edge]
+        for n, e in reversed(path):
+            e = self.EDGES[graph.getEdgeId(e)]
             edge_geom = e.geom.copy()
             if e.source != node:
                 edge_geom = edge_geom.reverse()
             track = track + (edge_geom > 1)
-            node = node.antecedent
+            node = e.source if e.source != node else e.target
         return track
         
     # ------------------------------------------------------------
@@ -643,9 +730,22 @@ class Network:
     # not reachable during forward step, None object is output
     # ------------------------------------------------------------
     def shortest_path(self, source, target, cut=1e300, output_dict=None):
-        self.run_routing_forward(source, target, cut=cut, output_dict=output_dict)
-        return self.run_routing_backward(target)
+        tree = self.run_routing_forward(source, target, cut=cut, output_dict=output_dict)
+        return self.run_routing_backward(target, tree)
 		
+    # ------------------------------------------------------------
+    # Distance between nodes, read in precomputed table or 
+    # contraction hierarchy if any, or computed with current 
+    # routing mode (1e300 if not reachable)
+    # ------------------------------------------------------------
+    def __nodesDistance(self, source, target):
+        if not ((self.DISTANCES is None) and (self.hierarchy is None)):
+            return self.prepared_shortest_distance(source, target)
+        d = self.shortest_distance(source, target)
+        if d < 0:
+            return 1e300
+        return d
+
     # ------------------------------------------------------------
     # Distance between 2 points, each points being described by:
 	#    - edge id number
@@ -664,10 +764,10 @@ class Network:
         d1t = e1.geom.length()-abs_curv_1 
         dt2 = e2.geom.length()-abs_curv_2   	
 
-        dss = self.prepared_shortest_distance(e1.source.id, e2.source.id)
-        dtt = self.prepared_shortest_distance(e1.target.id, e2.target.id)
-        dst = self.prepared_shortest_distance(e1.source.id, e2.target.id)
-        dts = self.prepared_shortest_distance(e1.target.id, e2.source.id)
+        dss = self.__nodesDistance(e1.source.id, e2.source.id)
+        dtt = self.__nodesDistance(e1.target.id, e2.target.id)
+        dst = self.__nodesDistance(e1.source.id, e2.target.id)
+        dts = self.__nodesDistance(e1.target.id, e2.source.id)
 	
         d1 = d1s + dss + ds2
         d2 = d1t + dtt + dt2
@@ -677,18 +777,36 @@ class Network:
         return min(min(d1,d2), min(d3,d4))
 	
     # ------------------------------------------------------------
-    # Precomputes shortest distances between all pairs of nodes 
-    # and saves the result in DISTANCES attribute.
+    # Precomputes shortest distances between pairs of nodes and 
+    # saves the result in DISTANCES attribute, as a sparse table
+    # indexed by integer node indices (see DistanceTable in 
+    # Routing module). Only distances between sources and targets
+    # (all nodes by default) that are lower than cut are computed.
+    # Searches from sources may be dispatched over a pool of 
+    # processes. If DISTANCES has already been computed, new 
+    # distances are added to the table.
     # ------------------------------------------------------------
     # Inputs:
     #  - cut         : a maximal distance for search (optional)
+    #  - sources     : list of source nodes (id or node objects)
+    #  - targets     : list of target nodes (id or node objects)
+    #  - workers     : number of processes for computation
     # ------------------------------------------------------------
     # Output: none, DISTANCES attribute is built or updated 
     # ------------------------------------------------------------    
-    def prepare(self, cut=1e300):
+    def prepare(self, cut=1e300, sources=None, targets=None, workers=1, verbose=True):
+        graph = self.getCompiledNetwork()
+        if not sources is None:
+            sources = [graph.getNodeIndex(self.__correctInputNode(n)) for n in sources]
+        if not targets is None:
+            targets = [graph.getNodeIndex(self.__correctInputNode(n)) for n in targets]
+        if verbose:
+            print("Computing shortest distances table...")
+        table = Routing.distanceTable(graph, sources, targets, cut, workers, verbose)
         if self.DISTANCES is None:
-            self.DISTANCES = dict()
-        self.all_shortest_distances(cut=cut, output_dict=self.DISTANCES)
+            self.DISTANCES = table
+        else:
+            self.DISTANCES = self.DISTANCES.update(table)
         
     # ------------------------------------------------------------
     # Tests if a shortest distance has been precomputed
@@ -702,17 +820,18 @@ class Network:
     # ------------------------------------------------------------
     def has_prepared_shortest_distance(self, source, target):
         if self.DISTANCES is None:
+            if not self.hierarchy is None:
+                return True
             print("Error: prepare function must be called before attempting to use preparation")    
-        if isinstance(source, Node):
-            source = source.id
-        if isinstance(target, Node):
-            target = target.id  
-        key = (source, target)
-        return key in self.DISTANCES
+        graph = self.getCompiledNetwork()
+        source = graph.getNodeIndex(self.__correctInputNode(source))
+        target = graph.getNodeIndex(self.__correctInputNode(target))
+        return self.DISTANCES.contains(source, target)
 
     # ------------------------------------------------------------
     # Finds shortest distance from the precomputation. May be 
-    # called only after prepare or load_prep. 
+    # called only after prepare or load_prep, or after creation 
+    # (or import) of a contraction hierarchy. 
     # ------------------------------------------------------------
     # Inputs:
     #  - source      : a source node (id or node object)
@@ -722,20 +841,18 @@ class Network:
     # 1e300 if shortest distance has not been precomputed.
     # ------------------------------------------------------------
     def prepared_shortest_distance(self, source, target):
-        if self.DISTANCES is None:
+        if (self.DISTANCES is None) and (self.hierarchy is None):
             print("Error: prepare function must be called before attempting to use preparation")
-        if isinstance(source, Node):
-            source = source.id
-        if isinstance(target, Node):
-            target = target.id  
-        key = (source, target)
-        if key in self.DISTANCES:
-            return self.DISTANCES[key]
-        else:
-            return 1e300
+        graph = self.getCompiledNetwork()
+        source = graph.getNodeIndex(self.__correctInputNode(source))
+        target = graph.getNodeIndex(self.__correctInputNode(target))
+        if self.DISTANCES is None:
+            return self.hierarchy.distance(source, target)
+        return self.DISTANCES.get(source, target, 1e300)
         
     # ------------------------------------------------------------
-    # Saves DISTANCES attribute in a npy file for further use
+    # Saves DISTANCES attribute in npy files for further use
+    # (filename.ptr.npy, filename.target.npy, filename.dist.npy)
     # ------------------------------------------------------------    
     # Inputs:
     #  - filename      : path to save precomputed structure
@@ -744,17 +861,28 @@ class Network:
         if self.DISTANCES is None:
             print("Error: prepare function must be called before attempting to save preparation")
             exit(1)
-        np.save(filename, self.DISTANCES) 
+        if filename[-4:] == '.npy':
+            filename = filename[:-4]
+        self.DISTANCES.save(filename) 
         
     # ------------------------------------------------------------
-    # Imports DISTANCES attribute from an npy file
+    # Imports DISTANCES attribute from npy files. Arrays are 
+    # memory-mapped (not loaded in memory) if mmap is True. Files 
+    # saved as a dictionnary {key=(source, n), value=d} (former 
+    # format) are converted on the fly.
     # ------------------------------------------------------------
-        # Inputs:
+    # Inputs:
     #  - filename      : path where precomputed structure is saved
     # ------------------------------------------------------------
-    def load_prep(self, filename):
-        if len(filename) < 4:
-            filename = filename + '.npy'
-        if filename[:-4] != '.npy':
-            filename = filename + '.npy'
-        self.DISTANCES = read_dictionary = np.load(filename, allow_pickle='TRUE').item()
+    def load_prep(self, filename, mmap=True):
+        if filename[-4:] == '.npy':
+            filename = filename[:-4]
+        if Routing.DistanceTable.exists(filename):
+            self.DISTANCES = Routing.DistanceTable.load(filename, mmap)
+            return
+        graph = self.getCompiledNetwork()
+        DICT = np.load(filename + '.npy', allow_pickle=True).item()
+        S = [graph.getNodeIndex(k[0]) for k in DICT.keys()]
+        T = [graph.getNodeIndex(k[1]) for k in DICT.keys()]
+        D = list(DICT.values())
+        self.DISTANCES = Routing.DistanceTable.fromTriplets(graph.getNumberOfNodes(), S, T, D)
@@ -56,6 +56,8 @@ class Obs:
 	def __check_call_geom2(fname, obs1, obs2):
 		c1 = type(obs1.position)
 		c2 = type(obs2.position)
+		c1 = getattr(c1, "_base_class", c1)   # Columnar views
+		c2 = getattr(c2, "_base_class", c2)
 		nc1 = (str)(c1)[7:-1]
 		nc2 = (str)(c2)[7:-1]
 		if (c1 != c2):
@@ -0,0 +1,492 @@
+# ------------------------- ObsTable -----------------------------
+# Columnar storage of observations in a GPS track. Coordinates,
+# timestamps (float seconds since 1970/01/01 00:00:00) and each
+# analytical feature are stored as contiguous numpy arrays.
+# Accessing a row returns a lightweight ObsView, which behaves
+# like an Obs object but reads from and writes to the columns.
+# ----------------------------------------------------------------
+import sys
+import numpy as np
+
+from tracklib.core.Obs import Obs
+from tracklib.core.GPSTime import GPSTime
+from tracklib.core.Coords import ENUCoords, GeoCoords, ECEFCoords
+
+# Initial number of allocated rows
+INITIAL_CAPACITY = 16
+
+# Obs attributes (other than position, timestamp and features)
+OBS_EXTRA_ATTRIBUTES = ["gdop", "pdop", "vdop", "hdop", "tdop",
+                        "nb_sats", "mask", "code", "azimut", "elevation"]
+
+SRID_NAMES = {ENUCoords : "ENU", GeoCoords : "Geo", ECEFCoords : "ECEF"}
+
+
+# --------------------------------------------------
+# Coordinates class of a position (ignoring views)
+# --------------------------------------------------
+def coordsClass(position):
+    return getattr(type(position), "_base_class", type(position))
+
+def _columnProperty(name):
+    def getter(self):
+        return float(getattr(self._table, name)[self._i])
+    def setter(self, value):
+        getattr(self._table, name)[self._i] = value
+        self._table._invalidate()
+    return property(getter, setter)
+
+
+# --------------------------------------------------
+# Coordinates views (write-through to table columns)
+# --------------------------------------------------
+class _ENUCoordsView(ENUCoords):
+    _base_class = ENUCoords
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+    E = _columnProperty("_x")
+    N = _columnProperty("_y")
+    U = _columnProperty("_z")
+    def copy(self):
+        return ENUCoords(self.E, self.N, self.U)
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+class _GeoCoordsView(GeoCoords):
+    _base_class = GeoCoords
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+    lon = _columnProperty("_x")
+    lat = _columnProperty("_y")
+    hgt = _columnProperty("_z")
+    def copy(self):
+        return GeoCoords(self.lon, self.lat, self.hgt)
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+class _ECEFCoordsView(ECEFCoords):
+    _base_class = ECEFCoords
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+    X = _columnProperty("_x")
+    Y = _columnProperty("_y")
+    Z = _columnProperty("_z")
+    def copy(self):
+        return ECEFCoords(self.X, self.Y, self.Z)
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+VIEW_CLASSES = {"ENU" : _ENUCoordsView, "Geo" : _GeoCoordsView, "ECEF" : _ECEFCoordsView}
+PLAIN_CLASSES = {"ENU" : ENUCoords, "Geo" : GeoCoords, "ECEF" : ECEFCoords}
+
+
+# --------------------------------------------------
+# Analytical features of a single row
+# --------------------------------------------------
+class _FeaturesView:
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+    def __len__(self):
+        return len(self._table._features)
+    def __getitem__(self, k):
+        return self._table.getFeature(self._i, k)
+    def __setitem__(self, k, value):
+        self._table.setFeature(self._i, k, value)
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+    def __str__(self):
+        return str(list(self))
+
+
+# --------------------------------------------------
+# Observation view (row i of an ObsTable)
+# --------------------------------------------------
+class ObsView(Obs):
+
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+
+    def __getPosition(self):
+        return VIEW_CLASSES[self._table.srid](self._table, self._i)
+    def __setPosition(self, position):
+        self._table.setPosition(self._i, position)
+    position = property(__getPosition, __setPosition)
+
+    def __getTimestamp(self):
+        return GPSTime.readUnixTime(self._table._t[self._i])
+    def __setTimestamp(self, timestamp):
+        self._table._t[self._i] = timestamp.toAbsTime()
+    timestamp = property(__getTimestamp, __setTimestamp)
+
+    def __getFeatures(self):
+        return _FeaturesView(self._table, self._i)
+    def __setFeatures(self, features):
+        self._table.setFeatures(self._i, features)
+    features = property(__getFeatures, __setFeatures)
+
+    # Copy is a standalone (materialized) Obs object
+    def copy(self):
+        return self._table.materialize(self._i)
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+def _extraProperty(name):
+    def getter(self):
+        return self._table.getExtra(name, self._i)
+    def setter(self, value):
+        self._table.setExtra(name, self._i, value)
+    return property(getter, setter)
+
+for _name in OBS_EXTRA_ATTRIBUTES:
+    setattr(ObsView, _name, _extraProperty(_name))
+
+
+class ObsTable:
+
+    # --------------------------------------------------
+    # Empty table. Coordinates system (ENU, Geo or ECEF)
+    # is set with the first registered observation.
+    # --------------------------------------------------
+    def __init__(self, srid=None, capacity=INITIAL_CAPACITY):
+        self.srid = srid
+        self._n = 0
+        self._x = np.zeros(capacity)
+        self._y = np.zeros(capacity)
+        self._z = np.zeros(capacity)
+        self._t = np.zeros(capacity)
+        self._features = []
+        self._extras = {}
+        self._version = 0
+
+    # --------------------------------------------------
+    # Builds a table from a list of Obs
+    # --------------------------------------------------
+    @staticmethod
+    def fromObsList(list_of_obs):
+        table = ObsTable(capacity=max(len(list_of_obs), INITIAL_CAPACITY))
+        if len(list_of_obs) > 0:
+            nb_af = len(list_of_obs[0].features)
+            for k in range(nb_af):
+                table._features.append(np.zeros(table._capacity()))
+        for obs in list_of_obs:
+            table.append(obs)
+        return table
+
+    # --------------------------------------------------
+    # Builds a table from coordinate and time arrays
+    # --------------------------------------------------
+    @staticmethod
+    def fromArrays(x, y, z=None, t=None, srid="ENU"):
+        n = len(x)
+        table = ObsTable(srid, capacity=max(n, INITIAL_CAPACITY))
+        table._x[0:n] = x
+        table._y[0:n] = y
+        if z is not None:
+            table._z[0:n] = z
+        if t is not None:
+            table._t[0:n] = t
+        table._n = n
+        return table
+
+    def toObsList(self):
+        return [self.materialize(i) for i in range(self._n)]
+
+    # --------------------------------------------------
+    # Columns (views on the first n allocated rows)
+    # --------------------------------------------------
+    @property
+    def x(self):
+        return self._x[0:self._n]
+    @property
+    def y(self):
+        return self._y[0:self._n]
+    @property
+    def z(self):
+        return self._z[0:self._n]
+    @property
+    def t(self):
+        return self._t[0:self._n]
+
+    def column(self, k):
+        return self._features[k][0:self._n]
+
+    def setColumn(self, k, values):
+        if not isinstance(values, np.ndarray):
+            if all(isinstance(v, (float, np.floating)) for v in values):
+                values = np.array(values, dtype=float)
+            else:
+                array = np.empty(len(values), dtype=object)
+                for i in range(len(values)):
+                    array[i] = values[i]
+                values = array
+        if values.dtype.kind == "f":
+            if self._features[k].dtype != float:
+                self._features[k] = np.zeros(self._capacity())
+        else:
+            self._features[k] = self._features[k].astype(object)
+        self._features[k][0:self._n] = values
+
+    def addColumn(self, val_init=0.0):
+        col = np.zeros(self._capacity())
+        self._features.append(col)
+        k = len(self._features)-1
+        if isinstance(val_init, (list, np.ndarray)):
+            self.setColumn(k, val_init)
+        elif isinstance(val_init, (float, np.floating)):
+            col[0:self._n] = val_init
+        else:
+            self._features[k] = col.astype(object)
+            self._features[k][0:self._n] = [val_init]*self._n
+        return k
+
+    def removeColumn(self, k):
+        del self._features[k]
+
+    def nbColumns(self):
+        return len(self._features)
+
+    # --------------------------------------------------
+    # Coordinates version counter (incremented each
+    # time positions are modified)
+    # --------------------------------------------------
+    def _invalidate(self):
+        self._version += 1
+
+    def version(self):
+        return self._version
+
+    # --------------------------------------------------
+    # Cell accessors
+    # --------------------------------------------------
+    def getFeature(self, i, k):
+        val = self._features[k][self.__index(i)]
+        if isinstance(val, np.floating):
+            return float(val)
+        return val
+
+    def setFeature(self, i, k, value):
+        col = self._features[k]
+        if (col.dtype == float) and not isinstance(value, (float, np.floating)):
+            self._features[k] = col.astype(object)
+        self._features[k][self.__index(i)] = value
+
+    def setFeatures(self, i, features):
+        i = self.__index(i)
+        if len(features) != len(self._features):
+            sys.exit("Error: observation has " + str(len(features)) + " feature(s), table has " + str(len(self._features)))
+        for k in range(len(features)):
+            self.setFeature(i, k, features[k])
+
+    def getExtra(self, name, i):
+        if not name in self._extras:
+            return 0
+        return self._extras[name][self.__index(i)]
+
+    def setExtra(self, name, i, value):
+        if not name in self._extras:
+            self._extras[name] = np.zeros(self._capacity(), dtype=object)
+        self._extras[name][self.__index(i)] = value
+
+    def setPosition(self, i, position):
+        i = self.__index(i)
+        srid = SRID_NAMES[coordsClass(position)]
+        if self.srid != srid:
+            if self._n > 1:
+                sys.exit("Error: can't set " + srid + " position in a table of " + str(self.srid) + " coordinates")
+            self.srid = srid
+        self._x[i] = position.getX()
+        self._y[i] = position.getY()
+        self._z[i] = position.getZ()
+        self._invalidate()
+
+    # --------------------------------------------------
+    # Replace all positions (possibly with a change of
+    # coordinate system)
+    # --------------------------------------------------
+    def setPositions(self, x, y, z, srid):
+        self._x[0:self._n] = x
+        self._y[0:self._n] = y
+        self._z[0:self._n] = z
+        self.srid = srid
+        self._invalidate()
+
+    def materialize(self, i):
+        i = self.__index(i)
+        position = PLAIN_CLASSES[self.srid](float(self._x[i]), float(self._y[i]), float(self._z[i]))
+        obs = Obs(position, GPSTime.readUnixTime(self._t[i]))
+        obs.features = [self.getFeature(i, k) for k in range(len(self._features))]
+        for name in self._extras:
+            setattr(obs, name, self._extras[name][i])
+        return obs
+
+    # --------------------------------------------------
+    # Row management
+    # --------------------------------------------------
+    def _capacity(self):
+        return self._x.shape[0]
+
+    def __reserve(self, n):
+        capacity = self._capacity()
+        if n <= capacity:
+            return
+        capacity = max(n, 2*capacity)
+        def grow(col):
+            new_col = np.zeros(capacity, dtype=col.dtype)
+            new_col[0:self._n] = col[0:self._n]
+            return new_col
+        self._x = grow(self._x)
+        self._y = grow(self._y)
+        self._z = grow(self._z)
+        self._t = grow(self._t)
+        self._features = [grow(col) for col in self._features]
+        for name in self._extras:
+            self._extras[name] = grow(self._extras[name])
+
+    def __index(self, i):
+        if i < 0:
+            i += self._n
+        if (i < 0) or (i >= self._n):
+            raise IndexError("observation index out of range")
+        return i
+
+    def __writeRow(self, i, obs):
+        if self.srid is None:
+            self.srid = SRID_NAMES[coordsClass(obs.position)]
+        self.setPosition(i, obs.position)
+        self._t[i] = obs.timestamp.toAbsTime()
+        features = obs.features
+        for k in range(len(self._features)):
+            if k < len(features):
+                self.setFeature(i, k, features[k])
+            else:
+                self.setFeature(i, k, np.nan)
+        for name in OBS_EXTRA_ATTRIBUTES:
+            value = getattr(obs, name, 0)
+            if (value != 0) or (name in self._extras):
+                self.setExtra(name, i, value)
+
+    def append(self, obs):
+        self.__reserve(self._n+1)
+        self._n += 1
+        self.__writeRow(self._n-1, obs)
+
+    def insert(self, i, obs):
+        if i < 0:
+            i = max(i + self._n, 0)
+        i = min(i, self._n)
+        self.__reserve(self._n+1)
+        def shift(col):
+            col[i+1:self._n+1] = col[i:self._n]
+        for col in [self._x, self._y, self._z, self._t] + self._features + list(self._extras.values()):
+            shift(col)
+        self._n += 1
+        self.__writeRow(i, obs)
+
+    def pop(self, i=-1):
+        obs = self.materialize(i)
+        del self[i]
+        return obs
+
+    def take(self, index):
+        index = np.asarray(index, dtype=int)
+        output = ObsTable(self.srid, capacity=max(len(index), INITIAL_CAPACITY))
+        n = len(index)
+        output._x[0:n] = self._x[index]
+        output._y[0:n] = self._y[index]
+        output._z[0:n] = self._z[index]
+        output._t[0:n] = self._t[index]
+        for col in self._features:
+            new_col = np.zeros(output._capacity(), dtype=col.dtype)
+            new_col[0:n] = col[index]
+            output._features.append(new_col)
+        for name in self._extras:
+            output._extras[name] = np.zeros(output._capacity(), dtype=object)
+            output._extras[name][0:n] = self._extras[name][index]
+        output._n = n
+        return output
+
+    # ------------------------------------------------------------
+    # List-like interface
+    # ------------------------------------------------------------
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield ObsView(self, i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.take(np.arange(self._n)[i])
+        return ObsView(self, self.__index(i))
+
+    def __setitem__(self, i, obs):
+        self.__writeRow(self.__index(i), obs)
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            index = np.arange(self._n)[i]
+        else:
+            index = [self.__index(i)]
+        keep = np.setdiff1d(np.arange(self._n), index)
+        n = len(keep)
+        for col in [self._x, self._y, self._z, self._t] + self._features + list(self._extras.values()):
+            col[0:n] = col[keep]
+        self._n = n
+        self._invalidate()
+
+    def __add__(self, other):
+        return self.concatenate(other)
+
+    # --------------------------------------------------
+    # Concatenation of two tables. columns: list of pairs 
+    # (k1, k2) of feature column indices in self and in 
+    # other, for each output column (None if the feature 
+    # is missing in a table: values are set to NaN). By 
+    # default, columns are concatenated in same order.
+    # --------------------------------------------------
+    def concatenate(self, other, columns=None):
+        if not isinstance(other, ObsTable):
+            other = ObsTable.fromObsList(other)
+        if columns is None:
+            if self.nbColumns() != other.nbColumns() and len(self) > 0 and len(other) > 0:
+                sys.exit("Error: can't concatenate observations with " + str(self.nbColumns()) + 
+                         " and " + str(other.nbColumns()) + " feature(s)")
+            nb = max(self.nbColumns(), other.nbColumns())
+            columns = [(k if k < self.nbColumns() else None, k if k < other.nbColumns() else None) for k in range(nb)]
+        srid = self.srid
+        if len(self) > 0 and len(other) > 0:
+            if self.srid != other.srid:
+                sys.exit("Error: can't concatenate " + str(self.srid) + " and " + str(other.srid) + " observations")
+        elif len(self) == 0:
+            srid = other.srid
+        n1 = self._n
+        n = self._n + other._n
+        output = ObsTable(srid, capacity=max(n, INITIAL_CAPACITY))
+        output._x[0:n] = np.concatenate((self.x, other.x))
+        output._y[0:n] = np.concatenate((self.y, other.y))
+        output._z[0:n] = np.concatenate((self.z, other.z))
+        output._t[0:n] = np.concatenate((self.t, other.t))
+        def part(table, k, size):
+            if k is None:
+                return np.full(size, np.nan)
+            return table.column(k)
+        for (k1, k2) in columns:
+            col = np.concatenate((part(self, k1, n1), part(other, k2, n-n1)))
+            new_col = np.zeros(output._capacity(), dtype=col.dtype)
+            new_col[0:n] = col
+            output._features.append(new_col)
+        for name in set(self._extras) | set(other._extras):
+            output._extras[name] = np.zeros(output._capacity(), dtype=object)
+            if name in self._extras:
+                output._extras[name][0:n1] = self._extras[name][0:n1]
+            if name in other._extras:
+                output._extras[name][n1:n] = other._extras[name][0:n-n1]
+        output._n = n
+        return output
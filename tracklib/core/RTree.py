@@ -0,0 +1,421 @@
+# -------------------------- RTree --------------------------------------------
+# R-tree spatial index, bulk-loaded with Sort-Tile-Recursive
+# (STR) packing. Alternative to the uniform grid of SpatialIndex
+# for features with heterogeneous densities.
+# -----------------------------------------------------------------------------
+import os
+import sys
+import math
+import heapq
+import progressbar
+import numpy as np
+import matplotlib.pyplot as plt
+
+from tracklib.core.Track import Track
+from tracklib.core.Network import Edge
+from tracklib.core.TrackCollection import TrackCollection
+from tracklib.core.Coords import GeoCoords, ENUCoords
+import tracklib.core.Utils as Utils
+
+
+class RTree:
+
+    # Max number of children per node
+    NODE_CAPACITY = 16
+
+    # Segment arrays saved on disk (see save)
+    ARRAYS = ["SEG_X1", "SEG_Y1", "SEG_X2", "SEG_Y2", "SEG_DATA", "SEG_INDEX"]
+
+    # ------------------------------------------------------------
+    # Same construction as SpatialIndex. Leaves of the tree are
+    # segments of features, indexed by their bounding boxes. The
+    # resolution (dX, dY) has no effect on the tree itself, it
+    # only sets the size of the 'unit' of neighborhood function,
+    # such that both index types may be used interchangeably.
+    # ------------------------------------------------------------
+    # Tree is stored level by level, from leaves (level 0) to root:
+    #  - NODE_BOXES[L]: bounding boxes (xmin, ymin, xmax, ymax) of
+    #    nodes of level L
+    #  - NODE_CHILDREN[L]: children of node k of level L are given
+    #    by NODE_CHILDREN[L][k*M:(k+1)*M] with M = NODE_CAPACITY.
+    #    They are nodes of level L-1, or segments for L = 0.
+    # ------------------------------------------------------------
+    def __init__(self, collection, resolution=None, margin=0.05, verbose=True):
+
+        from tracklib.core.SpatialIndex import SpatialIndex
+
+        # Bbox only or collection
+        if isinstance(collection, tuple):
+            bb = collection
+        else:
+            bb = collection.bbox()
+
+        (self.xmin, self.xmax, self.ymin, self.ymax) = SpatialIndex._addMargin(bb, margin)
+
+        ax = self.xmax-self.xmin
+        ay = self.ymax-self.ymin
+
+        if resolution is None:
+            am = max(ax, ay)
+            r = am/100; resolution = (int(ax/r), int(ay/r))
+        else:
+            r = resolution
+            resolution = (int(ax/r[0]), int(ay/r[1]))
+
+        self.collection = collection
+        self.resolution = resolution
+        self.dX = ax / self.resolution[0]
+        self.dY = ay / self.resolution[1]
+
+        # Segments : extremites, feature SEG_DATA et rang SEG_INDEX
+        # du segment dans le feature
+        self.SEG_X1 = np.zeros(0); self.SEG_Y1 = np.zeros(0)
+        self.SEG_X2 = np.zeros(0); self.SEG_Y2 = np.zeros(0)
+        self.SEG_DATA = np.zeros(0, dtype=np.int64)
+        self.SEG_INDEX = np.zeros(0, dtype=np.int64)
+        self.NODE_BOXES = []
+        self.NODE_CHILDREN = []
+        self.__pending = []
+
+        if isinstance(collection, tuple):
+            self.collection = TrackCollection()
+            return
+
+        X = []; Y = []; DATA = []
+        boucle = range(collection.size())
+        if verbose:
+            print("Building R-tree spatial index...")
+            boucle = progressbar.progressbar(boucle)
+        for num in boucle:
+            feature = collection[num]
+            if isinstance(feature, Edge):
+                feature = feature.geom
+            if not isinstance(feature, Track) or feature.size() < 2:
+                continue
+            X.append(np.asarray(feature.getX(), dtype=float))
+            Y.append(np.asarray(feature.getY(), dtype=float))
+            DATA.append(np.full(feature.size(), num, dtype=np.int64))
+        if len(X) > 0:
+            self.addPolylines(np.concatenate(X), np.concatenate(Y), np.concatenate(DATA))
+        self.__build()
+
+    def __str__(self):
+        self.__build()
+        output  = "R-tree spatial index with " + str(len(self.SEG_DATA)) + " segments "
+        output += "and " + str(len(self.NODE_BOXES)) + " levels"
+        return output
+
+    # ------------------------------------------------------------
+    # Insertion functions (see SpatialIndex). Tree is packed again
+    # on next query.
+    # ------------------------------------------------------------
+    def addFeature(self, track, num):
+        if track.size() < 2:
+            return
+        X = np.asarray(track.getX(), dtype=float)
+        Y = np.asarray(track.getY(), dtype=float)
+        self.addPolylines(X, Y, np.full(len(X), num, dtype=np.int64))
+
+    def addPolylines(self, X, Y, DATA):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        DATA = np.asarray(DATA, dtype=np.int64)
+        if len(X) < 2:
+            return
+        same = (DATA[1:] == DATA[:-1])
+        starts = np.flatnonzero(np.concatenate(([True], ~same)))
+        INDEX = np.arange(len(same)) - starts[np.cumsum(~same)]
+        self.addSegments(X[:-1][same], Y[:-1][same], X[1:][same], Y[1:][same], DATA[:-1][same], INDEX[same])
+
+    def addSegments(self, X1, Y1, X2, Y2, DATA, INDEX=None):
+        DATA = np.asarray(DATA, dtype=np.int64)
+        if INDEX is None:
+            INDEX = np.zeros(len(DATA), dtype=np.int64)
+        if len(DATA) == 0:
+            return
+        self.__pending.append((np.asarray(X1, dtype=float), np.asarray(Y1, dtype=float),
+                               np.asarray(X2, dtype=float), np.asarray(Y2, dtype=float),
+                               DATA, np.asarray(INDEX, dtype=np.int64)))
+
+    # ------------------------------------------------------------
+    # STR bulk loading: at each level, boxes are sorted by center
+    # x coordinate, cut into S vertical slices of S*M boxes (with
+    # S = ceil(sqrt(P)), P = number of nodes to create), each slice
+    # being sorted by center y coordinate and packed in nodes of
+    # M consecutive boxes.
+    # ------------------------------------------------------------
+    def __build(self):
+        if (len(self.__pending) == 0) and (len(self.NODE_BOXES) > 0 or len(self.SEG_DATA) == 0):
+            return
+        ARRAYS = [[self.SEG_X1], [self.SEG_Y1], [self.SEG_X2], [self.SEG_Y2], [self.SEG_DATA], [self.SEG_INDEX]]
+        for pending in self.__pending:
+            for k in range(len(ARRAYS)):
+                ARRAYS[k].append(pending[k])
+        self.__pending = []
+        (self.SEG_X1, self.SEG_Y1, self.SEG_X2, self.SEG_Y2, self.SEG_DATA, self.SEG_INDEX) = [np.concatenate(A) for A in ARRAYS]
+
+        M = RTree.NODE_CAPACITY
+        BOXES = self.__segmentBoxes(np.arange(len(self.SEG_DATA)))
+        self.NODE_BOXES = []
+        self.NODE_CHILDREN = []
+        while True:
+            n = len(BOXES)
+            P = -(-n // M)
+            S = math.ceil(math.sqrt(P))
+            slices = np.empty(n, dtype=np.int64)
+            slices[np.argsort(BOXES[:, 0] + BOXES[:, 2], kind="stable")] = np.arange(n) // (S*M)
+            order = np.lexsort((BOXES[:, 1] + BOXES[:, 3], slices))
+            BOXES = BOXES[order]
+            starts = np.arange(0, n, M)
+            NODES = np.column_stack((np.minimum.reduceat(BOXES[:, 0], starts), np.minimum.reduceat(BOXES[:, 1], starts),
+                                     np.maximum.reduceat(BOXES[:, 2], starts), np.maximum.reduceat(BOXES[:, 3], starts)))
+            self.NODE_CHILDREN.append(order)
+            self.NODE_BOXES.append(NODES)
+            if P == 1:
+                break
+            BOXES = NODES
+
+    def __segmentBoxes(self, SEGS):
+        X1 = self.SEG_X1[SEGS]; X2 = self.SEG_X2[SEGS]
+        Y1 = self.SEG_Y1[SEGS]; Y2 = self.SEG_Y2[SEGS]
+        return np.column_stack((np.minimum(X1, X2), np.minimum(Y1, Y2), np.maximum(X1, X2), np.maximum(Y1, Y2)))
+
+    # ------------------------------------------------------------
+    # Children (positions in level below) of nodes K of level L
+    # ------------------------------------------------------------
+    def __children(self, L, K):
+        M = RTree.NODE_CAPACITY
+        size = len(self.NODE_CHILDREN[L])
+        counts = np.minimum(K*M + M, size) - K*M
+        P = np.repeat(K*M - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return self.NODE_CHILDREN[L][P]
+
+    # ------------------------------------------------------------
+    # Segments whose bbox intersects box (xmin, ymin, xmax, ymax)
+    # ------------------------------------------------------------
+    def __searchBox(self, box):
+        self.__build()
+        if len(self.NODE_BOXES) == 0:
+            return np.zeros(0, dtype=np.int64)
+        K = np.arange(len(self.NODE_BOXES[-1]))
+        for L in range(len(self.NODE_BOXES)-1, -1, -1):
+            B = self.NODE_BOXES[L][K]
+            K = K[(B[:, 0] <= box[2]) & (B[:, 2] >= box[0]) & (B[:, 1] <= box[3]) & (B[:, 3] >= box[1])]
+            K = self.__children(L, K)
+        B = self.__segmentBoxes(K)
+        K = K[(B[:, 0] <= box[2]) & (B[:, 2] >= box[0]) & (B[:, 1] <= box[3]) & (B[:, 3] >= box[1])]
+        return np.sort(K)
+
+    # ------------------------------------------------------------
+    # Features (in order of insertion) of segments SEGS
+    # ------------------------------------------------------------
+    def __features(self, SEGS):
+        DATA, first = np.unique(self.SEG_DATA[SEGS], return_index=True)
+        return DATA[np.argsort(first)].tolist()
+
+    # ------------------------------------------------------------
+    # Request function (see SpatialIndex.request). Cells of the
+    # grid are replaced by segments bounding boxes:
+	#   - request(coord) returns data of segments whose bbox
+	#     contains coord
+	#   - request(list) returns data of segments whose bbox
+	#     intersects bbox of segment list=[coord1, coord2]
+	#	- request(track) returns data of segments whose bbox
+	#     intersects bbox of a segment of track.
+    # ------------------------------------------------------------
+    def request(self, obj, j=None):
+        if isinstance(obj, int):
+            sys.exit("Error: cell (i,j) request is not available on R-tree spatial index")
+        return self.__features(self.__requestSegments(obj, 0, 0))
+
+    def __requestSegments(self, obj, mx, my):
+        if isinstance(obj, GeoCoords) or isinstance(obj, ENUCoords):
+            x = obj.getX(); y = obj.getY()
+            return self.__searchBox((x-mx, y-my, x+mx, y+my))
+        if isinstance(obj, list):
+            [coord1, coord2] = obj
+            X = [coord1.getX(), coord2.getX()]; Y = [coord1.getY(), coord2.getY()]
+            return self.__searchBox((min(X)-mx, min(Y)-my, max(X)+mx, max(Y)+my))
+        if isinstance(obj, Track):
+            SEGS = [np.zeros(0, dtype=np.int64)]
+            for i in range(obj.size()-1):
+                SEGS.append(self.__requestSegments([obj[i].position, obj[i+1].position], mx, my))
+            return np.unique(np.concatenate(SEGS))
+        return np.zeros(0, dtype=np.int64)
+
+    # ------------------------------------------------------------
+    # Neighborhood function (see SpatialIndex.neighborhood). The
+    # vicinity of 'unit' is the bbox of the object enlarged by
+    # (unit+1/2)*dX (resp. dY), i.e. the area covered by cells at
+    # less than unit distance from the cell of the object in a
+    # grid of same resolution. If unit=-1, the minimal value is
+    # selected in order to get at least 1 data in output (with
+    # an additional margin of 1 unit for segments and tracks).
+    # ------------------------------------------------------------
+    def neighborhood(self, obj, j=None, unit=0):
+        if isinstance(obj, int):
+            sys.exit("Error: cell (i,j) neighborhood is not available on R-tree spatial index")
+        if unit != -1:
+            SEGS = self.__requestSegments(obj, (unit+0.5)*self.dX, (unit+0.5)*self.dY)
+            return self.__features(SEGS)
+
+        self.__build()
+        if len(self.SEG_DATA) == 0:
+            return []
+        if isinstance(obj, GeoCoords) or isinstance(obj, ENUCoords):
+            d = self.nearest(obj, 1)[0][2]
+            u = max(math.ceil(d/min(self.dX, self.dY) - 0.5), 0)
+            return self.neighborhood(obj, None, u)
+        (lo, hi) = (-1, 0)
+        while len(self.__requestSegments(obj, (hi+0.5)*self.dX, (hi+0.5)*self.dY)) == 0:
+            (lo, hi) = (hi, 2*hi + 1)
+        while hi - lo > 1:
+            u = (lo + hi) // 2
+            if len(self.__requestSegments(obj, (u+0.5)*self.dX, (u+0.5)*self.dY)) > 0:
+                hi = u
+            else:
+                lo = u
+        return self.neighborhood(obj, None, hi+1)
+
+    # ------------------------------------------------------------
+	# Function to convert ground distance into unit number
+	# ------------------------------------------------------------
+    def groundDistanceToUnits(self, distance):
+        return math.floor(distance/max(self.dX, self.dY)+1)
+
+    # ------------------------------------------------------------
+	# Exact nearest neighbours queries (see SpatialIndex.nearest)
+	# with best-first search over nodes of the tree, segment
+	# bounding boxes and segments.
+	# ------------------------------------------------------------
+    def nearest(self, coord, k=1):
+        OUTPUT = []
+        if k <= 0:
+            return OUTPUT
+        for result in self.__bestFirst(coord):
+            OUTPUT.append(result)
+            if len(OUTPUT) >= k:
+                break
+        return OUTPUT
+
+    def within(self, coord, radius):
+        return list(self.__bestFirst(coord, radius))
+
+    def __bestFirst(self, coord, bound=math.inf):
+        self.__build()
+        if len(self.NODE_BOXES) == 0:
+            return
+        x = float(coord.getX()); y = float(coord.getY())
+
+        # Priority queue of (distance, kind, level, id) with kind:
+        # 0 for a node, 1 for a segment bbox, 2 for a segment
+        top = len(self.NODE_BOXES)-1
+        HEAP = [(d, 0, top, k) for (k, d) in enumerate(RTree.__boxDistances(self.NODE_BOXES[top], x, y).tolist())]
+        heapq.heapify(HEAP)
+        FOUND = set(); PROJ = dict()
+
+        while len(HEAP) > 0:
+            (d, kind, L, id) = heapq.heappop(HEAP)
+            if d > bound:
+                return
+
+            # Node: children nodes or segments bboxes
+            if kind == 0:
+                CHILDREN = self.__children(L, np.array([id]))
+                if L > 0:
+                    D = RTree.__boxDistances(self.NODE_BOXES[L-1][CHILDREN], x, y)
+                else:
+                    D = RTree.__boxDistances(self.__segmentBoxes(CHILDREN), x, y)
+                for (child, dc) in zip(CHILDREN.tolist(), D.tolist()):
+                    if dc <= bound:
+                        heapq.heappush(HEAP, (dc, 0 if L > 0 else 1, L-1, child))
+                continue
+
+            # Segment bbox: projection on segment
+            if kind == 1:
+                if self.SEG_DATA[id] in FOUND:
+                    continue
+                x1 = self.SEG_X1[id]; y1 = self.SEG_Y1[id]
+                ux = self.SEG_X2[id] - x1; uy = self.SEG_Y2[id] - y1
+                l2 = ux*ux + uy*uy
+                t = 0 if l2 == 0 else min(max(((x-x1)*ux + (y-y1)*uy)/l2, 0), 1)
+                PROJ[id] = (float(x1 + t*ux), float(y1 + t*uy))
+                heapq.heappush(HEAP, (math.hypot(x-PROJ[id][0], y-PROJ[id][1]), 2, -1, id))
+                continue
+
+            # Segment: closest one of its feature
+            data = int(self.SEG_DATA[id])
+            if data in FOUND:
+                continue
+            FOUND.add(data)
+            proj = coord.__class__(PROJ[id][0], PROJ[id][1], 0)
+            yield (data, int(self.SEG_INDEX[id]), d, proj)
+
+    def __boxDistances(BOXES, x, y):
+        DX = np.maximum(np.maximum(BOXES[:, 0] - x, x - BOXES[:, 2]), 0)
+        DY = np.maximum(np.maximum(BOXES[:, 1] - y, y - BOXES[:, 3]), 0)
+        return np.sqrt(DX**2 + DY**2)
+
+    # ------------------------------------------------------------
+    # Memory footprint of the index (in bytes)
+    # ------------------------------------------------------------
+    def nbytes(self):
+        self.__build()
+        SEGS = [self.SEG_X1, self.SEG_Y1, self.SEG_X2, self.SEG_Y2, self.SEG_DATA, self.SEG_INDEX]
+        return sum(A.nbytes for A in SEGS + self.NODE_BOXES + self.NODE_CHILDREN)
+
+    # ------------------------------------------------------------
+    # Plot leaves of the tree and collection structure together
+    #   - base: plot support network or track collection if True
+    # ------------------------------------------------------------
+    def plot(self, base=True):
+        self.__build()
+        fig = plt.figure()
+        ax = fig.add_subplot(111, xlim=(self.xmin, self.xmax), ylim=(self.ymin, self.ymax))
+        if base:
+            self.collection.plot(append=ax)
+        if len(self.NODE_BOXES) == 0:
+            return
+        for (x0, y0, x1, y1) in self.NODE_BOXES[0].tolist():
+            polygon = plt.Polygon([[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]])
+            ax.add_patch(polygon)
+            polygon.set_facecolor('none')
+            polygon.set_edgecolor('lightgray')
+
+    # ------------------------------------------------------------
+    # Saves index in directory filename (see SpatialIndex.save).
+    # On load, arrays are memory-mapped if mmap is True.
+    # ------------------------------------------------------------
+    def save(self, filename):
+        from tracklib.core.SpatialIndex import SpatialIndex
+        self.__build()
+        Utils.writeHeader(filename, SpatialIndex.FORMAT, SpatialIndex.FORMAT_VERSION, {
+            "backend": SpatialIndex.BACKEND_RTREE,
+            "bbox": [self.xmin, self.xmax, self.ymin, self.ymax],
+            "resolution": list(self.resolution), "dX": self.dX, "dY": self.dY,
+            "levels": len(self.NODE_BOXES)})
+        for name in RTree.ARRAYS:
+            np.save(os.path.join(filename, name.lower() + ".npy"), np.asarray(getattr(self, name)))
+        for L in range(len(self.NODE_BOXES)):
+            np.save(os.path.join(filename, "node_boxes_" + str(L) + ".npy"), np.asarray(self.NODE_BOXES[L]))
+            np.save(os.path.join(filename, "node_children_" + str(L) + ".npy"), np.asarray(self.NODE_CHILDREN[L]))
+
+    def load(filename, mmap=True):
+        from tracklib.core.SpatialIndex import SpatialIndex
+        if not os.path.isdir(filename):
+            return SpatialIndex.load(filename)
+        header = Utils.readHeader(filename, SpatialIndex.FORMAT, SpatialIndex.FORMAT_VERSION)
+        index = RTree.__new__(RTree)
+        (index.xmin, index.xmax, index.ymin, index.ymax) = header["bbox"]
+        index.resolution = tuple(header["resolution"])
+        index.dX = header["dX"]; index.dY = header["dY"]
+        index.collection = TrackCollection()
+        index.__pending = []
+        mode = "r" if mmap else None
+        for name in RTree.ARRAYS:
+            setattr(index, name, np.load(os.path.join(filename, name.lower() + ".npy"), mmap_mode=mode))
+        index.NODE_BOXES = []; index.NODE_CHILDREN = []
+        for L in range(header["levels"]):
+            index.NODE_BOXES.append(np.load(os.path.join(filename, "node_boxes_" + str(L) + ".npy"), mmap_mode=mode))
+            index.NODE_CHILDREN.append(np.load(os.path.join(filename, "node_children_" + str(L) + ".npy"), mmap_mode=mode))
+        return index
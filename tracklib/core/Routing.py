@@ -0,0 +1,829 @@
+# -------------------------- Routing ------------------------------------------
+# Compiled (array-based) form of a network for routing operations
+# -----------------------------------------------------------------------------
+import os
+import sys
+import progressbar
+import numpy as np
+from heapq import heappush, heappop, heapify
+from concurrent.futures import ProcessPoolExecutor
+
+
+class CompiledNetwork:
+
+    # ------------------------------------------------------------
+    # Frozen form of a Network, built with Network.compile().
+    # Nodes and edges are referred to by integer indices (in the
+    # order of insertion in the network) and adjacency is stored
+    # in CSR (compressed sparse row) arrays: arcs leaving node i
+    # are stored in positions FWD_PTR[i] to FWD_PTR[i+1]-1 of:
+    #  - FWD_NODE: index of the node reached by the arc
+    #  - FWD_EDGE: index of the edge supporting the arc
+    #  - FWD_WGT : weight of the arc (i.e. of the edge)
+    # BWD_* arrays store the arcs entering each node in the same
+    # way. A two-way edge gives an arc in each direction. Arcs
+    # of a node are in the same order as in NEXT_EDGES (resp.
+    # PREV_EDGES) lists of the network.
+    # ------------------------------------------------------------
+    ARRAYS = ["X", "Y", "Z", "WEIGHTS", "SOURCES", "TARGETS",
+              "FWD_PTR", "FWD_NODE", "FWD_EDGE", "FWD_WGT",
+              "BWD_PTR", "BWD_NODE", "BWD_EDGE", "BWD_WGT"]
+
+    def __init__(self, network):
+
+        self.PATH = None
+        self.NODE_IDS = list(network.getIndexNodes())
+        self.EDGE_IDS = list(network.getIndexEdges())
+        self.NODE_INDEX = {id: i for i, id in enumerate(self.NODE_IDS)}
+        self.EDGE_INDEX = {id: i for i, id in enumerate(self.EDGE_IDS)}
+
+        nodes = [network.getNode(id) for id in self.NODE_IDS]
+        edges = [network.getEdge(id) for id in self.EDGE_IDS]
+        self.X = np.array([node.coord.getX() for node in nodes], dtype=float)
+        self.Y = np.array([node.coord.getY() for node in nodes], dtype=float)
+        self.Z = np.array([node.coord.getZ() for node in nodes], dtype=float)
+
+        self.WEIGHTS = np.array([e.weight for e in edges], dtype=float)
+        self.SOURCES = np.array([self.NODE_INDEX[e.source.id] for e in edges], dtype=np.int32)
+        self.TARGETS = np.array([self.NODE_INDEX[e.target.id] for e in edges], dtype=np.int32)
+        orientation = np.array([e.orientation for e in edges], dtype=np.int8)
+
+        # Arcs 2e (direct) and 2e+1 (inverse) of edge e
+        TAIL = np.column_stack((self.SOURCES, self.TARGETS)).ravel()
+        HEAD = np.column_stack((self.TARGETS, self.SOURCES)).ravel()
+        EDGE = np.repeat(np.arange(len(edges), dtype=np.int32), 2)
+        VALID = np.column_stack((orientation >= 0, orientation <= 0)).ravel()
+        TAIL = TAIL[VALID]; HEAD = HEAD[VALID]; EDGE = EDGE[VALID]
+
+        self.FWD_PTR, self.FWD_NODE, self.FWD_EDGE = self.__csr(TAIL, HEAD, EDGE)
+        self.BWD_PTR, self.BWD_NODE, self.BWD_EDGE = self.__csr(HEAD, TAIL, EDGE)
+        self.FWD_WGT = self.WEIGHTS[self.FWD_EDGE]
+        self.BWD_WGT = self.WEIGHTS[self.BWD_EDGE]
+
+    def __csr(self, tail, head, edge):
+        order = np.argsort(tail, kind="stable")
+        ptr = np.zeros(len(self.NODE_IDS)+1, dtype=np.int64)
+        ptr[1:] = np.cumsum(np.bincount(tail, minlength=len(self.NODE_IDS)))
+        return ptr, head[order], edge[order]
+
+    def getNumberOfNodes(self):
+        return len(self.NODE_IDS)
+    def getNumberOfEdges(self):
+        return len(self.EDGE_IDS)
+    def getNumberOfArcs(self):
+        return len(self.FWD_NODE)
+
+    def getNodeIndex(self, id):
+        return self.NODE_INDEX[id]
+    def getEdgeIndex(self, id):
+        return self.EDGE_INDEX[id]
+    def getNodeId(self, n):
+        return self.NODE_IDS[n]
+    def getEdgeId(self, n):
+        return self.EDGE_IDS[n]
+
+    # ------------------------------------------------------------
+    # CSR arrays (ptr, nodes, edges, weights) as memoryviews, for
+    # fast scalar access (as python int and float) in routing loops
+    # ------------------------------------------------------------
+    def forward(self):
+        return (memoryview(self.FWD_PTR), memoryview(self.FWD_NODE),
+                memoryview(self.FWD_EDGE), memoryview(self.FWD_WGT))
+    def backward(self):
+        return (memoryview(self.BWD_PTR), memoryview(self.BWD_NODE),
+                memoryview(self.BWD_EDGE), memoryview(self.BWD_WGT))
+
+    # ------------------------------------------------------------
+    # Approximate size (in bytes) of compiled arrays
+    # ------------------------------------------------------------
+    def nbytes(self):
+        return sum([a.nbytes for a in self.__dict__.values() if isinstance(a, np.ndarray)])
+
+    # ------------------------------------------------------------
+    # Saves compiled arrays in npy files (filename.x.npy, ...) and
+    # node and edge ids in filename.node_ids.npy and filename.
+    # edge_ids.npy (ids must be all strings or all integers). On
+    # load, arrays are memory-mapped if mmap is True. A memory-
+    # mapped graph is pickled as a reference to its files, such 
+    # that worker processes share a single read-only copy.
+    # ------------------------------------------------------------
+    def save(self, filename):
+        np.save(filename + ".node_ids.npy", CompiledNetwork.__idsArray(self.NODE_IDS))
+        np.save(filename + ".edge_ids.npy", CompiledNetwork.__idsArray(self.EDGE_IDS))
+        for name in CompiledNetwork.ARRAYS:
+            np.save(filename + "." + name.lower() + ".npy", np.asarray(getattr(self, name)))
+
+    def __idsArray(IDS):
+        A = np.asarray(IDS)
+        if A.dtype.kind not in "iuU":
+            sys.exit("Error: node and edge ids must be all strings or all integers to be saved")
+        return A
+
+    @staticmethod
+    def load(filename, mmap=True):
+        graph = CompiledNetwork.__new__(CompiledNetwork)
+        graph.__setstate__({"PATH": filename, "MMAP": mmap})
+        return graph
+
+    def __getstate__(self):
+        if getattr(self, "PATH", None) is None:
+            return self.__dict__
+        return {"PATH": self.PATH, "MMAP": True}
+
+    def __setstate__(self, state):
+        if "MMAP" not in state:
+            self.__dict__.update(state)
+            return
+        filename = state["PATH"]
+        mode = "r" if state["MMAP"] else None
+        self.PATH = filename if state["MMAP"] else None
+        self.NODE_IDS = np.load(filename + ".node_ids.npy").tolist()
+        self.EDGE_IDS = np.load(filename + ".edge_ids.npy").tolist()
+        self.NODE_INDEX = {id: i for i, id in enumerate(self.NODE_IDS)}
+        self.EDGE_INDEX = {id: i for i, id in enumerate(self.EDGE_IDS)}
+        for name in CompiledNetwork.ARRAYS:
+            setattr(self, name, np.load(filename + "." + name.lower() + ".npy", mmap_mode=mode))
+
+
+class SearchTree:
+
+    # ------------------------------------------------------------
+    # State of a routing search from a source node. Only nodes 
+    # touched by the search are stored (in dictionaries indexed by
+    # integer node indices), hence a search costs nothing on the 
+    # parts of the network it does not explore, and several 
+    # searches may be run concurrently on the same network.
+    #  - DIST: distance from source (final for settled nodes)
+    #  - PRED: (predecessor node index, edge index) on the path
+    #  - SETTLED: set of nodes with final distance
+    # ------------------------------------------------------------
+    def __init__(self, graph, source):
+        self.graph = graph
+        self.source = source
+        self.DIST = {source: 0}
+        self.PRED = dict()
+        self.SETTLED = set()
+
+    def distance(self, node, default=-1):
+        return self.DIST.get(node, default)
+
+    def isSettled(self, node):
+        return node in self.SETTLED
+
+    # ------------------------------------------------------------
+    # Sequence of (node index, edge index) leading from source to
+    # node (source excluded). Returns None if node has not been 
+    # reached by the search, or if node is the source node.
+    # ------------------------------------------------------------
+    def path(self, node):
+        if node not in self.PRED:
+            return None
+        output = []
+        while node != self.source:
+            pred, edge = self.PRED[node]
+            output.append((node, edge))
+            node = pred
+        output.reverse()
+        return output
+
+
+# ------------------------------------------------------------
+# Dijkstra's algorithm on compiled network graph, from source
+# node index. Search is stopped when target node index is 
+# reached or when distance to source is greater than cut. For 
+# each node settled, an entry {key=(source id, node id), 
+# value=d} is added to output_dict (if specified).
+# ------------------------------------------------------------
+def dijkstra(graph, source, target=-1, cut=1e300, output_dict=None):
+
+    ptr, head, edge, wgt = graph.forward()
+    tree = SearchTree(graph, source)
+    DIST = tree.DIST
+    PRED = tree.PRED
+    SETTLED = tree.SETTLED
+    source_id = graph.NODE_IDS[source]
+
+    heap = [(0, source)]
+    while len(heap) != 0:
+
+        d, u = heappop(heap)
+        if (u in SETTLED) or (d != DIST[u]):
+            continue
+
+        # Stop conditions
+        if (d > cut) or (u == target):
+            break
+
+        if not output_dict is None:
+            output_dict[(source_id, graph.NODE_IDS[u])] = d
+
+        SETTLED.add(u)
+
+        # Loop on arcs leaving node
+        for k in range(ptr[u], ptr[u+1]):
+            v = head[k]
+            if v in SETTLED:
+                continue
+            dv = d + wgt[k]
+            if (v not in DIST) or (dv < DIST[v]):
+                DIST[v] = dv
+                PRED[v] = (u, edge[k])
+                heappush(heap, (dv, v))
+
+    return tree
+
+# ------------------------------------------------------------
+# A* algorithm between source and target node indices, with a
+# potential function giving a lower bound of the distance from
+# any node to target. Priority of nodes is their distance to 
+# source plus their potential, while distances stored in the
+# search tree are true distances from source. Search is stopped
+# when target is reached or when all candidates are beyond cut
+# distance. For each node settled, an entry {key=(source id, 
+# node id), value=d} is added to output_dict (if specified). 
+# Result is exact if potential is consistent (e.g. euclidian 
+# distance to target when weights are not lower than lengths
+# of edges, or landmark potential).
+# ------------------------------------------------------------
+def astar(graph, source, target, potential, cut=1e300, output_dict=None):
+
+    ptr, head, edge, wgt = graph.forward()
+    tree = SearchTree(graph, source)
+    DIST = tree.DIST
+    PRED = tree.PRED
+    SETTLED = tree.SETTLED
+    source_id = graph.NODE_IDS[source]
+    
+    heap = [(potential(source), 0, source)]
+    while len(heap) != 0:
+
+        f, d, u = heappop(heap)
+        if (u in SETTLED) or (d != DIST[u]):
+            continue
+
+        # Stop conditions
+        if (f > cut) or (u == target):
+            break
+
+        if not output_dict is None:
+            output_dict[(source_id, graph.NODE_IDS[u])] = d
+
+        SETTLED.add(u)
+
+        # Loop on arcs leaving node
+        for k in range(ptr[u], ptr[u+1]):
+            v = head[k]
+            if v in SETTLED:
+                continue
+            dv = d + wgt[k]
+            if (v not in DIST) or (dv < DIST[v]):
+                DIST[v] = dv
+                PRED[v] = (u, edge[k])
+                heappush(heap, (dv + potential(v), dv, v))
+
+    return tree
+
+# ------------------------------------------------------------
+# Bidirectional Dijkstra's algorithm between source and target 
+# node indices: searches are run alternately from source (on
+# forward arcs) and from target (on backward arcs), until the 
+# sum of their radii exceeds the length of the best path found 
+# so far. Returns a search tree of the forward search, in which
+# the shortest path to target has been reported. Target is not
+# reached in output tree if its distance is greater than cut.
+# For each node settled in forward direction, an entry {key=
+# (source id, node id), value=d} is added to output_dict.
+# ------------------------------------------------------------
+def bidirectional(graph, source, target, cut=1e300, output_dict=None):
+
+    FWD = graph.forward()
+    BWD = graph.backward()
+    tree = SearchTree(graph, source)
+    source_id = graph.NODE_IDS[source]
+    if source == target:
+        return tree
+
+    DIST = [tree.DIST, {target: 0}]
+    PRED = [tree.PRED, dict()]
+    SETTLED = [tree.SETTLED, set()]
+    HEAPS = [[(0, source)], [(0, target)]]
+    best = float("inf")
+    meet = -1
+
+    while (len(HEAPS[0]) != 0) and (len(HEAPS[1]) != 0):
+
+        radius = HEAPS[0][0][0] + HEAPS[1][0][0]
+        if (radius >= best) or (radius > cut):
+            break
+
+        side = 0 if HEAPS[0][0][0] <= HEAPS[1][0][0] else 1
+        d, u = heappop(HEAPS[side])
+        if (u in SETTLED[side]) or (d != DIST[side][u]):
+            continue
+        SETTLED[side].add(u)
+        if (side == 0) and not (output_dict is None):
+            output_dict[(source_id, graph.NODE_IDS[u])] = d
+
+        ptr, head, edge, wgt = FWD if side == 0 else BWD
+        DIST_SIDE = DIST[side]
+        DIST_OTHER = DIST[1-side]
+        for k in range(ptr[u], ptr[u+1]):
+            v = head[k]
+            if v in SETTLED[side]:
+                continue
+            dv = d + wgt[k]
+            if (v not in DIST_SIDE) or (dv < DIST_SIDE[v]):
+                DIST_SIDE[v] = dv
+                PRED[side][v] = (u, edge[k])
+                heappush(HEAPS[side], (dv, v))
+                if (v in DIST_OTHER) and (dv + DIST_OTHER[v] < best):
+                    best = dv + DIST_OTHER[v]
+                    meet = v
+
+    if (meet < 0) or (best > cut):
+        return tree
+
+    # Path from meeting node to target reported in forward tree
+    d = DIST[0][meet]
+    node = meet
+    while node != target:
+        next, e = PRED[1][node]
+        d += graph.WEIGHTS[e]
+        tree.DIST[next] = d
+        tree.PRED[next] = (node, e)
+        node = next
+    tree.DIST[target] = best
+
+    return tree
+
+
+class Landmarks:
+
+    # ------------------------------------------------------------
+    # Landmarks for ALT (A*, Landmarks, Triangle inequality) 
+    # routing. For a set of landmark nodes L, distances FROM[v,l] 
+    # from landmark l to each node v and TO[v,l] from each node v 
+    # to landmark l are precomputed. Triangle inequality gives a
+    # lower bound of the distance between nodes v and t:
+    #    d(v,t) >= max_l max(FROM[t,l]-FROM[v,l], TO[v,l]-TO[t,l])
+    # Landmarks are selected with the "farthest" heuristic: each 
+    # new landmark is the node whose distance to the closest of
+    # the already selected landmarks is maximal.
+    # ------------------------------------------------------------
+    def __init__(self, LANDMARKS, FROM, TO):
+        self.LANDMARKS = LANDMARKS
+        self.FROM = FROM
+        self.TO = TO
+
+    @staticmethod
+    def build(graph, number=16, verbose=False):
+        n = graph.getNumberOfNodes()
+        number = min(number, n)
+        FROM = np.full((n, number), np.inf)
+        TO = np.full((n, number), np.inf)
+        LANDMARKS = []
+        closest = np.full(n, np.inf)
+        to_run = range(number)
+        if verbose:
+            to_run = progressbar.progressbar(to_run)
+        for l in to_run:
+            if l == 0:
+                T, D = oneToMany(graph, 0)
+                landmark = int(T[np.argmax(D)])
+            else:
+                landmark = int(np.argmax(closest))
+            LANDMARKS.append(landmark)
+            T, D = oneToMany(graph, landmark)
+            FROM[T, l] = D
+            T, D = oneToMany(graph, landmark, reverse=True)
+            TO[T, l] = D
+            closest = np.minimum(closest, np.minimum(FROM[:,l], TO[:,l]))
+            closest[LANDMARKS] = -1
+        return Landmarks(np.array(LANDMARKS, dtype=np.int32), FROM, TO)
+
+    def getNumberOfNodes(self):
+        return self.FROM.shape[0]
+
+    # ------------------------------------------------------------
+    # Potential function (lower bound of distance) to target
+    # ------------------------------------------------------------
+    def potential(self, target):
+        FROM_T = np.asarray(self.FROM[target])
+        TO_T = np.asarray(self.TO[target])
+        FROM = self.FROM
+        TO = self.TO
+        def pi(v):
+            with np.errstate(invalid="ignore"):
+                bound = np.fmax.reduce(np.fmax(FROM_T - FROM[v], TO[v] - TO_T))
+            if bound > 0:
+                return float(bound)
+            return 0.0
+        return pi
+
+    def save(self, filename):
+        np.save(filename + ".landmarks.npy", np.asarray(self.LANDMARKS))
+        np.save(filename + ".from.npy", np.asarray(self.FROM))
+        np.save(filename + ".to.npy", np.asarray(self.TO))
+
+    @staticmethod
+    def load(filename, mmap=True):
+        mode = "r" if mmap else None
+        LANDMARKS = np.load(filename + ".landmarks.npy")
+        FROM = np.load(filename + ".from.npy", mmap_mode=mode)
+        TO = np.load(filename + ".to.npy", mmap_mode=mode)
+        return Landmarks(LANDMARKS, FROM, TO)
+
+
+class ContractionHierarchy:
+
+    # ------------------------------------------------------------
+    # Contraction hierarchy for fast node-to-node shortest 
+    # distance queries. Nodes are contracted one after another 
+    # (in order of increasing RANK), by adding shortcut arcs 
+    # between their neighbours whenever the path through the
+    # contracted node is the only shortest path (witness search).
+    # Distance between s and t is then obtained by a bidirectional
+    # search on upward arcs (towards nodes of higher rank) only,
+    # which settles a few hundred nodes at most, independently
+    # of network size. Upward arcs from each node are stored in 
+    # CSR arrays UP_* (forward search) and DOWN_* (upward arcs of 
+    # the backward search, i.e. arcs u -> v with rank(u) > rank(v)
+    # stored at node v).
+    # ------------------------------------------------------------
+    
+    # Max number of nodes settled in witness searches
+    WITNESS_LIMIT = 500
+
+    def __init__(self, RANK, UP_PTR, UP_NODE, UP_WGT, DOWN_PTR, DOWN_NODE, DOWN_WGT):
+        self.RANK = RANK
+        self.UP_PTR = UP_PTR
+        self.UP_NODE = UP_NODE
+        self.UP_WGT = UP_WGT
+        self.DOWN_PTR = DOWN_PTR
+        self.DOWN_NODE = DOWN_NODE
+        self.DOWN_WGT = DOWN_WGT
+        self.__views()
+
+    def __views(self):
+        self.__up = (memoryview(self.UP_PTR), memoryview(self.UP_NODE), memoryview(self.UP_WGT))
+        self.__down = (memoryview(self.DOWN_PTR), memoryview(self.DOWN_NODE), memoryview(self.DOWN_WGT))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_ContractionHierarchy__up"]
+        del state["_ContractionHierarchy__down"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__views()
+
+    def getNumberOfNodes(self):
+        return len(self.RANK)
+    def getNumberOfArcs(self):
+        return len(self.UP_NODE) + len(self.DOWN_NODE)
+
+    # ------------------------------------------------------------
+    # Builds hierarchy of a compiled network graph. Contraction 
+    # order is driven by edge difference (number of shortcuts
+    # minus number of removed arcs) plus number of contracted 
+    # neighbours, with lazy updates of priorities.
+    # ------------------------------------------------------------
+    @staticmethod
+    def build(graph, verbose=False):
+
+        n = graph.getNumberOfNodes()
+        OUT = [dict() for i in range(n)]
+        IN = [dict() for i in range(n)]
+        ptr, head, edge, wgt = graph.forward()
+        for u in range(n):
+            for k in range(ptr[u], ptr[u+1]):
+                v = head[k]
+                if (v != u) and (wgt[k] < OUT[u].get(v, float("inf"))):
+                    OUT[u][v] = wgt[k]
+                    IN[v][u] = wgt[k]
+        ARCS = [(u, v, w) for u in range(n) for v, w in OUT[u].items()]
+
+        DELETED = [0]*n
+        HEAP = [(ContractionHierarchy.__priority(OUT, IN, DELETED, v), v) for v in range(n)]
+        heapify(HEAP)
+        RANK = np.zeros(n, dtype=np.int32)
+        
+        progress = None
+        if verbose:
+            progress = progressbar.ProgressBar(max_value=n)
+        rank = 0
+        while len(HEAP) > 0:
+            p, v = heappop(HEAP)
+            shortcuts = ContractionHierarchy.__shortcuts(OUT, IN, v)
+            p = len(shortcuts) - len(OUT[v]) - len(IN[v]) + DELETED[v]
+            if (len(HEAP) > 0) and (p > HEAP[0][0]):
+                heappush(HEAP, (p, v))
+                continue
+            RANK[v] = rank
+            rank += 1
+            if not progress is None:
+                progress.update(rank)
+            for u in IN[v]:
+                del OUT[u][v]
+                DELETED[u] += 1
+            for x in OUT[v]:
+                del IN[x][v]
+                DELETED[x] += 1
+            for (u, x, w) in shortcuts:
+                if w < OUT[u].get(x, float("inf")):
+                    OUT[u][x] = w
+                    IN[x][u] = w
+                    ARCS.append((u, x, w))
+            OUT[v] = dict()
+            IN[v] = dict()
+
+        S = np.array([a[0] for a in ARCS], dtype=np.int32)
+        T = np.array([a[1] for a in ARCS], dtype=np.int32)
+        W = np.array([a[2] for a in ARCS], dtype=float)
+        UP = RANK[S] < RANK[T]
+        UP_PTR, UP_NODE, UP_WGT = ContractionHierarchy.__csr(n, S[UP], T[UP], W[UP])
+        DOWN_PTR, DOWN_NODE, DOWN_WGT = ContractionHierarchy.__csr(n, T[~UP], S[~UP], W[~UP])
+        return ContractionHierarchy(RANK, UP_PTR, UP_NODE, UP_WGT, DOWN_PTR, DOWN_NODE, DOWN_WGT)
+
+    @staticmethod
+    def __csr(n, tail, head, weight):
+        order = np.argsort(tail, kind="stable")
+        ptr = np.zeros(n+1, dtype=np.int64)
+        ptr[1:] = np.cumsum(np.bincount(tail, minlength=n))
+        return ptr, head[order].astype(np.int32), weight[order].astype(float)
+
+    @staticmethod
+    def __priority(OUT, IN, DELETED, v):
+        shortcuts = ContractionHierarchy.__shortcuts(OUT, IN, v)
+        return len(shortcuts) - len(OUT[v]) - len(IN[v]) + DELETED[v]
+
+    # ------------------------------------------------------------
+    # Shortcuts (u, x, w) needed to contract node v: for each pair
+    # of neighbours u -> v -> x, a shortcut is needed if no path 
+    # avoiding v (witness) is as short as u -> v -> x.
+    # ------------------------------------------------------------
+    @staticmethod
+    def __shortcuts(OUT, IN, v):
+        shortcuts = []
+        if (len(OUT[v]) == 0) or (len(IN[v]) == 0):
+            return shortcuts
+        max_out = max(OUT[v].values())
+        for u, wu in IN[v].items():
+            DIST = ContractionHierarchy.__witness(OUT, u, v, wu + max_out)
+            for x, wx in OUT[v].items():
+                if (x != u) and (DIST.get(x, float("inf")) > wu + wx):
+                    shortcuts.append((u, x, wu + wx))
+        return shortcuts
+
+    @staticmethod
+    def __witness(OUT, source, excluded, limit):
+        DIST = {source: 0}
+        SETTLED = set()
+        heap = [(0, source)]
+        while (len(heap) > 0) and (len(SETTLED) < ContractionHierarchy.WITNESS_LIMIT):
+            d, u = heappop(heap)
+            if (u in SETTLED) or (d != DIST[u]):
+                continue
+            if d > limit:
+                break
+            SETTLED.add(u)
+            for v, w in OUT[u].items():
+                if v == excluded:
+                    continue
+                if d + w < DIST.get(v, float("inf")):
+                    DIST[v] = d + w
+                    heappush(heap, (d + w, v))
+        return DIST
+
+    # ------------------------------------------------------------
+    # Shortest distance between source and target node indices
+    # (1e300 if target is not reachable from source)
+    # ------------------------------------------------------------
+    def distance(self, source, target):
+        if source == target:
+            return 0
+        inf = float("inf")
+        DIST = [{source: 0}, {target: 0}]
+        HEAPS = [[(0, source)], [(0, target)]]
+        GRAPHS = [self.__up, self.__down]
+        best = inf
+        while True:
+            top0 = HEAPS[0][0][0] if len(HEAPS[0]) > 0 else inf
+            top1 = HEAPS[1][0][0] if len(HEAPS[1]) > 0 else inf
+            if min(top0, top1) >= best:
+                break
+            side = 0 if top0 <= top1 else 1
+            d, u = heappop(HEAPS[side])
+            DIST_SIDE = DIST[side]
+            if d != DIST_SIDE[u]:
+                continue
+            if u in DIST[1-side]:
+                best = min(best, d + DIST[1-side][u])
+            ptr, head, wgt = GRAPHS[side]
+            heap = HEAPS[side]
+            for k in range(ptr[u], ptr[u+1]):
+                v = head[k]
+                dv = d + wgt[k]
+                if dv < DIST_SIDE.get(v, inf):
+                    DIST_SIDE[v] = dv
+                    heappush(heap, (dv, v))
+        if best == inf:
+            return 1e300
+        return best
+
+    def save(self, filename):
+        np.savez(filename + ".ch.npz", RANK=self.RANK, UP_PTR=self.UP_PTR, UP_NODE=self.UP_NODE, 
+                 UP_WGT=self.UP_WGT, DOWN_PTR=self.DOWN_PTR, DOWN_NODE=self.DOWN_NODE, DOWN_WGT=self.DOWN_WGT)
+
+    @staticmethod
+    def load(filename):
+        if filename[-7:] != ".ch.npz":
+            filename = filename + ".ch.npz"
+        A = np.load(filename)
+        return ContractionHierarchy(A["RANK"], A["UP_PTR"], A["UP_NODE"], A["UP_WGT"],
+                                    A["DOWN_PTR"], A["DOWN_NODE"], A["DOWN_WGT"])
+
+
+class DistanceTable:
+
+    # ------------------------------------------------------------
+    # Sparse table of shortest distances between pairs of nodes
+    # (referred to by their indices in compiled network), stored
+    # in CSR format: distances from source node i are stored in 
+    # positions PTR[i] to PTR[i+1]-1 of arrays TARGET (target
+    # node indices, sorted in increasing order) and DIST. Tables
+    # are saved in 3 npy files, that may be memory-mapped when 
+    # they are loaded.
+    # ------------------------------------------------------------
+    def __init__(self, PTR, TARGET, DIST):
+        self.PTR = PTR
+        self.TARGET = TARGET
+        self.DIST = DIST
+
+    # ------------------------------------------------------------
+    # Table from rows of (targets, distances) computed for nodes 
+    # in sources, in a graph with n nodes
+    # ------------------------------------------------------------
+    @staticmethod
+    def fromRows(n, sources, rows):
+        counts = np.zeros(n, dtype=np.int64)
+        for s, row in zip(sources, rows):
+            counts[s] = len(row[0])
+        order = np.argsort(np.asarray(sources, dtype=np.int64), kind="stable")
+        rows = [rows[k] for k in order]
+        PTR = np.zeros(n+1, dtype=np.int64)
+        PTR[1:] = np.cumsum(counts)
+        TARGET = np.concatenate([np.zeros(0, dtype=np.int32)] + [row[0] for row in rows]).astype(np.int32)
+        DIST = np.concatenate([np.zeros(0)] + [row[1] for row in rows]).astype(float)
+        return DistanceTable(PTR, TARGET, DIST)
+
+    # ------------------------------------------------------------
+    # Table from triplets (sources, targets, distances). In case
+    # of duplicate pairs, the first occurrence is retained.
+    # ------------------------------------------------------------
+    @staticmethod
+    def fromTriplets(n, S, T, D):
+        code = np.asarray(S, dtype=np.int64)*n + np.asarray(T, dtype=np.int64)
+        code, idx = np.unique(code, return_index=True)
+        PTR = np.zeros(n+1, dtype=np.int64)
+        PTR[1:] = np.cumsum(np.bincount(code // n, minlength=n))
+        return DistanceTable(PTR, (code % n).astype(np.int32), np.asarray(D, dtype=float)[idx])
+
+    def getNumberOfNodes(self):
+        return len(self.PTR)-1
+    def size(self):
+        return len(self.TARGET)
+
+    def __find(self, source, target):
+        i = self.PTR[source]
+        j = self.PTR[source+1]
+        k = i + np.searchsorted(self.TARGET[i:j], target)
+        if (k < j) and (self.TARGET[k] == target):
+            return k
+        return -1
+
+    def contains(self, source, target):
+        return self.__find(source, target) >= 0
+
+    def get(self, source, target, default=1e300):
+        k = self.__find(source, target)
+        if k < 0:
+            return default
+        return float(self.DIST[k])
+
+    # ------------------------------------------------------------
+    # Table of all triplets (sources, targets, distances)
+    # ------------------------------------------------------------
+    def triplets(self):
+        S = np.repeat(np.arange(self.getNumberOfNodes(), dtype=np.int32), np.diff(self.PTR))
+        return S, np.asarray(self.TARGET), np.asarray(self.DIST)
+
+    # ------------------------------------------------------------
+    # Union of two tables (values of table have priority)
+    # ------------------------------------------------------------
+    def update(self, table):
+        S1, T1, D1 = self.triplets()
+        S2, T2, D2 = table.triplets()
+        return DistanceTable.fromTriplets(self.getNumberOfNodes(), np.concatenate((S2, S1)), 
+                                          np.concatenate((T2, T1)), np.concatenate((D2, D1)))
+
+    def save(self, filename):
+        np.save(filename + ".ptr.npy", np.asarray(self.PTR))
+        np.save(filename + ".target.npy", np.asarray(self.TARGET))
+        np.save(filename + ".dist.npy", np.asarray(self.DIST))
+
+    @staticmethod
+    def exists(filename):
+        return os.path.exists(filename + ".ptr.npy")
+
+    @staticmethod
+    def load(filename, mmap=True):
+        mode = "r" if mmap else None
+        PTR = np.load(filename + ".ptr.npy", mmap_mode=mode)
+        TARGET = np.load(filename + ".target.npy", mmap_mode=mode)
+        DIST = np.load(filename + ".dist.npy", mmap_mode=mode)
+        return DistanceTable(PTR, TARGET, DIST)
+
+
+# ------------------------------------------------------------
+# Shortest distances from source node to target nodes (boolean
+# mask on node indices, None for all nodes) in compiled graph.
+# Search is stopped when all targets are settled or when
+# distance is greater than cut. Returns target indices (sorted)
+# and distances. If reverse is True, distances are computed
+# from targets to source (i.e. on reversed arcs).
+# ------------------------------------------------------------
+def oneToMany(graph, source, targets=None, cut=1e300, reverse=False):
+
+    ptr, head, edge, wgt = graph.backward() if reverse else graph.forward()
+    DIST = {source: 0}
+    SETTLED = set()
+    remaining = graph.getNumberOfNodes() if targets is None else int(np.sum(targets))
+    T = []; D = []
+
+    heap = [(0, source)]
+    while (len(heap) != 0) and (remaining > 0):
+        d, u = heappop(heap)
+        if (u in SETTLED) or (d != DIST[u]):
+            continue
+        if d > cut:
+            break
+        SETTLED.add(u)
+        if (targets is None) or targets[u]:
+            T.append(u); D.append(d)
+            remaining -= 1
+        for k in range(ptr[u], ptr[u+1]):
+            v = head[k]
+            dv = d + wgt[k]
+            if (v not in SETTLED) and ((v not in DIST) or (dv < DIST[v])):
+                DIST[v] = dv
+                heappush(heap, (dv, v))
+
+    T = np.array(T, dtype=np.int32)
+    D = np.array(D, dtype=float)
+    order = np.argsort(T, kind="stable")
+    return T[order], D[order]
+
+# ------------------------------------------------------------
+# Many-to-many shortest distances table between sources and
+# targets (lists of node indices, None for all nodes), with
+# distances greater than cut discarded. Sources are dispatched
+# over a process pool if workers > 1.
+# ------------------------------------------------------------
+def distanceTable(graph, sources=None, targets=None, cut=1e300, workers=1, verbose=False):
+
+    n = graph.getNumberOfNodes()
+    if sources is None:
+        sources = range(n)
+    sources = sorted(set([int(s) for s in sources]))
+    mask = None
+    if not targets is None:
+        mask = np.zeros(n, dtype=bool)
+        mask[np.asarray(targets, dtype=np.int64)] = True
+
+    if workers > 1:
+        chunksize = max(1, len(sources) // (4*workers))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initDistanceWorker, 
+                                 initargs=(graph, mask, cut)) as pool:
+            rows = pool.map(_distanceWorker, sources, chunksize=chunksize)
+            if verbose:
+                rows = progressbar.progressbar(rows, max_value=len(sources))
+            rows = list(rows)
+    else:
+        to_run = sources
+        if verbose:
+            to_run = progressbar.progressbar(to_run)
+        rows = [oneToMany(graph, s, mask, cut) for s in to_run]
+
+    return DistanceTable.fromRows(n, sources, rows)
+
+_WORKER_STATE = None
+
+def _initDistanceWorker(graph, targets, cut):
+    global _WORKER_STATE
+    _WORKER_STATE = (graph, targets, cut)
+
+def _distanceWorker(source):
+    (graph, targets, cut) = _WORKER_STATE
+    return oneToMany(graph, source, targets, cut)
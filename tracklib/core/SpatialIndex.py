@@ -1,19 +1,38 @@
 # -*- coding: utf-8 -*-
+import os
 import sys
 import math
+import heapq
 import pickle
 import progressbar
+import numpy as np
 import matplotlib.pyplot as plt
 
 from tracklib.core.Track import Track
 from tracklib.core.Network import Edge
 from tracklib.core.TrackCollection import TrackCollection
 from tracklib.core.Coords import GeoCoords, ENUCoords, ECEFCoords
+import tracklib.core.Utils as Utils
 
-import tracklib.algo.Geometrics as Geometrics
 
 
 class SpatialIndex:
+
+    # Index backends (see create)
+    BACKEND_GRID = 0
+    BACKEND_RTREE = 1
+
+    # Number of out-of-grid warnings printed before going silent
+    WARNING_LIMIT = 10
+
+    # Max number of candidate cells tested at once when rasterizing
+    CHUNK_CELLS = 1 << 22
+
+    # On-disk format (see save)
+    FORMAT = "tracklib.SpatialIndex"
+    FORMAT_VERSION = 1
+    ARRAYS = ["SEG_X1", "SEG_Y1", "SEG_X2", "SEG_Y2", "SEG_DATA", "SEG_INDEX",
+              "CELL_SEG_PTR", "CELL_SEGS", "CELL_PTR", "CELL_DATA"]
     
     def __init__(self, collection, resolution=None, margin=0.05, verbose=True):
         '''
@@ -63,23 +82,14 @@ class SpatialIndex:
 
         self.collection = collection
 
-		# Keeps track of registered features
-        self.inventaire = set()
-
         # Nombre de dalles par cote
         self.resolution = resolution
         self.csize = self.resolution[0]
         self.lsize = self.resolution[1]
         # print ('nb cellule', self.xsize * self.ysize)
         
-        # Tableau de collections de features appartenant a chaque dalle. 
-        # Un feature peut appartenir a plusieurs dalles.
-        self.grid = []
-        for i in range(self.csize):
-            self.grid.append([])
-            for j in range(self.lsize):
-                self.grid[i].append([])
-        
+        self.__initStorage()
+
         self.dX = ax / self.csize
         self.dY = ay / self.lsize
         
@@ -88,18 +98,59 @@ class SpatialIndex:
             self.collection = TrackCollection()
             return
 
+        X = []; Y = []; DATA = []
         boucle = range(collection.size())
         if verbose:
             print("Building ["+str(self.csize)+" x "+str(self.lsize)+"] spatial index...")
             boucle = progressbar.progressbar(boucle)
         for num in boucle:
             feature = collection[num]
-            # On récupere la trace
-            if isinstance(feature, Track):
-                self.addFeature(feature, num)
             # On récupère l'arc du reseau qui est une trace
-            elif isinstance(feature, Edge):
-                self.addFeature(feature.geom, num)
+            if isinstance(feature, Edge):
+                feature = feature.geom
+            if not isinstance(feature, Track) or feature.size() < 2:
+                continue
+            X.append(np.asarray(feature.getX(), dtype=float))
+            Y.append(np.asarray(feature.getY(), dtype=float))
+            DATA.append(np.full(feature.size(), num, dtype=np.int64))
+        if len(X) > 0:
+            self.addPolylines(np.concatenate(X), np.concatenate(Y), np.concatenate(DATA))
+
+    # ------------------------------------------------------------
+    # Empty segment table and cell arrays
+    # ------------------------------------------------------------
+    def __initStorage(self):
+        # Segments indexes : extremites (SEG_X1, SEG_Y1, SEG_X2, SEG_Y2), 
+        # feature SEG_DATA et rang SEG_INDEX du segment dans le feature
+        self.SEG_X1 = np.zeros(0); self.SEG_Y1 = np.zeros(0)
+        self.SEG_X2 = np.zeros(0); self.SEG_Y2 = np.zeros(0)
+        self.SEG_DATA = np.zeros(0, dtype=np.int64)
+        self.SEG_INDEX = np.zeros(0, dtype=np.int64)
+
+        # Segments et features appartenant a chaque dalle, stockes en 
+        # CSR : pour c = i*lsize + j, les segments de la cellule (i,j) 
+        # sont CELL_SEGS[CELL_SEG_PTR[c]:CELL_SEG_PTR[c+1]] et ses features 
+        # CELL_DATA[CELL_PTR[c]:CELL_PTR[c+1]]. Un feature peut appartenir 
+        # a plusieurs dalles.
+        self.CELL_SEG_PTR = np.zeros(self.csize*self.lsize+1, dtype=np.int64)
+        self.CELL_SEGS = np.zeros(0, dtype=np.int64)
+        self.CELL_PTR = np.zeros(self.csize*self.lsize+1, dtype=np.int64)
+        self.CELL_DATA = np.zeros(0, dtype=np.int64)
+        self.__pending = []
+        self.overflows = 0
+
+    # ------------------------------------------------------------
+    # Spatial index with selected backend:
+    #  - BACKEND_GRID  (0): uniform grid (SpatialIndex) [default]
+    #  - BACKEND_RTREE (1): STR bulk-loaded R-tree (RTree), better 
+    #    suited for features with heterogeneous densities
+    # Both have the same request/neighborhood/nearest interface.
+    # ------------------------------------------------------------
+    def create(collection, resolution=None, margin=0.05, verbose=True, backend=BACKEND_GRID):
+        if backend == SpatialIndex.BACKEND_RTREE:
+            from tracklib.core.RTree import RTree
+            return RTree(collection, resolution, margin, verbose)
+        return SpatialIndex(collection, resolution, margin, verbose)
 
     def __str__(self):
         c = [(self.xmin+self.xmax)/2.0, (self.ymin+self.ymax)/2.0]
@@ -120,52 +171,125 @@ class SpatialIndex:
     def addFeature(self, track, num):
         '''
         '''
-        coord1 = None
-        for i in range(track.size()):
-            obs = track.getObs(i)
-            coord2 = obs.position
-            if coord1 != None:
-                p1 = self.__getCell(coord1)
-                p2 = self.__getCell(coord2)
-                if p1 is None or p2 is None:
-                    continue
-                self.__addSegment(p1, p2, num)
-            coord1 = coord2
+        if track.size() < 2:
+            return
+        X = np.asarray(track.getX(), dtype=float)
+        Y = np.asarray(track.getY(), dtype=float)
+        self.addPolylines(X, Y, np.full(len(X), num, dtype=np.int64))
 
-    
-    
-    def __addSegment(self, coord1, coord2, data):
-        '''
-        data de type: int, liste, tuple, dictionnaire
-        ajoute les données data dans toutes les cellules de la grille 
-               traversée par le segment [coord1, coord2] avec
-               coord1 : indices de la grille
-        '''
-        CELLS = self.__cellsCrossSegment(coord1, coord2)
-        if CELLS is None:
-            return  # out of grid
-        #print (CELLS, coord1, coord2)
+    # ------------------------------------------------------------
+    # Bulk insertion of polylines given as coordinate arrays. 
+    # Consecutive vertices (X[k], Y[k]) -> (X[k+1], Y[k+1]) with 
+    # the same DATA value form a segment, so that several 
+    # features may be registered in a single call. Segments with 
+    # an end point out of grid are skipped.
+    # ------------------------------------------------------------
+    def addPolylines(self, X, Y, DATA):
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        DATA = np.asarray(DATA, dtype=np.int64)
+        if len(X) < 2:
+            return
+        inside = self.__getCells(X, Y)[2]
+        same = (DATA[1:] == DATA[:-1])
+        
+        # Rank of each segment in its feature
+        starts = np.flatnonzero(np.concatenate(([True], ~same)))
+        INDEX = np.arange(len(same)) - starts[np.cumsum(~same)]
+        
+        keep = same & inside[1:] & inside[:-1]
+        self.__insertSegments(X[:-1][keep], Y[:-1][keep], X[1:][keep], Y[1:][keep], DATA[:-1][keep], INDEX[keep])
 
+    # ------------------------------------------------------------
+    # Bulk insertion of segments [(X1, Y1), (X2, Y2)], registered 
+    # with data DATA (int) and segment rank INDEX in data feature 
+    # (0 by default). Segments with an end point out of grid are 
+    # skipped.
+    # ------------------------------------------------------------
+    def addSegments(self, X1, Y1, X2, Y2, DATA, INDEX=None):
+        X1 = np.asarray(X1, dtype=float); Y1 = np.asarray(Y1, dtype=float)
+        X2 = np.asarray(X2, dtype=float); Y2 = np.asarray(Y2, dtype=float)
+        DATA = np.asarray(DATA, dtype=np.int64)
+        if INDEX is None:
+            INDEX = np.zeros(len(DATA), dtype=np.int64)
+        INDEX = np.asarray(INDEX, dtype=np.int64)
+        keep = self.__getCells(X1, Y1)[2] & self.__getCells(X2, Y2)[2]
+        self.__insertSegments(X1[keep], Y1[keep], X2[keep], Y2[keep], DATA[keep], INDEX[keep])
         
-        for cell in CELLS:
-            i = cell[0]
-            j = cell[1]
-            if i > self.csize:
-                print ('error, depassement en x')
-                exit()
-            if j > self.lsize:
-                print ('error, depassement en y')
-                exit()
-                
-            if data not in self.grid[i][j]:
-                if (i,j,data) not in self.inventaire:
-                    self.grid[i][j].append(data)
-                    self.inventaire.add((i,j,data))
-                
-    
-    def __addPoint (self, coord, data):
-        pass
+    def __insertSegments(self, X1, Y1, X2, Y2, DATA, INDEX):
+        if len(X1) == 0:
+            return
+        U1, V1, _ = self.__getCells(X1, Y1)
+        U2, V2, _ = self.__getCells(X2, Y2)
+        S, I, J = self.__rasterize(U1, V1, U2, V2)
+        self.__pending.append((X1, Y1, X2, Y2, DATA, INDEX, I*self.lsize + J, S))
+
+    # ------------------------------------------------------------
+    # Merges pending insertions in CSR arrays. Within a cell, 
+    # segments and data are kept in insertion order, data without
+    # duplicates.
+    # ------------------------------------------------------------
+    def __compact(self):
+        if len(self.__pending) == 0:
+            return
+        counts = np.diff(self.CELL_SEG_PTR)
+        CELLS = [np.repeat(np.arange(len(counts), dtype=np.int64), counts)]
+        SEGS = [self.CELL_SEGS]
+        offset = len(self.SEG_DATA)
+        ARRAYS = [[self.SEG_X1], [self.SEG_Y1], [self.SEG_X2], [self.SEG_Y2], [self.SEG_DATA], [self.SEG_INDEX]]
+        for pending in self.__pending:
+            for k in range(len(ARRAYS)):
+                ARRAYS[k].append(pending[k])
+            CELLS.append(pending[6]); SEGS.append(pending[7] + offset)
+            offset += len(pending[0])
+        self.__pending = []
+        (self.SEG_X1, self.SEG_Y1, self.SEG_X2, self.SEG_Y2, self.SEG_DATA, self.SEG_INDEX) = [np.concatenate(A) for A in ARRAYS]
+        
+        CELLS = np.concatenate(CELLS)
+        SEGS = np.concatenate(SEGS)
+        order = np.lexsort((SEGS, CELLS))
+        CELLS = CELLS[order]
+        self.CELL_SEGS = SEGS[order]
+        ncells = self.csize*self.lsize
+        self.CELL_SEG_PTR = np.zeros(ncells+1, dtype=np.int64)
+        np.cumsum(np.bincount(CELLS, minlength=ncells), out=self.CELL_SEG_PTR[1:])
+
+        # First occurrence of each (cell, data) pair
+        DATA = self.SEG_DATA[self.CELL_SEGS]
+        order = np.lexsort((np.arange(len(CELLS)), DATA, CELLS))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (CELLS[order][1:] != CELLS[order][:-1]) | (DATA[order][1:] != DATA[order][:-1])
+        kept = np.sort(order[first])
+
+        self.CELL_DATA = DATA[kept]
+        self.CELL_PTR = np.zeros(ncells+1, dtype=np.int64)
+        np.cumsum(np.bincount(CELLS[kept], minlength=ncells), out=self.CELL_PTR[1:])
+
+    # ------------------------------------------------------------
+    # Rate-limited out-of-grid warnings
+    # ------------------------------------------------------------
+    def __warnOverflow(self, X, Y):
+        for k in range(len(X)):
+            self.overflows += 1
+            if self.overflows > SpatialIndex.WARNING_LIMIT:
+                continue
+            overflow = max(self.xmin-X[k], X[k]-self.xmax, self.ymin-Y[k], Y[k]-self.ymax)
+            overflow = '{:5.5f}'.format(overflow)
+            print('Warning: overflow ['+str(X[k])+", "+str(Y[k])+"]  OVERFLOW = "+str(overflow))
+            if self.overflows == SpatialIndex.WARNING_LIMIT:
+                print('Warning: further out-of-grid points will not be reported')
     
+    # ------------------------------------------------------------
+    # Normalized coordinates of coordinate arrays X, Y (see 
+    # __getCell). Returns U, V and mask of points inside grid.
+    # ------------------------------------------------------------
+    def __getCells(self, X, Y):
+        inside = (X >= self.xmin) & (X <= self.xmax) & (Y >= self.ymin) & (Y <= self.ymax)
+        if not inside.all():
+            self.__warnOverflow(X[~inside], Y[~inside])
+        U = (X - self.xmin) / self.dX
+        V = (Y - self.ymin) / self.dY
+        return U, V, inside
     
     # ------------------------------------------------------------
     # Normalized coordinates of coord: (x,) -> (i,j) with:
@@ -174,18 +298,13 @@ class SpatialIndex:
     # Returns None if out of grid
     # ------------------------------------------------------------
     def __getCell(self, coord):
-	
-        if (coord.getX() < self.xmin) or (coord.getX() > self.xmax):
-            overflow = '{:5.5f}'.format(max(self.xmin-coord.getX(), coord.getX()-self.xmax))
-            print('Warning: x overflow '+str(coord)+"  OVERFLOW = "+str(overflow))
-            return None
-        if (coord.getY() < self.ymin) or (coord.getY() > self.ymax):
-            overflow = '{:5.5f}'.format(max(self.ymin-coord.getY(), coord.getY()-self.ymax))
-            print('Warning: y overflow '+str(coord)+"  OVERFLOW = "+str(overflow))
+        x = float(coord.getX()); y = float(coord.getY())
+        if (x < self.xmin) or (x > self.xmax) or (y < self.ymin) or (y > self.ymax):
+            self.__warnOverflow([x], [y])
             return None
 
-        idx = (float(coord.getX()) - self.xmin) / self.dX
-        idy = (float(coord.getY()) - self.ymin) / self.dY
+        idx = (x - self.xmin) / self.dX
+        idy = (y - self.ymin) / self.dY
                 
         return (idx, idy)
     
@@ -210,11 +329,13 @@ class SpatialIndex:
         if base:
             self.collection.plot(append=ax)        
 
+        self.__compact()
+        counts = np.diff(self.CELL_PTR)
         for i in range(self.csize):
             xi1 = i*self.dX + self.xmin; xi2 = xi1 + self.dX
             for j in range(self.lsize):
                 yj1 = j*self.dY + self.ymin; yj2 = yj1 + self.dY
-                if len(self.grid[i][j]) > 0:
+                if counts[i*self.lsize+j] > 0:
                     polygon = plt.Polygon(
                         [[xi1, yj1], [xi2, yj1], [xi2, yj2], [xi1, yj2], [xi1, yj1]])
                     ax.add_patch(polygon)
@@ -252,7 +373,9 @@ class SpatialIndex:
         if isinstance(obj, int):
             ''' dans la cellule (i,j)  '''
             i = obj
-            return self.grid[i][j]
+            self.__compact()
+            c = i*self.lsize + j
+            return self.CELL_DATA[self.CELL_PTR[c]:self.CELL_PTR[c+1]].tolist()
            
         if isinstance(obj, GeoCoords) or isinstance(obj, ENUCoords):
             ''' dans la cellule contenant le point coord '''
@@ -441,6 +564,103 @@ class SpatialIndex:
                 pos1 = pos2
                 
             return TAB2
+    # ------------------------------------------------------------
+	# Exact nearest neighbours queries. Features are visited by 
+	# increasing distance to coord, with a best-first search over 
+	# grid cells, then segment bounding boxes, then segments. Each 
+	# result is a tuple (feature, segment index, distance, proj) 
+	# where proj is the projection of coord on feature and segment 
+	# index the rank, in feature, of the segment containing proj.
+	# ------------------------------------------------------------
+	# - nearest(coord, k) returns the k features closest to coord
+	# - within(coord, radius) returns all features located at a 
+	#   distance less or equal than radius from coord
+	# ------------------------------------------------------------
+	# Results are sorted by increasing distance. Distances are 
+	# computed in the plane of coordinates (x, y).
+	# ------------------------------------------------------------
+    def nearest(self, coord, k=1):
+        OUTPUT = []
+        if k <= 0:
+            return OUTPUT
+        for result in self.__bestFirst(coord):
+            OUTPUT.append(result)
+            if len(OUTPUT) >= k:
+                break
+        return OUTPUT
+
+    def within(self, coord, radius):
+        return list(self.__bestFirst(coord, radius))
+
+    def __bestFirst(self, coord, bound=math.inf):
+        self.__compact()
+        x = float(coord.getX()); y = float(coord.getY())
+        
+        # Priority queue of (distance, kind, id) with kind: 
+        # 0 for a cell, 1 for a segment bbox, 2 for a segment
+        i = min(max(math.floor((x-self.xmin)/self.dX), 0), self.csize-1)
+        j = min(max(math.floor((y-self.ymin)/self.dY), 0), self.lsize-1)
+        c = i*self.lsize + j
+        HEAP = [(self.__cellDistance(x, y, i, j), 0, c)]
+        VISITED = {c}; SEEN = set(); FOUND = set(); PROJ = dict()
+        
+        while len(HEAP) > 0:
+            (d, kind, id) = heapq.heappop(HEAP)
+            if d > bound:
+                return
+            
+            # Cell: 4-neighbors and bboxes of registered segments
+            if kind == 0:
+                (i, j) = divmod(id, self.lsize)
+                for (ii, jj) in [(i-1, j), (i+1, j), (i, j-1), (i, j+1)]:
+                    if (ii < 0) or (jj < 0) or (ii >= self.csize) or (jj >= self.lsize):
+                        continue
+                    c = ii*self.lsize + jj
+                    if c not in VISITED:
+                        VISITED.add(c)
+                        heapq.heappush(HEAP, (self.__cellDistance(x, y, ii, jj), 0, c))
+                SEGS = self.CELL_SEGS[self.CELL_SEG_PTR[id]:self.CELL_SEG_PTR[id+1]]
+                if len(SEGS) == 0:
+                    continue
+                X1 = self.SEG_X1[SEGS]; X2 = self.SEG_X2[SEGS]
+                Y1 = self.SEG_Y1[SEGS]; Y2 = self.SEG_Y2[SEGS]
+                DX = np.maximum(np.maximum(np.minimum(X1, X2) - x, x - np.maximum(X1, X2)), 0)
+                DY = np.maximum(np.maximum(np.minimum(Y1, Y2) - y, y - np.maximum(Y1, Y2)), 0)
+                for (seg, db) in zip(SEGS.tolist(), np.sqrt(DX**2 + DY**2).tolist()):
+                    if (seg not in SEEN) and (db <= bound):
+                        SEEN.add(seg)
+                        heapq.heappush(HEAP, (db, 1, seg))
+                continue
+            
+            # Segment bbox: projection on segment
+            if kind == 1:
+                if self.SEG_DATA[id] in FOUND:
+                    continue
+                x1 = self.SEG_X1[id]; y1 = self.SEG_Y1[id]
+                ux = self.SEG_X2[id] - x1; uy = self.SEG_Y2[id] - y1
+                l2 = ux*ux + uy*uy
+                t = 0 if l2 == 0 else min(max(((x-x1)*ux + (y-y1)*uy)/l2, 0), 1)
+                PROJ[id] = (float(x1 + t*ux), float(y1 + t*uy))
+                heapq.heappush(HEAP, (math.hypot(x-PROJ[id][0], y-PROJ[id][1]), 2, id))
+                continue
+            
+            # Segment: closest one of its feature
+            data = int(self.SEG_DATA[id])
+            if data in FOUND:
+                continue
+            FOUND.add(data)
+            proj = coord.__class__(PROJ[id][0], PROJ[id][1], 0)
+            yield (data, int(self.SEG_INDEX[id]), d, proj)
+            
+    # ------------------------------------------------------------
+	# Distance from (x, y) to cell (i, j)
+	# ------------------------------------------------------------
+    def __cellDistance(self, x, y, i, j):
+        x0 = self.xmin + i*self.dX; y0 = self.ymin + j*self.dY
+        dx = max(x0 - x, 0, x - x0 - self.dX)
+        dy = max(y0 - y, 0, y - y0 - self.dY)
+        return math.sqrt(dx*dx + dy*dy)
+
     # ------------------------------------------------------------
 	# Function to convert ground distance (metric system is 
 	# assumed to be orthonormal) into unit number
@@ -483,59 +703,113 @@ class SpatialIndex:
 	# List of cells crossing segment [coord1, coord2] (in px)
 	# ------------------------------------------------------------        
     def __cellsCrossSegment(self, coord1, coord2):
+        S, I, J = self.__rasterize([coord1[0]], [coord1[1]], [coord2[0]], [coord2[1]])
+        return list(zip(I.tolist(), J.tolist()))
 
-        CELLS = []
-        segment2 = [coord1[0], coord1[1], coord2[0], coord2[1]]
-        
-        xmin = min (math.floor(coord1[0]), math.floor(coord2[0]))
-        xmax = max (math.floor(coord1[0]), math.floor(coord2[0]))
+	# ------------------------------------------------------------
+	# Supercover rasterization of segments [(U1,V1), (U2,V2)] (in 
+	# px). Returns arrays (S, I, J) of segment numbers and cells 
+	# (I,J) of grid touched by segment S, ordered by segment, then 
+	# by I and J. A cell of the bounding box of a segment is 
+	# touched if the supporting line of the segment separates (or 
+	# touches) the corners of the cell.
+	# ------------------------------------------------------------
+    def __rasterize(self, U1, V1, U2, V2):
+        U1 = np.asarray(U1, dtype=float); V1 = np.asarray(V1, dtype=float)
+        U2 = np.asarray(U2, dtype=float); V2 = np.asarray(V2, dtype=float)
+        I0 = np.floor(np.minimum(U1, U2)).astype(np.int64)
+        J0 = np.floor(np.minimum(V1, V2)).astype(np.int64)
+        W = np.floor(np.maximum(U1, U2)).astype(np.int64) - I0 + 1
+        H = np.floor(np.maximum(V1, V2)).astype(np.int64) - J0 + 1
         
-        ymin = min (math.floor(coord1[1]), math.floor(coord2[1]))
-        ymax = max (math.floor(coord1[1]), math.floor(coord2[1]))
+        # Line equation a*u + b*v + c = 0
+        A = V2 - V1; B = U1 - U2; C = -(A*U1 + B*V1)
         
-        for i in range( xmin,  xmax+1):
-            for j in range(ymin, ymax+1):
-                
-                # complètement inclus
-                if i < coord1[0] and coord1[0] < i+1 and i < coord2[0] and coord2[0] < i+1 and j < coord1[1] and coord1[1] < j+1 and j < coord2[1] and coord2[1] < j+1:
-                    if (i,j) not in CELLS:
-                        CELLS.append((i,j))
-                    continue
-                
-                # traverse
-                segment1 = [i, j, i+1, j]
-                if Geometrics.isSegmentIntersects(segment1, segment2):
-                    if (i,j) not in CELLS:
-                        CELLS.append((i,j))
-                    continue
-                    
-                segment1 = [i, j, i, j+1]
-                if Geometrics.isSegmentIntersects(segment1, segment2):
-                    if (i,j) not in CELLS:
-                        CELLS.append((i,j))
-                    continue
-                    
-                segment1 = [i,j+1,i+1,j+1]
-                if Geometrics.isSegmentIntersects(segment1, segment2):
-                    if (i,j) not in CELLS:
-                        CELLS.append((i,j))
-                    continue
-                    
-                segment1 = [i+1,j,i+1,j+1]
-                if Geometrics.isSegmentIntersects(segment1, segment2):
-                    if (i,j) not in CELLS:
-                        CELLS.append((i,j))
-                    continue
-                
-        return CELLS
+        N = W*H
+        CUM = np.cumsum(N)
+        S = []; I = []; J = []
+        start = 0
+        while start < len(N):
+            offset = CUM[start-1] if start > 0 else 0
+            end = max(start+1, np.searchsorted(CUM, offset+SpatialIndex.CHUNK_CELLS, side="right"))
+            s = np.repeat(np.arange(start, end), N[start:end])
+            k = np.arange(len(s)) - np.repeat(np.cumsum(N[start:end]) - N[start:end], N[start:end])
+            i = I0[s] + k // H[s]
+            j = J0[s] + k % H[s]
+            f = A[s]*i + B[s]*j + C[s]
+            fmin = f + np.minimum(A[s], 0) + np.minimum(B[s], 0)
+            fmax = f + np.maximum(A[s], 0) + np.maximum(B[s], 0)
+            ok = (fmin <= 0) & (fmax >= 0)
+            ok &= (i >= 0) & (i < self.csize) & (j >= 0) & (j < self.lsize)
+            S.append(s[ok]); I.append(i[ok]); J.append(j[ok])
+            start = end
+        if len(S) == 0:
+            E = np.zeros(0, dtype=np.int64)
+            return E, E, E
+        return np.concatenate(S), np.concatenate(I), np.concatenate(J)
 
 
+    # ------------------------------------------------------------
+    # Saves index in directory filename (header.json plus one npy 
+    # file per array). Indexed collection is not saved: it must be
+    # attached again after loading (see Network.importSpatialIndex).
+    # On load, arrays are memory-mapped if mmap is True. Files 
+    # saved with pickle (former format) are still readable.
+    # ------------------------------------------------------------
     def save(self, filename):
-        outfile = open(filename,'wb')
-        pickle.dump(self, outfile)
-        outfile.close()
-    def load(filename):
+        self.__compact()
+        Utils.writeHeader(filename, SpatialIndex.FORMAT, SpatialIndex.FORMAT_VERSION, {
+            "backend": SpatialIndex.BACKEND_GRID, 
+            "bbox": [self.xmin, self.xmax, self.ymin, self.ymax],
+            "resolution": [self.csize, self.lsize], "dX": self.dX, "dY": self.dY, 
+            "overflows": self.overflows})
+        for name in SpatialIndex.ARRAYS:
+            np.save(os.path.join(filename, name.lower() + ".npy"), np.asarray(getattr(self, name)))
+
+    def load(filename, mmap=True):
+        if os.path.isdir(filename):
+            header = Utils.readHeader(filename, SpatialIndex.FORMAT, SpatialIndex.FORMAT_VERSION)
+            if header["backend"] == SpatialIndex.BACKEND_RTREE:
+                from tracklib.core.RTree import RTree
+                return RTree.load(filename, mmap)
+            index = SpatialIndex.__new__(SpatialIndex)
+            (index.xmin, index.xmax, index.ymin, index.ymax) = header["bbox"]
+            index.resolution = tuple(header["resolution"])
+            (index.csize, index.lsize) = index.resolution
+            index.dX = header["dX"]; index.dY = header["dY"]
+            index.collection = TrackCollection()
+            index.__initStorage()
+            index.overflows = header["overflows"]
+            mode = "r" if mmap else None
+            for name in SpatialIndex.ARRAYS:
+                setattr(index, name, np.load(os.path.join(filename, name.lower() + ".npy"), mmap_mode=mode))
+            return index
         infile = open(filename,'rb')
         index = pickle.load(infile)
         infile.close()
-        return index
\ No newline at end of file
+        if isinstance(index, SpatialIndex) and not hasattr(index, "CELL_SEG_PTR"):
+            index.__fromLegacyIndex()
+        return index
+
+    # ------------------------------------------------------------
+    # Conversion of indexes saved without segment table: segments 
+    # are registered again from indexed collection
+    # ------------------------------------------------------------
+    def __fromLegacyIndex(self):
+        FEATURES = set()
+        if hasattr(self, "grid"):
+            for i in range(self.csize):
+                for j in range(self.lsize):
+                    FEATURES.update(self.grid[i][j])
+            del self.grid
+            del self.inventaire
+        else:
+            FEATURES.update(self.CELL_DATA.tolist())
+            for (cells, data) in self.__pending:
+                FEATURES.update(data.tolist())
+        self.__initStorage()
+        for num in sorted(FEATURES):
+            feature = self.collection[num]
+            if isinstance(feature, Edge):
+                feature = feature.geom
+            self.addFeature(feature, num)
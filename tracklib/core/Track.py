@@ -11,24 +11,31 @@ import matplotlib.pyplot as plt
 
 from tracklib.core.Obs import Obs
 from tracklib.core.Coords import ENUCoords
+from tracklib.core.ObsTable import ObsTable, ObsView, SRID_NAMES, PLAIN_CLASSES, coordsClass
 from tracklib.core.GPSTime import GPSTime
 from tracklib.core.TrackCollection import TrackCollection
 
 import tracklib.core.Plot as Plot
+import tracklib.core.Coords as Coords
 import tracklib.core.Utils as Utils
 import tracklib.core.Operator as Operator
 
 
 class Track:
 
-    def __init__(self, list_of_obs=None, user_id=0, track_id=0, base=None):
+    def __init__(self, list_of_obs=None, user_id=0, track_id=0, base=None, columnar=False):
         '''
-        Takes a (possibly empty) list of points as input
+        Takes a (possibly empty) list of points (or an ObsTable) as input.
+        If columnar is True, observations are stored in numpy columns.
         '''
-        if not list_of_obs:
+        if isinstance(list_of_obs, ObsTable):
+            self.__POINTS = list_of_obs
+        elif not list_of_obs:
             self.__POINTS = []
         else:
             self.__POINTS = list_of_obs
+        if columnar and not self.isColumnar():
+            self.__POINTS = ObsTable.fromObsList(self.__POINTS)
             
         self.uid = user_id
         self.tid = track_id
@@ -36,6 +43,8 @@ class Track:
         
         self.__analyticalFeaturesDico = {}
         
+        self.__abscurv_cache = None   # Cumulative lengths (see cumulativeLength)
+        
         
     def copy(self):
         return copy.deepcopy(self)
@@ -47,6 +56,8 @@ class Track:
         return output
         
     def getSRID(self):
+        if self.isColumnar():
+            return self.__POINTS.srid
         return str(type(self.getFirstObs().position)).split(".")[-1][0:-8]
         
     def duration(self):
@@ -65,13 +76,57 @@ class Track:
     
 
     # =========================================================================
-    # Track coordinate transformation
+    # Columnar storage: observations are stored in an ObsTable (contiguous 
+    # numpy arrays for x, y, z, t and analytical features). Observations 
+    # returned by getObs, track[i]... are then lightweight views on table.
+    # =========================================================================
+    def isColumnar(self):
+        return isinstance(self.__POINTS, ObsTable)
+
+    def toColumnar(self):
+        if not self.isColumnar():
+            self.__POINTS = ObsTable.fromObsList(self.__POINTS)
+
+    def toObsList(self):
+        if self.isColumnar():
+            self.__POINTS = self.__POINTS.toObsList()
+
+    # Replaces all positions (possibly in a different coordinate system)
+    def __setPositions(self, positions):
+        if self.isColumnar():
+            if len(positions) == 0:
+                return
+            X = [p.getX() for p in positions]
+            Y = [p.getY() for p in positions]
+            Z = [p.getZ() for p in positions]
+            self.__POINTS.setPositions(X, Y, Z, SRID_NAMES[coordsClass(positions[0])])
+        else:
+            for i in range(self.size()):
+                self.__POINTS[i].position = positions[i]
+
+    # Coordinates of all observations as a N x 3 numpy array
+    def getCoordsArray(self):
+        if self.isColumnar():
+            return np.column_stack((self.__POINTS.x, self.__POINTS.y, self.__POINTS.z))
+        coords = [[o.position.getX(), o.position.getY(), o.position.getZ()] for o in self.__POINTS]
+        return np.array(coords, dtype=float).reshape(-1, 3)
+
+    # Replaces all coordinates with a N x 3 array expressed in srid
+    def setCoordsArray(self, coords, srid):
+        if self.isColumnar():
+            self.__POINTS.setPositions(coords[:,0], coords[:,1], coords[:,2], srid)
+            return
+        cls = PLAIN_CLASSES[srid]
+        self.__setPositions([cls(x, y, z) for (x, y, z) in coords.tolist()])
+
+    # =========================================================================
+    # Track coordinate transformation (vectorized on all observations, with 
+    # the exception of projections defined by an integer SRID)
     # =========================================================================
     
     def toECEFCoords(self, base=None):
         if (self.getSRID() == "Geo"):
-            for i in range(self.size()):
-                self.getObs(i).position = self.getObs(i).position.toECEFCoords()
+            self.setCoordsArray(Coords.geoToECEF(self.getCoordsArray()), "ECEF")
             return
         if (self.getSRID() == "ENU"):
             if (base == None):
@@ -80,8 +135,7 @@ class Track:
                     exit()
                 else:
                     base = self.base
-            for i in range(self.size()):
-                self.getObs(i).position = self.getObs(i).position.toECEFCoords(base)
+            self.setCoordsArray(Coords.enuToECEF(self.getCoordsArray(), base), "ECEF")
             return
 
     def toENUCoords(self, base=None):
@@ -91,12 +145,16 @@ class Track:
                 message = "Warning: no reference point (base) provided for local projection to ENU coordinates. "
                 message += "Arbitrarily used: " + str(base)
                 print(message)
-            for i in range(self.size()):
-                self.getObs(i).position = self.getObs(i).position.toENUCoords(base)
             if isinstance(base, int):
+                self.__setPositions([obs.position.toENUCoords(base) for obs in self.__POINTS])
                 self.base = base
-            else:
-                self.base = base.toGeoCoords() 
+                return
+            base = base.copy()
+            coords = self.getCoordsArray()
+            if (self.getSRID() == "Geo"):
+                coords = Coords.geoToECEF(coords)
+            self.setCoordsArray(Coords.ecefToENU(coords, base), "ENU")
+            self.base = base.toGeoCoords()
             return
         if (self.getSRID() == "ENU"):
             if (base == None):
@@ -105,15 +163,13 @@ class Track:
             if (self.base == None):
                 print("Error: former base coordinates should be specified for conversion ENU -> ENU")
                 exit()
-            for i in range(self.size()):
-                self.getObs(i).position = self.getObs(i).position.toENUCoords(self.base, base)                          
+            self.setCoordsArray(Coords.enuToENU(self.getCoordsArray(), self.base, base), "ENU")
             self.base = base.toGeoCoords()
             return
             
     def toGeoCoords(self, base=None):
         if (self.getSRID() == "ECEF"):
-            for i in range(self.size()):
-                self.getObs(i).position = self.getObs(i).position.toGeoCoords()            
+            self.setCoordsArray(Coords.ecefToGeo(self.getCoordsArray()), "Geo")
         if (self.getSRID() == "ENU"):
             if (base == None):
                 if (self.base == None):
@@ -121,15 +177,16 @@ class Track:
                     exit()
                 else:
                     base = self.base
-            for i in range(self.size()):
-                self.getObs(i).position = self.getObs(i).position.toGeoCoords(base)  
+            if isinstance(base, int):
+                self.__setPositions([obs.position.toGeoCoords(base) for obs in self.__POINTS])
+            else:
+                self.setCoordsArray(Coords.enuToGeo(self.getCoordsArray(), base), "Geo")
 
     def toProjCoords(self, srid):
         if not (self.getSRID().upper() == "GEO"):
             print("Error: track must be in GEO coordinate for projection to SRID = " + str(srid))
             exit()            
-        for i in range(self.size()):
-            self.getObs(i).position = self.getObs(i).position.toProjCoords(srid)
+        self.__setPositions([obs.position.toProjCoords(srid) for obs in self.__POINTS])
         self.base = srid            
           
     # Function to convert 2D coordinates (GEO or ENU) into image local coordinates
@@ -143,10 +200,10 @@ class Track:
         sx = (p2[0]-p1[0])/(P2.getX() - P1.getX())
         sy = (p2[1]-p1[1])/(P2.getY() - P1.getY())
     
-        for i in range(len(self)):
-            xi = (self[i].position.getX()-P1.getX())*sx + p1[0]
-            yi = (self[i].position.getY()-P1.getY())*sy + p1[1]
-            self[i].position = ENUCoords(xi, yi, self[i].position.getZ())    
+        coords = self.getCoordsArray()
+        coords[:,0] = (coords[:,0]-P1.getX())*sx + p1[0]
+        coords[:,1] = (coords[:,1]-P1.getY())*sy + p1[1]
+        self.setCoordsArray(coords, "ENU")
 			
     # Function to convert track to ENUCoords if it is in GeoCoords. Returns None
     # if no transformation operated, and returns used reference point otherwise
@@ -178,6 +235,8 @@ class Track:
         return self.__POINTS[i]
     
     def getX(self, i=None):
+        if self.isColumnar() and (i is None):
+            return self.__POINTS.x.tolist()
         if i is None:
             X = []
             for i in range(self.size()):
@@ -187,6 +246,8 @@ class Track:
         return X
         
     def getY(self, i=None):
+        if self.isColumnar() and (i is None):
+            return self.__POINTS.y.tolist()
         if i is None:
             Y = []
             for i in range(self.size()):
@@ -196,6 +257,8 @@ class Track:
         return Y
         
     def getZ(self, i=None):
+        if self.isColumnar() and (i is None):
+            return self.__POINTS.z.tolist()
         if i is None:
             Z = []
             for i in range(self.size()):
@@ -205,15 +268,19 @@ class Track:
         return Z
         
     def getT(self, i=None):
+        if self.isColumnar():
+            if i is None:
+                return self.__POINTS.t.tolist()
+            return float(self.__POINTS.t[i])
         if i is None:
-            T = []
-            for i in range(self.size()):
-                T.append(self.__POINTS[i].timestamp.toAbsTime())
+            T = GPSTime.toAbsTimes(self.getTimestamps()).tolist()
         else:
             T = self.__POINTS[i].timestamp.toAbsTime()
         return T
     
     def getTimestamps(self, i=None):
+        if (i is None) and self.isColumnar():
+            return GPSTime.readUnixTimes(self.__POINTS.t)
         if i is None:
             T = []
             for i in range(self.size()):
@@ -294,6 +361,8 @@ class Track:
         return output    
  
     def getAnalyticalFeature(self, af_name):
+        if self.isColumnar() and (af_name in ["x", "y", "z", "t"]):
+            return getattr(self.__POINTS, af_name).tolist()
         AF = []
         if af_name == "x":
             for i in range(self.size()):
@@ -308,9 +377,7 @@ class Track:
                 AF.append(self.__POINTS[i].position.getZ())
             return AF
         if af_name == "t":
-            for i in range(self.size()):
-                AF.append(self.__POINTS[i].timestamp.toAbsTime())
-            return AF
+            return self.getT()
         if af_name == "timestamp":
             for i in range(self.size()):
                 AF.append(self.__POINTS[i].timestamp)
@@ -322,10 +389,36 @@ class Track:
         if not self.hasAnalyticalFeature(af_name):
             sys.exit("Error: track does not contain analytical feature '" + af_name +"'")
         index = self.__analyticalFeaturesDico[af_name]
+        if self.isColumnar():
+            return self.__POINTS.column(index).tolist()
         for i in range(self.size()):
             AF.append(self.__POINTS[i].features[index])
         return AF    
   
+    # Values of an AF (possibly virtual) as a numpy array
+    def getAnalyticalFeatureArray(self, af_name):
+        if self.isColumnar() and (af_name in ["x", "y", "z", "t"]):
+            return getattr(self.__POINTS, af_name).copy()
+        if self.isColumnar() and (af_name in self.__analyticalFeaturesDico):
+            return self.__POINTS.column(self.__analyticalFeaturesDico[af_name]).copy()
+        return np.array(self.getAnalyticalFeature(af_name))
+  
+    # Sets all values of AF number idAF
+    def __setAnalyticalFeatureValues(self, idAF, values):
+        if self.isColumnar():
+            self.__POINTS.setColumn(idAF, values)
+            return
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        for i in range(self.size()):
+            self.__POINTS[i].features[idAF] = values[i]
+
+    # Sets all values of an AF (created if needed)
+    def setAnalyticalFeature(self, af_name, values):
+        if not self.hasAnalyticalFeature(af_name):
+            self.createAnalyticalFeature(af_name)
+        self.__setAnalyticalFeatureValues(self.__analyticalFeaturesDico[af_name], values)
+
     def getObsAnalyticalFeatures(self, af_names, i):
         af_names = Utils.listify(af_names)
         output = []
@@ -390,6 +483,9 @@ class Track:
     # =========================================================================
     
     def sort(self):
+        if self.isColumnar():
+            self.__POINTS = self.__POINTS.take(np.argsort(self.__POINTS.t, kind="stable"))
+            return
         sort_index = np.argsort(np.array(self.getTimestamps()))
         new_list = []
         for i in range(self.size()):
@@ -403,19 +499,19 @@ class Track:
         return True
         
     def addObs(self, obs):
-        self.__POINTS.append(obs)
+        self.__POINTS.append(self.__own(obs))
         
     def insertObs(self, obs, i=None):
         if i == None:
             self.insertObsInChronoOrder(obs)
         else:
-            self.__POINTS.insert(i, obs)                
+            self.__POINTS.insert(i, self.__own(obs))                
         
     def insertObsInChronoOrder(self, obs):
         self.insertObs(obs, self.__getInsertionIndex(obs.timestamp))
         
     def setObs(self, i, obs):
-        self.__POINTS[i] = obs
+        self.__POINTS[i] = self.__own(obs)
         
     def setObsList(self, list_of_obs):
         self.__POINTS = list_of_obs
@@ -425,6 +521,8 @@ class Track:
     
     def popObs(self, idx):
         obs = self.getObs(idx)
+        if isinstance(obs, ObsView):
+            obs = obs.copy()
         self.removeObs(idx)
         return obs
     
@@ -505,14 +603,27 @@ class Track:
         for i in range(len(YEARS)):
             for j in range(len(YEARS[i])):
                 id = YEARS[i][j]
-                new_list.append(self.__POINTS[id])
+                new_list.append(id)
            
-        self.__POINTS = new_list
+        self.__POINTS = self.__take(new_list)
 
 
     # =========================================================================
     # Basic private methods to handle track object
     # =========================================================================
+    
+    # Views on a table must not be stored as is in a list of Obs
+    def __own(self, obs):
+        if (not self.isColumnar()) and isinstance(obs, ObsView):
+            return obs.copy()
+        return obs
+        
+    # Observations (list or table) at a list of indices
+    def __take(self, index):
+        if self.isColumnar():
+            return self.__POINTS.take(index)
+        return [self.__POINTS[i] for i in index]
+        
     def __removeObsById(self, i):
         length = self.size()
         del self.__POINTS[i]
@@ -618,10 +729,52 @@ class Track:
         '''
         Total length of curvilinear abscissa
         '''
-        s = 0
-        for i in range(1,self.size()):
-            s += self.getObs(i-1).distanceTo(self.getObs(i))
-        return s
+        if self.size() < 2:
+            return 0
+        return float(self.cumulativeLength(3)[-1])
+        
+    def cumulativeLength(self, dim=2):
+        '''
+        Cumulative length (curvilinear abscissa) at each point of the track,
+        as a read-only numpy array. Planimetric (dim=2) or 3D (dim=3) 
+        distances. In columnar mode, result is cached and computed again 
+        only when coordinates have changed since last call. In list mode, 
+        Obs may be modified in place: result is computed at each call.
+        '''
+        if self.isColumnar():
+            key = (self.__POINTS.version(), self.size(), self.getSRID())
+            valid = (self.__abscurv_cache is not None)
+            valid = valid and (self.__abscurv_cache["table"] is self.__POINTS)
+            valid = valid and (self.__abscurv_cache["key"] == key)
+            if not valid:
+                self.__abscurv_cache = {"key": key, "table": self.__POINTS}
+            cache = self.__abscurv_cache
+        else:
+            cache = {}
+        if not dim in cache:
+            S = np.zeros(self.size())
+            if self.size() > 1:
+                S[1:] = np.cumsum(self.__segmentLengths(dim))
+            S.setflags(write=False)
+            cache[dim] = S
+        return cache[dim]
+        
+    # Lengths of the n-1 segments of the track
+    def __segmentLengths(self, dim=2):
+        if self.getSRID() == "ENU":
+            DX = np.diff(self.getAnalyticalFeatureArray("x"))
+            DY = np.diff(self.getAnalyticalFeatureArray("y"))
+            if dim == 2:
+                return np.sqrt(DX**2 + DY**2)
+            DZ = np.diff(self.getAnalyticalFeatureArray("z"))
+            return np.sqrt(DX**2 + DY**2 + DZ**2)
+        D = np.zeros(self.size()-1)
+        for i in range(1, self.size()):
+            if dim == 2:
+                D[i-1] = self.getObs(i-1).position.distance2DTo(self.getObs(i).position)
+            else:
+                D[i-1] = self.getObs(i-1).distanceTo(self.getObs(i))
+        return D
         
     # DEPRECATED
     def computeNetDeniv(self, id_ini=0, id_fin=None):
@@ -671,8 +824,11 @@ class Track:
         '''
         track = Track(base=self.base)
         track.setUid(self.uid)
-        for k in range(id_ini, id_fin+1):
-            track.addObs(self.__POINTS[k])
+        if self.isColumnar():
+            track.__POINTS = self.__POINTS[id_ini:id_fin+1]
+        else:
+            for k in range(id_ini, id_fin+1):
+                track.addObs(self.__POINTS[k])
         track.__transmitAF(self)
         return track
         
@@ -692,7 +848,7 @@ class Track:
             ttemp = tini
             tini = tfin
             tfin = ttemp
-        track = Track([], self.uid, base=self.base)
+        track = Track([], self.uid, base=self.base, columnar=self.isColumnar())
         for k in range(self.size()):
             if (self.__POINTS[k].timestamp < tini):
                 continue
@@ -720,6 +876,9 @@ class Track:
         '''
         Execute l'algo de l'AF.
         L'AF est déjà dans le dico, dans les features de Obs et initialisé.
+        If algorithm has a 'batch' attribute, it is called once as 
+        algorithm.batch(track) and must return the array of values for all
+        observations (or None to fall back on the per-point algorithm(track, i)).
         '''
         if (name == None):
             name = algorithm.__name__
@@ -730,6 +889,13 @@ class Track:
         
         idAF = self.__analyticalFeaturesDico[name]
         
+        batch = getattr(algorithm, "batch", None)
+        if batch is not None:
+            values = batch(self)
+            if values is not None:
+                self.__setAnalyticalFeatureValues(idAF, values)
+                return self.getAnalyticalFeature(name)
+        
         for i in range(self.size()):
             value = 0
             try:
@@ -753,7 +919,9 @@ class Track:
             return
         idAF = len(self.__analyticalFeaturesDico)
         self.__analyticalFeaturesDico[name] = idAF
-        if isinstance(val_init, list):
+        if self.isColumnar():
+            self.__POINTS.addColumn(val_init)
+        elif isinstance(val_init, (list, np.ndarray)):
             for i in range(self.size()):
                 self.getObs(i).features.append(val_init[i])
         else:
@@ -765,8 +933,11 @@ class Track:
         if not self.hasAnalyticalFeature(name):
             sys.exit("Error: track does not contain analytical feature '" + name +"'") 
         idAF = self.__analyticalFeaturesDico[name]
-        for i in range(self.size()):
-            del self.getObs(i).features[idAF]
+        if self.isColumnar():
+            self.__POINTS.removeColumn(idAF)
+        else:
+            for i in range(self.size()):
+                del self.getObs(i).features[idAF]
         del self.__analyticalFeaturesDico[name]
         keys = self.__analyticalFeaturesDico.keys()
         for k in keys:
@@ -805,7 +976,7 @@ class Track:
         for i in range(1, len(self)):
             TO_DEL[i] = self.__compare(i-1, i, code)
             #print(self.__compare(i-1, i, code))
-        self.__POINTS = [self.__POINTS[i] for i in range(len(self)) if not TO_DEL[i]]
+        self.__POINTS = self.__take([i for i in range(len(self)) if not TO_DEL[i]])
 			
     # -------------------------------------------------------------------------
     # General function to perform computations on analytical features.
@@ -982,8 +1153,11 @@ class Track:
             print("Error: track data must be in ENU coordinates for resampling")
             exit()
             
+        columnar = self.isColumnar()
         Interpolation.resample(self, delta, algo, mode)
         self.__analyticalFeaturesDico = {}
+        if columnar:
+            self.toColumnar()
     
     # =========================================================================
     #  Thin plates smoothing
@@ -1709,7 +1883,16 @@ class Track:
         t2 = track  # copy (long) ?
         AF1 = self.getListAnalyticalFeatures()
         AF2 = track.getListAnalyticalFeatures()
-        track = Track(t1.__POINTS + t2.__POINTS, t1.uid, t1.tid, base=t1.base)
+        if t1.isColumnar() or t2.isColumnar():
+            # Feature columns are matched by AF name (NaN if missing)
+            POINTS = ObsTable.fromObsList(t1.__POINTS) if not t1.isColumnar() else t1.__POINTS
+            NAMES = AF1 + [af for af in AF2 if not af in AF1]
+            COLUMNS = [(t1.__analyticalFeaturesDico.get(af), t2.__analyticalFeaturesDico.get(af)) for af in NAMES]
+            track = Track(POINTS.concatenate(t2.__POINTS, COLUMNS), t1.uid, t1.tid, base=t1.base)
+            track.__analyticalFeaturesDico = {NAMES[k] : k for k in range(len(NAMES))}
+            return track
+        else:
+            track = Track(t1.__POINTS + t2.__POINTS, t1.uid, t1.tid, base=t1.base)
         same = True
         if len(AF1) != len(AF2):
             same = False
@@ -1852,7 +2035,7 @@ class Track:
             track.__transmitAF(self)
             return track
         if isinstance(sample, list):
-            track = Track(base=self.base)
+            track = Track(base=self.base, columnar=self.isColumnar())
             for i in range(self.size()):
                 if (sample[i%len(sample)]):
                     track.addObs(self.getObs(i))
@@ -1889,7 +2072,7 @@ class Track:
 		
         return self.__POINTS[n]  
     def __setitem__(self, n, obs):
-        self.__POINTS[n] = obs    
+        self.__POINTS[n] = self.__own(obs)    
 		
 
 
@@ -3,10 +3,12 @@
 # -----------------------------------------------------------------------------
 import copy
 import random
+import numpy as np
 
 import matplotlib.pyplot as plt
 
 import tracklib.core.Utils as utils
+import tracklib.core.Coords as Coords
 import tracklib.algo.Summarize as Sum
 
 
@@ -52,17 +54,18 @@ class TrackCollection:
     # Spatial index creation, export and import functions
     # =========================================================================		
 		
-    def createSpatialIndex(self, resolution=(100, 100), verbose=True):
+    def createSpatialIndex(self, resolution=(100, 100), verbose=True, backend=0):
         from tracklib.core.SpatialIndex import SpatialIndex
-        self.spatial_index = SpatialIndex(self, resolution, verbose)
+        self.spatial_index = SpatialIndex.create(self, resolution, verbose=verbose, backend=backend)
 
     def exportSpatialIndex(self, filename):
         from tracklib.core.SpatialIndex import SpatialIndex
         self.spatial_index.save(filename)
 
-    def importSpatialIndex(self, filename):
+    def importSpatialIndex(self, filename, mmap=True):
         from tracklib.core.SpatialIndex import SpatialIndex
-        self.spatial_index = SpatialIndex.load(filename)
+        self.spatial_index = SpatialIndex.load(filename, mmap)
+        self.spatial_index.collection = self
     
     # =========================================================================
     # Track collection coordinate transformation
@@ -70,15 +73,13 @@ class TrackCollection:
     
     def toECEFCoords(self, base=None):
         if (self.__TRACES[0].getSRID() == "Geo"):
-            for track in self.__TRACES:
-                track.toECEFCoords()
+            self.__transform(Coords.geoToECEF, "ECEF")
             return
         if (self.__TRACES[0].getSRID() == "ENU"):
             if (base == None):
                 print("Error: base coordinates should be specified for conversion ENU -> ECEF")
                 exit()
-            for track in self.__TRACES:
-                track.toECEFCoords(base)
+            self.__transform(lambda coords: Coords.enuToECEF(coords, base), "ECEF")
             return
 
     def toENUCoords(self, base=None):
@@ -88,8 +89,17 @@ class TrackCollection:
                 message = "Warning: no reference point (base) provided for local projection to ENU coordinates. "
                 message += "Arbitrarily used: " + str(base)
                 print(message)
+            if isinstance(base, int):
+                for track in self.__TRACES:
+                    track.toENUCoords(base)
+                return
+            base = base.copy()
+            if (self.__TRACES[0].getSRID() == "Geo"):
+                self.__transform(lambda coords: Coords.geoToENU(coords, base), "ENU")
+            else:
+                self.__transform(lambda coords: Coords.ecefToENU(coords, base), "ENU")
             for track in self.__TRACES:
-                track.toENUCoords(base)
+                track.base = base.toGeoCoords()
             return
         if (self.__TRACES[0].getSRID() == "ENU"):
             if (base == None):
@@ -99,20 +109,30 @@ class TrackCollection:
                 if (track.base == None):
                     print("Error: former base coordinates should be specified for conversion ENU -> ENU")
                     exit()
-                track.toENUCoords(track.base, base)          				
-            track.base = base.toGeoCoords()
+                track.toENUCoords(base)          				
             return
 			
     def toGeoCoords(self, base=None):
         if (self.__TRACES[0].getSRID() == "ECEF"):
-            for track in self.__TRACES:
-                track.toGeoCoords()            
+            self.__transform(Coords.ecefToGeo, "Geo")
         if (self.__TRACES[0].getSRID() == "ENU"):
             if (base == None):
                 print("Error: base coordinates should be specified for conversion ENU -> Geo")
                 exit()
-            for track in self.__TRACES:
-                track.toGeoCoords(base) 
+            if isinstance(base, int):
+                for track in self.__TRACES:
+                    track.toGeoCoords(base) 
+            else:
+                self.__transform(lambda coords: Coords.enuToGeo(coords, base), "Geo")
+                
+    # Applies a vectorized transform (N x 3 array -> N x 3 array) 
+    # on coordinates of all tracks of the collection at once
+    def __transform(self, function, srid):
+        coords = [track.getCoordsArray() for track in self.__TRACES]
+        splits = np.cumsum([len(c) for c in coords])[0:-1]
+        coords = np.split(function(np.concatenate(coords)), splits)
+        for i in range(len(self.__TRACES)):
+            self.__TRACES[i].setCoordsArray(coords[i], srid)
 				
     # Function to convert track to ENUCoords if it is in GeoCoords. Returns None
     # if no transformation operated, and returns used reference point otherwise
@@ -5,7 +5,10 @@ Algorithme de calcul des Analytical Features.
 Plus quelques fonctions utilitaires
 """
 
+import os
+import sys
 import math
+import json
 import numpy as np
 
 from tracklib.core.Coords import GeoCoords
@@ -93,6 +96,35 @@ def makeCoords(x, y, z, srid):
     if (srid.upper() in ["ECEFCOORDS", "ECEF"]):
         return ECEFCoords(x, y, z)
 
+# --------------------------------------------------------------------------
+# Functions to write and read header of on-disk formats: a directory of 
+# npy arrays (that may be memory-mapped) plus a small header.json file
+# --------------------------------------------------------------------------
+# Input : 
+#   - path     ::     directory of the format
+#   - format   ::     name of the format
+#   - version  ::     version of the format (readers accept versions up to
+#                     their own one)
+#   - fields   ::     dictionnary of additional (json-serializable) fields
+# --------------------------------------------------------------------------
+# Output : dictionnary of header fields (readHeader)
+# --------------------------------------------------------------------------
+def writeHeader(path, format, version, fields):
+    os.makedirs(path, exist_ok=True)
+    header = {"format": format, "version": version}
+    header.update(fields)
+    with open(os.path.join(path, "header.json"), "w") as f:
+        json.dump(header, f, indent=1)
+
+def readHeader(path, format, version):
+    with open(os.path.join(path, "header.json")) as f:
+        header = json.load(f)
+    if header.get("format") != format:
+        sys.exit("Error: " + path + " is not a " + format + " directory")
+    if header.get("version", 0) > version:
+        sys.exit("Error: " + path + " has been written with a more recent version of " + format + " format")
+    return header
+
 # --------------------------------------------------------------------------
 # Function to compute area of triangle with cross product
 # --------------------------------------------------------------------------
@@ -153,35 +185,54 @@ def distance_to_segment(x0, y0, x1, y1, x2, y2):
 # --------------------------------------------------------------------------    
 def makeDistanceMatrix(T1, T2):
     
-    T1 = np.array(T1)
-    T2 = np.array(T2)
-    
-    # Signal stationnarity
-    base = min(np.concatenate((T1,T2)))
-    T1 = T1 - base
-    T2 = T2 - base
-    T1 = T1.T
-    T2 = T2.T
+    T1 = np.asarray(T1, dtype=float).reshape(-1, 1)
+    T2 = np.asarray(T2, dtype=float).reshape(1, -1)
 
-    return np.sqrt((T1**2).reshape(-1, 1) + (T2**2) - 2 * (T1.reshape(-1, 1)*T2.T))
+    return np.abs(T1 - T2)
     
 # --------------------------------------------------------------------------
 # Function to form covariance matrix from kernel
 # --------------------------------------------------------------------------
 # Input : 
-#   - kernel :: a function describing statistical similarity between points
-#   - T1     :: a list of points
-#   - T2     :: a list of points
-#   - factor :: unit factor of std dev (default 1.0)
+#   - kernel   :: a function describing statistical similarity between points
+#   - T1       :: a list of points
+#   - T2       :: a list of points
+#   - factor   :: unit factor of std dev (default 1.0)
+#   - toeplitz :: if True and if T1 and T2 are regularly sampled with the 
+#                 same step, kernel is evaluated only once on each lag 
+#                 (n1+n2-1 values instead of n1 x n2) 
 # --------------------------------------------------------------------------
 # Output : numpy covariance matrix between T1 and T2
 # --------------------------------------------------------------------------    
-def makeCovarianceMatrixFromKernel(kernel, T1, T2, factor=1.0):
+def makeCovarianceMatrixFromKernel(kernel, T1, T2, factor=1.0, toeplitz=True):
     
-    D = makeDistanceMatrix(T1,T2)
-    kfunc = np.vectorize(kernel.getFunction())
+    T1 = np.asarray(T1, dtype=float)
+    T2 = np.asarray(T2, dtype=float)
     
-    return factor**2*kfunc(D)
+    h = __regularStep(T1, T2) if toeplitz else None
+    if h is None:
+        return factor**2*kernel.evaluate(makeDistanceMatrix(T1, T2), False)
+        
+    # Toeplitz matrix: coefficient (i, j) only depends on i-j
+    n1 = len(T1); n2 = len(T2)
+    K = np.arange(-(n2-1), n1)
+    I = np.maximum(K, 0)
+    LAGS = np.abs(T1[I] - T2[I-K])
+    INDEX = np.arange(n1).reshape(-1, 1) - np.arange(n2).reshape(1, -1) + (n2-1)
+    return factor**2*kernel.evaluate(LAGS, False)[INDEX]
+
+# Common sampling step of T1 and T2 (None if not regular)
+def __regularStep(T1, T2):
+    if (len(T1) < 2) and (len(T2) < 2):
+        return None
+    h = T1[1]-T1[0] if len(T1) >= 2 else T2[1]-T2[0]
+    if h == 0:
+        return None
+    tolerance = 1e-9*abs(h)
+    for T in [T1, T2]:
+        if np.max(np.abs(T - T[0] - h*np.arange(len(T)))) > tolerance:
+            return None
+    return h
 
 # --------------------------------------------------------------------------
 # Function to convert RGBA color to hexadecimal
@@ -6,6 +6,8 @@ Read GPS track from CSV file(s).
 '''
 
 import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from tracklib.core.GPSTime import GPSTime
 from tracklib.core.Coords import ENUCoords
@@ -13,6 +15,7 @@ from tracklib.core.Coords import GeoCoords
 from tracklib.core.Coords import ECEFCoords
 from tracklib.core.Obs import Obs
 from tracklib.core.Track import Track
+from tracklib.core.ObsTable import ObsTable
 from tracklib.core.Coords import ECEFCoords
 from tracklib.core.TrackCollection import TrackCollection
 import tracklib.core.Utils as utils
@@ -28,17 +31,64 @@ class FileReader:
     NMEA_GPRMC = "GPRMC"
     NMEA_GNRMC = "GNRMC"
     
+    __SRID_NAMES = {"ENUCOORDS": "ENU", "ENU": "ENU", "GEOCOORDS": "Geo", "GEO": "Geo", 
+                    "ECEFCOORDS": "ECEF", "ECEF": "ECEF"}
+    
     @staticmethod
-    def readFromFile(path, id_E=-1, id_N=-1, id_U=-1, id_T=-1, separator=",", DateIni=-1, h=0, com="#", no_data_value=-999999, srid="ENUCoords", read_all=False, verbose=False):
+    def readFromFile(path, id_E=-1, id_N=-1, id_U=-1, id_T=-1, separator=",", DateIni=-1, h=0, com="#", no_data_value=-999999, srid="ENUCoords", read_all=False, verbose=False, columnar=False):
         '''
         The method assumes a single track in file. 
         If only path is provided as input parameters: file format is infered from extension according to file track_file_format
         If only path and a string s parameters are provied, the name of file format is set equal to s.
+        If columnar is True, track is returned with columnar storage (see Track.toColumnar).
+        '''
+        
+        fmt = FileReader.__readFormat(path, id_E, id_N, id_U, id_T, separator, DateIni, h, com, no_data_value, srid, read_all)
+        
+        track = Track(ObsTable())
+        for chunk in FileReader.__readChunks(path, fmt, None):
+            track = chunk
+        
+        if not columnar:
+            track.toObsList()
+        
+        if verbose:
+            print("File " + path + " loaded: \n" + (str)(track.size()) + " point(s) registered")
+        
+        return track
+        
+    @staticmethod
+    def readFromFileByChunks(path, id_E=-1, id_N=-1, id_U=-1, id_T=-1, separator=",", DateIni=-1, h=0, com="#", no_data_value=-999999, srid="ENUCoords", read_all=False, chunk_size=100000):
         '''
- 
-        # -------------------------------------------------------
-        # Infering file format from extension or name
-        # -------------------------------------------------------
+        Generator version of readFromFile: file is read in a single pass and 
+        successive (columnar) tracks of at most chunk_size observations are
+        yielded, so that very large files can be processed with bounded memory.
+        '''
+        
+        fmt = FileReader.__readFormat(path, id_E, id_N, id_U, id_T, separator, DateIni, h, com, no_data_value, srid, read_all)
+        
+        for chunk in FileReader.__readChunks(path, fmt, chunk_size):
+            yield chunk
+    
+    @staticmethod
+    def readFromFilesByTrack(pathdir, id_E=-1, id_N=-1, id_U=-1, id_T=-1, separator=",", DateIni=-1, h=0, com="#", no_data_value=-999999, srid="ENUCoords", read_all=False, selector=None, columnar=False):
+        '''
+        Generator version of readFromFiles: files of pathdir are read one by 
+        one (in alphabetic order) and tracks satisfying selector are yielded.
+        '''
+        for f in sorted(os.listdir(pathdir)):
+            p = pathdir + '/' + f
+            track = FileReader.readFromFile(p, id_E, id_N, id_U, id_T, separator, DateIni, h, com, no_data_value, srid, read_all, columnar=columnar)
+            if not selector is None:
+                if not selector.contains(track):
+                    continue
+            yield track
+    
+    # -------------------------------------------------------
+    # Infering file format from extension or name
+    # -------------------------------------------------------
+    @staticmethod
+    def __readFormat(path, id_E, id_N, id_U, id_T, separator, DateIni, h, com, no_data_value, srid, read_all):
         if id_N == -1:
             if id_E == -1:
                 fmt = FileFormat(path, 1)   # Read by extension
@@ -57,22 +107,26 @@ class FileReader:
             fmt.no_data_value = no_data_value
             fmt.srid          = srid
             fmt.read_all      = read_all
-
-
-        # -------------------------------------------------------
-        # Reading data according to file format
-        # -------------------------------------------------------
-        track = Track()
-        
-        time_fmt_save = GPSTime.getReadFormat()
-        GPSTime.setReadFormat(fmt.time_fmt)
-
-        id_special = [fmt.id_E, fmt.id_N]
-        if fmt.id_U >= 0:
-            id_special.append(fmt.id_U)
-        if fmt.id_T >= 0:
-            id_special.append(fmt.id_T)
             
+        if not fmt.srid.upper() in ["ENUCOORDS", "ENU", "GEOCOORDS", "GEO", "ECEFCOORDS", "ECEF"]:
+            print("Error: unknown coordinate type ["+str(fmt.srid)+"]")
+            exit()
+            
+        return fmt
+        
+    # -------------------------------------------------------
+    # Single pass reading of data according to file format. 
+    # Lines are split and buffered, then converted column by
+    # column into (columnar) tracks of at most chunk_size 
+    # observations (None for a single track). Reading stops
+    # at the first empty line.
+    # -------------------------------------------------------
+    @staticmethod
+    def __readChunks(path, fmt, chunk_size=None):
+    
+        name_non_special = []
+        rows = []
+        
         with open(path) as fp:
         
             # Header
@@ -85,120 +139,130 @@ class FileReader:
             line = fp.readline().strip()
             
             while line:
-
-                if line.strip()[0] == fmt.com:
+            
+                if line[0] == fmt.com:
                     name_non_special = line[1:].split(fmt.separator)
                     line = fp.readline().strip()
                     continue
-
-                fields = line.strip().split(fmt.separator)
-                fields = [s for s in fields if s]
-        
-                if fmt.id_T != -1:
-                    if isinstance(fmt.DateIni, int):
-                        time = GPSTime.readTimestamp(fields[fmt.id_T])
-                    else:
-                        time = fmt.DateIni.addSec((float)(fields[fmt.id_T]))
-                else:
-                    time = GPSTime()
                     
-                E = (float)(fields[fmt.id_E])
-                N = (float)(fields[fmt.id_N])
+                rows.append([s for s in line.split(fmt.separator) if s])
                 
-                if (int(E) != fmt.no_data_value) and (int(N) != fmt.no_data_value):
-                    
-                    if fmt.id_U >= 0:
-                        U = (float)(fields[fmt.id_U])
-                    else:
-                        U = utils.NAN
-                    
-                    if not fmt.srid.upper() in ["ENUCOORDS", "ENU", "GEOCOORDS", "GEO", "ECEFCOORDS", "ECEF"]:
-                        print("Error: unknown coordinate type ["+str(srid)+"]")
-                        exit()
-                    if (fmt.srid.upper() in ["ENUCOORDS", "ENU"]):
-                        point = Obs(ENUCoords(E,N,U), time)
-                    if (fmt.srid.upper() in ["GEOCOORDS", "GEO"]):
-                        point = Obs(GeoCoords(E,N,U), time)
-                    if (fmt.srid.upper() in ["ECEFCOORDS", "ECEF"]):
-                        point = Obs(ECEFCoords(E,N,U), time)                        
-                    
-                    track.addObs(point)                
+                if (chunk_size is not None) and (len(rows) >= chunk_size):
+                    yield FileReader.__makeTrack(rows, name_non_special, fmt)
+                    rows = []
                 
                 line = fp.readline().strip()
                 
-        fp.close()
-
-        # Reading other features
-        if (fmt.read_all):
+        if (len(rows) > 0) or (chunk_size is None):
+            yield FileReader.__makeTrack(rows, name_non_special, fmt)
+    
+    # -------------------------------------------------------
+    # Conversion of a buffer of split lines into a track
+    # -------------------------------------------------------
+    @staticmethod
+    def __makeTrack(rows, name_non_special, fmt):
         
-            name_non_special = [s.strip() for s in name_non_special if s]
+        E = np.array([fields[fmt.id_E] for fields in rows], dtype=str).astype(float)
+        N = np.array([fields[fmt.id_N] for fields in rows], dtype=str).astype(float)
         
-            for i in range(len(fields)):
-                if not (i in id_special):
-                    track.createAnalyticalFeature(name_non_special[i])
-                    
-            with open(path) as fp:
-            
-                # Header
-                for i in range(fmt.h):
-                    fp.readline()
+        # Invalid records
+        valid = (np.trunc(E) != fmt.no_data_value) & (np.trunc(N) != fmt.no_data_value)
+        if not np.all(valid):
+            rows = [rows[i] for i in np.nonzero(valid)[0]]
+            E = E[valid]
+            N = N[valid]
+        
+        if fmt.id_U >= 0:
+            U = np.array([fields[fmt.id_U] for fields in rows], dtype=str).astype(float)
+        else:
+            U = np.full(len(rows), utils.NAN)
             
-                line = fp.readline()
-                
-                counter = 0
-                
-                while line:
-                
-                    if line.strip()[0] == fmt.com:
-                        line = fp.readline().strip()
-                        continue
+        if fmt.id_T != -1:
+            times = [fields[fmt.id_T] for fields in rows]
+            if isinstance(fmt.DateIni, int):
+                time_fmt_save = GPSTime.getReadFormat()
+                GPSTime.setReadFormat(fmt.time_fmt)
+                T = GPSTime.readTimestamps(times)
+                GPSTime.setReadFormat(time_fmt_save)
+            else:
+                T = fmt.DateIni.toAbsTime() + np.array(times, dtype=str).astype(float)
+                T = GPSTime.toAbsTimeFields(*GPSTime.readUnixTimeFields(T))
+        else:
+            T = np.zeros(len(rows))
             
-                    fields = line.split(fmt.separator)
-                    fields = [s for s in fields if s]
-                    for i in range(len(fields)):
-                        if not (i in id_special):
-                            val = fields[i].strip()
-                            if not (name_non_special[i][-1] == "&"):
-                                try:
-                                    val = float(val)
-                                except ValueError:
-                                    val = str(val).replace('\"', '')
-                            track.setObsAnalyticalFeature(name_non_special[i], counter, val)
-                    
-                    line = fp.readline().strip()
-                    counter += 1
-                    
-            fp.close()
+        srid = FileReader.__SRID_NAMES[fmt.srid.upper()]
+        track = Track(ObsTable.fromArrays(E, N, U, T, srid))
         
-        GPSTime.setReadFormat(time_fmt_save)
-        
-        if verbose:
-            print("File " + path + " loaded: \n" + (str)(track.size()) + " point(s) registered")
+        # Reading other features
+        if fmt.read_all and (len(rows) > 0):
         
+            id_special = [fmt.id_E, fmt.id_N]
+            if fmt.id_U >= 0:
+                id_special.append(fmt.id_U)
+            if fmt.id_T >= 0:
+                id_special.append(fmt.id_T)
+                
+            name_non_special = [s.strip() for s in name_non_special if s]
+            
+            for i in range(len(rows[-1])):
+                if i in id_special:
+                    continue
+                values = [fields[i].strip() for fields in rows]
+                if not (name_non_special[i][-1] == "&"):
+                    values = FileReader.__toFloatColumn(values)
+                track.createAnalyticalFeature(name_non_special[i], values)
+                
         return track
-    
+        
+    # Converts a column of strings into floats (or strings 
+    # with quotes removed for values that are not numbers)
+    @staticmethod
+    def __toFloatColumn(values):
+        try:
+            return np.array(values, dtype=str).astype(float)
+        except ValueError:
+            output = []
+            for val in values:
+                try:
+                    output.append(float(val))
+                except ValueError:
+                    output.append(str(val).replace('\"', ''))
+            return output
     
     @staticmethod
-    def readFromFiles(pathdir, id_E=-1, id_N=-1, id_U=-1, id_T=-1, separator=",", DateIni=-1, h=0, com="#", no_data_value=-999999, srid="ENUCoords", read_all=False, verbose=False, selector=None):
+    def readFromFiles(pathdir, id_E=-1, id_N=-1, id_U=-1, id_T=-1, separator=",", DateIni=-1, h=0, com="#", no_data_value=-999999, srid="ENUCoords", read_all=False, verbose=False, selector=None, workers=1, columnar=False):
+        '''
+        Reads all files of pathdir in a track collection (in alphabetic order of 
+        file names). If workers > 1, files are parsed by a pool of processes, and 
+        selector (if any) is applied within the workers, so that rejected tracks 
+        are not sent back to the main process.
+        '''
         
+        LISTFILE = [pathdir + '/' + f for f in sorted(os.listdir(pathdir))]
+        params = (id_E, id_N, id_U, id_T, separator, DateIni, h, com, no_data_value, srid, read_all)
+        
+        # Columnar tracks are much cheaper to send back from workers
+        TASKS = [(p, params, selector, columnar or (workers > 1), GPSTime.getReadFormat()) for p in LISTFILE]
+        
+        if workers > 1:
+            chunksize = max(1, len(TASKS) // (4*workers))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                TRACKS = list(pool.map(_readFileWorker, TASKS, chunksize=chunksize))
+        else:
+            TRACKS = [_readFileWorker(task) for task in TASKS]
+                
         TRACES = TrackCollection()
-        LISTFILE = os.listdir(pathdir)
-        for f in LISTFILE:
-            p = pathdir + '/' + f
-            if (TRACES.size() > 10):
-                break
-            print(TRACES.size())
-            trace = FileReader.readFromFile(p, id_E, id_N, id_U, id_T, separator, DateIni, h, com, no_data_value, srid, read_all, verbose=False)
-            if not selector is None:
-                if not selector.contains(trace):
-                    continue
-            TRACES.addTrack(trace)
+        for i in range(len(LISTFILE)):
+            if TRACKS[i] is None:
+                continue
+            if not columnar:
+                TRACKS[i].toObsList()
+            TRACES.addTrack(TRACKS[i])
             if verbose:
-                print("File " + p + " loaded: \n" + (str)(trace.size()) + " point(s) registered")
+                print("File " + LISTFILE[i] + " loaded: \n" + (str)(TRACKS[i].size()) + " point(s) registered")
     
         return TRACES
         
-
     @staticmethod
     def readFromWKTFile(path, id_geom, id_user=-1, id_track=-1, separator=";", h=0, srid="ENUCoords", bboxFilter=None):
     
@@ -321,4 +385,19 @@ class FileReader:
                 track.setObsAnalyticalFeature("nb_sats", i, TMP_NB_SATS[i])
                 track.setObsAnalyticalFeature("hdop", i, TMP_HDOP[i])
                 
-        return track
\ No newline at end of file
+        return track
+
+
+# -------------------------------------------------------
+# Reading of a single file in readFromFiles (module level
+# function to be usable in a pool of processes). Returns
+# None if track does not satisfy selector
+# -------------------------------------------------------
+def _readFileWorker(task):
+    (path, params, selector, columnar, time_fmt) = task
+    GPSTime.setReadFormat(time_fmt)
+    track = FileReader.readFromFile(path, *params, columnar=columnar)
+    if not selector is None:
+        if not selector.contains(track):
+            return None
+    return track
@@ -38,7 +38,7 @@ class IgnReader:
     # tolerance
     # ===========================
     @staticmethod
-    def getNetwork(bbox, proj=None, margin=0.0, tolerance=0.1, spatialIndex=True):
+    def getNetwork(bbox, proj=None, margin=0.0, tolerance=0.1, spatialIndex=True, indexBackend=SpatialIndex.BACKEND_GRID):
         '''
 
         Parameters
@@ -48,6 +48,9 @@ class IgnReader:
             The bounding box must be expressed in WGS84
         proj : projection of results, optional.
             For example: 'EPSG:2154' or 'EPSG:4326'
+        spatialIndex : build a spatial index on network edges
+        indexBackend : SpatialIndex.BACKEND_GRID (default) or 
+            SpatialIndex.BACKEND_RTREE
             
         -------
             TODO : posSol
@@ -61,7 +64,7 @@ class IgnReader:
         
         network = Network()
         if spatialIndex:
-            network.spatial_index = SpatialIndex(bbox, resolution=(dx/1e3, dy/1e3), margin=0.4)
+            network.spatial_index = SpatialIndex.create(bbox, resolution=(dx/1e3, dy/1e3), margin=0.4, backend=indexBackend)
             network.spatial_index.collection = network
 
         cptNode = 0
@@ -1,13 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import os
 import csv
 import progressbar
+import numpy as np
 
 #from tracklib.core.Coords import ENUCoords, ECEFCoords, GeoCoords
 
 from tracklib.core.Track import Track
+from tracklib.core.ObsTable import ObsTable
 from tracklib.core.Network import Network, Node, Edge
+from tracklib.core.Routing import CompiledNetwork
 from tracklib.io.NetworkFormat import NetworkFormat
+from tracklib.io.NetworkWriter import NetworkWriter
+
+import tracklib.core.Utils as Utils
 
 import tracklib.util.Wkt as wkt
 import tracklib.algo.Cinematics as Cinematics
@@ -90,6 +97,61 @@ class NetworkReader:
         # Return network loaded
         return network
 
+    # ------------------------------------------------------------
+    # Reads a network written by NetworkWriter.writeToDirectory.
+    # Compiled form, edge geometries and precomputed structures 
+    # (spatial index, distances table, landmarks) are memory-
+    # mapped if mmap is True, hence opened immediately and shared
+    # between processes reading the same directory. Edge
+    # geometries are columnar tracks.
+    # ------------------------------------------------------------
+    @staticmethod
+    def readFromDirectory(path, mmap=True, verbose=True):
+
+        header = Utils.readHeader(path, NetworkWriter.FORMAT, NetworkWriter.FORMAT_VERSION)
+        mode = "r" if mmap else None
+        graph = CompiledNetwork.load(os.path.join(path, "graph"), mmap)
+        srid = header["srid"]
+
+        if verbose:
+            print("Loading network...")
+        network = Network()
+        for n in range(graph.getNumberOfNodes()):
+            coord = Utils.makeCoords(float(graph.X[n]), float(graph.Y[n]), float(graph.Z[n]), srid)
+            network.addNode(Node(graph.NODE_IDS[n], coord))
+
+        ORIENTATION = np.load(os.path.join(path, "edge_orientation.npy"))
+        PTR = np.load(os.path.join(path, "geom_ptr.npy"))
+        X = np.load(os.path.join(path, "geom_x.npy"), mmap_mode=mode)
+        Y = np.load(os.path.join(path, "geom_y.npy"), mmap_mode=mode)
+        Z = np.load(os.path.join(path, "geom_z.npy"), mmap_mode=mode)
+
+        boucle = range(graph.getNumberOfEdges())
+        if verbose:
+            boucle = progressbar.progressbar(boucle)
+        for e in boucle:
+            (i, j) = (PTR[e], PTR[e+1])
+            track = Track(ObsTable.fromArrays(X[i:j], Y[i:j], Z[i:j], srid=srid))
+            Cinematics.computeAbsCurv(track)
+            edge = Edge(graph.EDGE_IDS[e], track)
+            edge.orientation = int(ORIENTATION[e])
+            edge.weight = float(graph.WEIGHTS[e])
+            source = network.NODES[graph.NODE_IDS[graph.SOURCES[e]]]
+            target = network.NODES[graph.NODE_IDS[graph.TARGETS[e]]]
+            network.addEdge(edge, source, target)
+        network.compile(graph)
+
+        if "spatial_index" in header["components"]:
+            network.importSpatialIndex(os.path.join(path, "spatial_index"), mmap)
+        if "distances" in header["components"]:
+            network.load_prep(os.path.join(path, "distances"), mmap)
+        if "landmarks" in header["components"]:
+            network.importLandmarks(os.path.join(path, "landmarks"), mmap)
+        if "hierarchy" in header["components"]:
+            network.importContractionHierarchy(os.path.join(path, "hierarchy"))
+
+        return network
+
 
 
     
@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import os
+import numpy as np
+
+import tracklib.core.Utils as Utils
 
 
 class NetworkWriter:
 
+    # Directory format (see writeToDirectory)
+    FORMAT = "tracklib.Network"
+    FORMAT_VERSION = 1
+
     @staticmethod
     def writeToCsv(network, path="", separator=",", h=1):
         
@@ -31,3 +39,56 @@ class NetworkWriter:
             f.close()
             
         return output
+
+    # ------------------------------------------------------------
+    # Writes network in a directory of npy arrays, that may be
+    # read back (with memory-mapping) by NetworkReader.
+    # readFromDirectory:
+    #  - header.json: format, version, srid and sizes
+    #  - graph.*.npy: compiled form (see CompiledNetwork.save)
+    #  - edge_orientation.npy: orientation of edges
+    #  - geom_ptr.npy, geom_x.npy, geom_y.npy, geom_z.npy: edge
+    #    geometries (vertices of edge e are stored in positions
+    #    geom_ptr[e] to geom_ptr[e+1]-1 of geom_x, geom_y, geom_z)
+    # plus, when they have been built on network:
+    #  - spatial_index/: spatial index (see SpatialIndex.save)
+    #  - distances.*.npy: prepared shortest distances table
+    #  - landmarks.*.npy: landmarks for ALT routing
+    #  - hierarchy.ch.npz: contraction hierarchy
+    # Edges and nodes are in the order of the compiled network.
+    # ------------------------------------------------------------
+    @staticmethod
+    def writeToDirectory(network, path):
+
+        graph = network.getCompiledNetwork()
+        edges = [network.getEdge(id) for id in graph.EDGE_IDS]
+        
+        components = []
+        if not network.spatial_index is None:
+            network.spatial_index.save(os.path.join(path, "spatial_index"))
+            components.append("spatial_index")
+        if not network.DISTANCES is None:
+            network.DISTANCES.save(os.path.join(path, "distances"))
+            components.append("distances")
+        if not network.landmarks is None:
+            network.landmarks.save(os.path.join(path, "landmarks"))
+            components.append("landmarks")
+        if not network.hierarchy is None:
+            network.hierarchy.save(os.path.join(path, "hierarchy"))
+            components.append("hierarchy")
+
+        Utils.writeHeader(path, NetworkWriter.FORMAT, NetworkWriter.FORMAT_VERSION, {
+            "srid": network.getSRID() if len(edges) > 0 else "ENU",
+            "nodes": graph.getNumberOfNodes(), "edges": graph.getNumberOfEdges(),
+            "components": components})
+        graph.save(os.path.join(path, "graph"))
+
+        np.save(os.path.join(path, "edge_orientation.npy"), np.array([e.orientation for e in edges], dtype=np.int8))
+        PTR = np.zeros(len(edges)+1, dtype=np.int64)
+        PTR[1:] = np.cumsum([e.geom.size() for e in edges])
+        np.save(os.path.join(path, "geom_ptr.npy"), PTR)
+        for (name, coord) in [("x", lambda e: e.geom.getX()), ("y", lambda e: e.geom.getY()), ("z", lambda e: e.geom.getZ())]:
+            A = np.zeros(PTR[-1])
+            for k in range(len(edges)):
+                A[PTR[k]:PTR[k+1]] = coord(edges[k])
+            np.save(os.path.join(path, "geom_" + name + ".npy"), A)